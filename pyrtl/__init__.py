@@ -78,10 +78,18 @@ from .conditional import currently_under_condition
 from .simulation import Simulation
 from .simulation import FastSimulation
 from .simulation import SimulationTrace
+from .simulation import BoundedSimulationTrace
+from .vcd import VcdWriter, input_from_vcd
+from .tracefile import TraceFileWriter, TraceFileReader
+from .tracediff import trace_diff
 from .compilesim import CompiledSimulation
+from .bitparallelsim import BitParallelSimulation
+from .vectorsim import VectorSimulation
+from .parallelsim import parallel_step_multiple
 
 # input and output to file format routines
 from .inputoutput import input_from_blif
+from .inputoutput import input_from_memory_image
 from .inputoutput import output_to_trivialgraph
 from .inputoutput import output_to_graphviz
 from .inputoutput import output_to_firrtl
@@ -0,0 +1,392 @@
+"""Bit-parallel simulation of many independent test vectors on a synthesized block.
+
+After synthesis (see `pyrtl.synthesize`) nearly every net is a single bit gate, which means
+that a Python integer can hold the value of one wire for an arbitrary number of independent
+simulations at once: bit `j` of the integer is the value of the wire in "lane" `j`.  One
+bitwise operation then evaluates that gate for every lane, so a single pass over the netlist
+simulates all of the lanes for a cycle.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import numbers
+
+from .pyrtlexceptions import PyrtlError
+from .core import working_block, PostSynthBlock
+from .wire import Input, Output, Const, Register, WireVector
+from .memory import RomBlock
+from .simulation import _trace_sort_key
+
+
+__all__ = ['BitParallelSimulation']
+
+
+def _transpose(numbers, width):
+    """ Transpose a list of numbers, taken as the rows of a matrix of bits (the least
+    significant bit first), into the numbers of its columns.
+
+    The numbers are written out in binary and the strings transposed with zip, so the
+    bits are moved by a few bulk operations rather than a python loop over each bit.
+    """
+    if not numbers:
+        return [0] * width
+    mask = (1 << width) - 1
+    digits = '0%db' % width
+    # row i of rows is the last number first, so that column j comes out most
+    # significant bit (the last number) first, as int wants it
+    rows = [format(n & mask, digits) for n in reversed(numbers)]
+    columns = [int(''.join(column), 2) for column in zip(*rows)]
+    columns.reverse()  # the columns of the strings are the bits from the top down
+    return columns
+
+
+def _to_planes(values, bitwidth):
+    """ Transpose a list of per-lane values into a list of per-bit planes. """
+    return _transpose(values, bitwidth)
+
+
+def _from_planes(planes, lanes):
+    """ Transpose a list of per-bit planes back into a list of per-lane values. """
+    return _transpose(planes, lanes)
+
+
+class BitParallelSimulation(object):
+    """Simulate many independent stimulus vectors at once on a synthesized block.
+
+    Each step takes, for every input, a list with one value per lane, and evaluates the
+    block for all of the lanes at the same time.  The block must be a PostSynthBlock (as
+    returned by `pyrtl.synthesize`), where all logic is made of single bit gates.  Inputs,
+    outputs, and memories keep the names (and memory objects, through mem_map) of the
+    original design, so the same testbench can be used before and after synthesis.
+
+    Example ::
+
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=4)
+        sim.step({'a': [1, 2, 3, 4], 'b': [5, 6, 7, 8]})
+        sim.inspect('sum')  # one value per lane, e.g. [6, 8, 10, 12]
+
+    Memory reads and writes have to be done lane by lane, so designs heavy in memory
+    accesses will see less of a speedup.  Unlike the other simulators there is no
+    SimulationTrace (as each wire has a value per lane).  The rtl_asserts of the design
+    (which synthesis keeps) are checked in every lane after each step: if one fails in
+    any lane, failed_lanes is set to the list of those lanes and its exception raised.
+    """
+
+    def __init__(
+            self, lanes=64, register_value_map=None, memory_value_map=None,
+            default_value=0, block=None, code_file=None):
+        """ Creates a new bit-parallel simulator.
+
+        :param lanes: the number of independent simulations to run side by side
+        :param register_value_map: the initial value of registers, {Register: value}, where
+          value is either a single value for all lanes or a list of one value per lane; the
+          Registers may be from before synthesis
+        :param memory_value_map: initial values of memories (the same for every lane) in the
+          format {MemBlock: {address: value}}; the MemBlocks may be from before synthesis
+        :param default_value: the value that all unspecified registers and memories will
+          initialize to
+        :param block: the PostSynthBlock to simulate, defaults to the working block
+        :param code_file: the file in which to store a copy of the generated python code
+        """
+        block = working_block(block)
+        block.sanity_check()
+        if not isinstance(block, PostSynthBlock):
+            raise PyrtlError('BitParallelSimulation needs a synthesized block '
+                             '(see pyrtl.synthesize)')
+        if lanes < 1:
+            raise PyrtlError('BitParallelSimulation needs at least one lane')
+
+        self.block = block
+        self.lanes = lanes
+        self.default_value = default_value
+        self.code_file = code_file
+        self._full = (1 << lanes) - 1
+        self._initialize(register_value_map, memory_value_map)
+
+    def _initialize(self, register_value_map, memory_value_map):
+        if register_value_map is None:
+            register_value_map = {}
+        if memory_value_map is None:
+            memory_value_map = {}
+
+        self._regs = sorted(self.block.wirevector_subset(Register), key=lambda r: r.name)
+        for r in self._regs:
+            if r.bitwidth != 1:
+                raise PyrtlError('register "%s" is not a single bit, was the block '
+                                 'synthesized?' % r.name)
+        reg_init = {}
+        for reg, value in register_value_map.items():
+            if reg.bitwidth == 1 and self.block.wirevector_by_name.get(reg.name) is not None:
+                reg_init[reg.name] = value
+                continue
+            # a multi-bit register from before synthesis, split into its single bit registers
+            if isinstance(value, numbers.Integral):
+                value = [value] * self.lanes
+            for i in range(reg.bitwidth):
+                reg_init['%s_synth_%d' % (reg.name, i)] = [(v >> i) & 1 for v in value]
+        self.regvalue = [
+            self._broadcast(reg_init.get(r.name, self.default_value), r)
+            for r in self._regs]
+
+        self._mems = sorted({net.op_param[1] for net in self.block.logic_subset('m@')},
+                            key=lambda m: m.id)
+        # synthesis keeps the id of each memory, so memories from before synthesis are
+        # looked up by their id
+        self._mem_index = {mem.id: i for i, mem in enumerate(self._mems)}
+        self.memvalue = [None if isinstance(m, RomBlock) else [{} for n in range(self.lanes)]
+                         for m in self._mems]
+        self._rom_tables = [m._get_table() if isinstance(m, RomBlock) else None
+                            for m in self._mems]
+        for mem, mem_map in memory_value_map.items():
+            if isinstance(mem, RomBlock):
+                raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
+            if mem.id not in self._mem_index:
+                raise PyrtlError('unrecognized MemBlock in memory_value_map')
+            for lane_map in self.memvalue[self._mem_index[mem.id]]:
+                lane_map.update(mem_map)
+
+        self._inputs = sorted(self.block.wirevector_subset(Input), key=lambda w: w.name)
+        self._outputs = sorted(self.block.wirevector_subset(Output), key=lambda w: w.name)
+        self._asserts = sorted(self.block.rtl_assert_dict, key=lambda w: w.name)
+        self.outs = None
+        self.failed_lanes = []
+
+        s = self._compiled()
+        if self.code_file is not None:
+            with open(self.code_file, 'w') as file:
+                file.write(s)
+        context = {'_mem_read': self._mem_read}
+        exec(compile(s, '<string>', 'exec'), context)
+        self.sim_func = context['sim_func']
+
+    def _broadcast(self, value, wire):
+        """ Turn a per-lane list (or a single value for all lanes) into a 1-bit plane. """
+        if isinstance(value, numbers.Integral):
+            value = [value] * self.lanes
+        if len(value) != self.lanes:
+            raise PyrtlError('need a value for each of the %d lanes for "%s"'
+                             % (self.lanes, wire.name))
+        if any(v < 0 or v > wire.bitmask for v in value):
+            raise PyrtlError('a value for "%s" cannot be represented in %d bits'
+                             % (wire.name, wire.bitwidth))
+        return _to_planes(value, 1)[0]
+
+    def _mem_read(self, mem_index, addr_planes, bitwidth):
+        """ Read a memory lane by lane, returning the per-bit planes of the data. """
+        mem = self._mems[mem_index]
+        addrs = _from_planes(addr_planes, self.lanes)
+        table = self._rom_tables[mem_index]
+        if table is not None:
+            data = [table[a] for a in addrs]
+        elif isinstance(mem, RomBlock):
+            data = [mem._get_read_data(a) for a in addrs]
+        else:
+            data = [m.get(a, self.default_value) for m, a in zip(self.memvalue[mem_index], addrs)]
+        return _to_planes(data, bitwidth)
+
+    def _compiled(self):
+        """ Return the python source of sim_func(ins, regs) -> (next regs, outs, mem writes).
+
+        Single bit wires are held as integers (one bit per lane) while multi-bit wires,
+        which only appear at the interfaces to inputs, outputs, and memories, are held as
+        lists of such integers (one per bit, LSB first).
+        """
+        varname = {}
+        for w in sorted(self.block.wirevector_set, key=lambda w: w.name):
+            varname[w] = 'v%d' % len(varname)
+
+        def planes(w):
+            """ An expression for w as a list of planes """
+            return varname[w] if w.bitwidth > 1 else '[%s]' % varname[w]
+
+        def bits(w, sel):
+            """ An expression for the given bits of w, a plane if only one is selected """
+            parts = [varname[w] if w.bitwidth == 1 else '%s[%d]' % (varname[w], b) for b in sel]
+            return parts[0] if len(parts) == 1 else '[' + ', '.join(parts) + ']'
+
+        prog = ['def sim_func(ins, regs, full):',
+                '    outs = {}',
+                '    mem_ws = []']
+        for i, w in enumerate(self._inputs):
+            prog.append('    %s = ins[%d]%s' % (varname[w], i, '[0]' if w.bitwidth == 1 else ''))
+        for i, r in enumerate(self._regs):
+            prog.append('    %s = regs[%d]' % (varname[r], i))
+        for w in self.block.wirevector_subset(Const):
+            val = ['full' if (w.val >> b) & 1 else '0' for b in range(w.bitwidth)]
+            prog.append('    %s = %s' % (varname[w], val[0] if len(val) == 1 else
+                                         '[' + ', '.join(val) + ']'))
+
+        next_regs = {}
+        gates = {
+            '&': '{0} & {1}',
+            '|': '{0} | {1}',
+            '^': '{0} ^ {1}',
+            'n': '({0} & {1}) ^ full',
+            '~': '{0} ^ full',
+        }
+        for net in self.block:
+            if net.op == 'r':
+                next_regs[net.dests[0]] = varname[net.args[0]]
+                continue
+            if net.op == '@':
+                addr, data, enable = net.args
+                prog.append('    if %s:' % varname[enable])
+                prog.append('        mem_ws.append((%d, %s, %s, %s))' % (
+                    self._mem_index[net.op_param[0]], planes(addr), planes(data), varname[enable]))
+                continue
+
+            dest = net.dests[0]
+            if net.op in gates:
+                if dest.bitwidth != 1:
+                    raise PyrtlError('net "%s" is not a single bit, was the block '
+                                     'synthesized?' % str(net))
+                expr = gates[net.op].format(*(varname[a] for a in net.args))
+            elif net.op == 'w':
+                expr = bits(net.args[0], range(dest.bitwidth))
+            elif net.op == 's':
+                expr = bits(net.args[0], net.op_param[:dest.bitwidth])
+            elif net.op == 'c':
+                expr = ' + '.join(planes(a) for a in reversed(net.args))
+                if dest.bitwidth == 1:
+                    expr = '(%s)[0]' % expr
+                elif dest.bitwidth < sum(a.bitwidth for a in net.args):
+                    expr = '(%s)[:%d]' % (expr, dest.bitwidth)
+            elif net.op == 'm':
+                expr = '_mem_read(%d, %s, %d)' % (
+                    self._mem_index[net.op_param[0]], planes(net.args[0]), dest.bitwidth)
+                if dest.bitwidth == 1:
+                    expr += '[0]'
+            else:
+                raise PyrtlError('BitParallelSimulation cannot handle primitive "%s" '
+                                 '(was the block synthesized?)' % net.op)
+            prog.append('    %s = %s' % (varname[dest], expr))
+
+        for w in self._outputs:
+            prog.append('    outs[%s] = %s' % (repr(w.name), planes(w)))
+        prog.append('    return [%s], outs, mem_ws' % ', '.join(next_regs[r] for r in self._regs))
+        return '\n'.join(prog)
+
+    def step(self, provided_inputs):
+        """ Run the simulation for a cycle on every lane.
+
+        :param provided_inputs: a dictionary mapping input names (or WireVectors)
+          to a list of values, one for each lane
+        """
+        ins = {}
+        for wire, values in provided_inputs.items():
+            name = wire.name if isinstance(wire, WireVector) else wire
+            wire = self.block.wirevector_by_name.get(name)
+            if not isinstance(wire, Input):
+                raise PyrtlError('step provided a value for input for "%s" which is '
+                                 'not a known input ' % name)
+            if len(values) != self.lanes:
+                raise PyrtlError('need a value for each of the %d lanes for "%s"'
+                                 % (self.lanes, name))
+            if min(values) < 0 or max(values) > wire.bitmask:
+                raise PyrtlError('Wire {} has a value which cannot be represented'
+                                 ' using its bitwidth'.format(name))
+            ins[wire] = _to_planes(values, wire.bitwidth)
+        for w in self._inputs:
+            if w not in ins:
+                raise PyrtlError('Input "%s" has no input value specified' % w.name)
+
+        self.regvalue, self.outs, mem_writes = self.sim_func(
+            [ins[w] for w in self._inputs], self.regvalue, self._full)
+
+        for mem, addr, data, enable in mem_writes:
+            lane_maps = self.memvalue[mem]
+            addrs = _from_planes(addr, self.lanes)
+            datas = _from_planes(data, self.lanes)
+            lane = 0
+            while enable:
+                if enable & 1:
+                    lane_maps[lane][addrs[lane]] = datas[lane]
+                enable >>= 1
+                lane += 1
+
+        # check the rtl assertions, in every lane at once
+        for w in self._asserts:
+            failing = self.outs[w.name][0] ^ self._full
+            if failing:
+                self.failed_lanes = [lane for lane, bit in
+                                     enumerate(_from_planes([failing], self.lanes)) if bit]
+                raise self.block.rtl_assert_dict[w]
+
+    def step_multiple(self, provided_inputs, expected_outputs=None, nsteps=None,
+                      file=sys.stdout, stop_after_first_error=False):
+        """ Take the simulation forward N cycles on every lane.
+
+        :param provided_inputs: a dictionary mapping input names to a list, with one entry
+          per step, of the lists of per-lane values for that step
+        :param expected_outputs: a dictionary mapping output names to a list, with one entry
+          per step, of the lists of per-lane values expected for that step
+        :param nsteps: number of steps to take (defaults to the number of values supplied)
+        :param file: where to write the output (if there are unexpected outputs detected)
+        :param stop_after_first_error: a boolean flag indicating whether to stop the simulation
+            after the step where the first errors are encountered (defaults to False)
+        :return: the list of failures, each a tuple (step, lane, name, expected, actual)
+        """
+        if nsteps is None:
+            if not provided_inputs:
+                raise PyrtlError('need to supply either input values or a number '
+                                 'of steps to simulate')
+            nsteps = max(len(v) for v in provided_inputs.values())
+        if nsteps < 1:
+            raise PyrtlError("must simulate at least one step")
+        if any(len(v) < nsteps for v in provided_inputs.values()):
+            raise PyrtlError("must supply a value for each provided wire "
+                             "for each step of simulation")
+        if expected_outputs and any(len(v) < nsteps for v in expected_outputs.values()):
+            raise PyrtlError("any expected outputs must have a supplied value "
+                             "each step of simulation")
+
+        failed = []
+        for i in range(nsteps):
+            self.step({w: v[i] for w, v in provided_inputs.items()})
+            for name in (expected_outputs or {}):
+                actual = self.inspect(name)
+                for lane, (exp, act) in enumerate(zip(expected_outputs[name][i], actual)):
+                    if exp != act:
+                        failed.append((i, lane, name, exp, act))
+            if failed and stop_after_first_error:
+                break
+
+        if failed:
+            file.write("Unexpected output " + ("(stopped after step with first error):"
+                       if stop_after_first_error else "on one or more steps:") + "\n")
+            file.write("{0:>5} {1:>5} {2:>10} {3:>8} {4:>8}\n"
+                       .format("step", "lane", "name", "expected", "actual"))
+            for step, lane, name, exp, act in sorted(
+                    failed, key=lambda t: (t[0], t[1], _trace_sort_key(t[2]))):
+                file.write("{0:>5} {1:>5} {2:>10} {3:>8} {4:>8}\n"
+                           .format(step, lane, name, exp, act))
+            file.flush()
+        return failed
+
+    def inspect(self, w):
+        """ Get the per-lane values of an output in the last simulation cycle.
+
+        :param w: the name of the Output to inspect
+        :return: a list with the value of w in each lane
+        """
+        name = w.name if isinstance(w, WireVector) else w
+        if self.outs is None:
+            raise PyrtlError("No context available. Please run a simulation step in "
+                             "order to populate values for wires")
+        if name not in self.outs:
+            raise PyrtlError('BitParallelSimulation can only inspect Outputs')
+        return _from_planes(self.outs[name], self.lanes)
+
+    def inspect_mem(self, mem):
+        """ Get the contents of a memory in each lane.
+
+        :param mem: the memory to inspect (either from before or after synthesis)
+        :return: a list with a {address: value} dictionary for each lane
+        """
+        if isinstance(mem, RomBlock):
+            raise PyrtlError("ROM blocks are not stored in the simulation object")
+        if mem.id not in self._mem_index:
+            raise PyrtlError('unrecognized MemBlock')
+        return self.memvalue[self._mem_index[mem.id]]
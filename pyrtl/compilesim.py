@@ -1,7 +1,10 @@
 from __future__ import print_function, unicode_literals
 
+import copy
+import itertools
 import ctypes
 import subprocess
+import multiprocessing
 import tempfile
 import shutil
 import collections
@@ -14,12 +17,23 @@ from .core import working_block
 from .wire import Input, Output, Const, WireVector, Register
 from .memory import RomBlock
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .simulation import SimulationTrace, _trace_sort_key
+from .simulation import (SimulationTrace, _trace_sort_key, _pack_checkpoint, _unpack_checkpoint,
+                         _is_internal_name)
+from . import simcache
 
 
 __all__ = ['CompiledSimulation']
 
 
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise PyrtlError('need numpy installed to run CompiledSimulation on columns '
+                         'of inputs (try "pip install numpy")')
+    return numpy
+
+
 class DllMemInspector(collections.Mapping):
     """Dictionary-like access to a memory array in a CompiledSimulation."""
 
@@ -27,7 +41,7 @@ class DllMemInspector(collections.Mapping):
         self._aw = mem.addrwidth
         bw = mem.bitwidth
         self._limbs = limbs = sim._limbs(mem)
-        self._vn = vn = sim.varname[mem]
+        self._vn = vn = sim._fields[mem]
         if bw <= 8:
             scalar = ctypes.c_uint8
         elif bw <= 16:
@@ -37,8 +51,8 @@ class DllMemInspector(collections.Mapping):
         else:
             scalar = ctypes.c_uint64
         array_type = scalar*(len(self)*limbs)
-        self._buf = array_type.in_dll(sim._dll, vn)
-        self._sim = sim  # keep reference to avoid freeing dll
+        self._buf = array_type.from_buffer(sim._state, getattr(type(sim._state), vn).offset)
+        self._sim = sim  # keep reference to avoid freeing the state
 
     def __getitem__(self, ind):
         val = 0
@@ -54,6 +68,14 @@ class DllMemInspector(collections.Mapping):
     def __len__(self):
         return 1 << self._aw
 
+    def _clear(self):
+        ctypes.memset(self._buf, 0, ctypes.sizeof(self._buf))
+
+    def _set(self, ind, val):
+        for n in range(ind*self._limbs, (ind+1)*self._limbs):
+            self._buf[n] = val & ((1 << 64)-1)
+            val >>= 64
+
     def __eq__(self, other):
         if isinstance(other, DllMemInspector):
             if self._sim is other._sim and self._vn == other._vn:
@@ -83,31 +105,193 @@ class CompiledSimulation(object):
         - mips64 (untested)
 
     default_value is currently only implemented for registers, not memories.
+
+    The optimization_level (0 to 3) is passed on to gcc: 0, the default, compiles the
+    fastest, while 2 or 3 take longer to compile but make for a faster simulation.
+    Compiled libraries are cached on disk, by the hash of the generated C code, the
+    compiler flags and the cpu (as the code is compiled with -march=native), so building
+    the same design again does not need to compile it.
+    The cache is in cache_dir (see pyrtl.simcache for the default location), or pass
+    cache_dir=False to always compile.
+
+    The logic is compiled in chunks of at most chunk_size nets, each a function in its
+    own C file, as gcc gets very slow on one huge function; the files are compiled in
+    parallel and then linked together.  Pass chunk_size=None to put everything in one
+    function in one file.
+
+    With parallel=True, the combinational logic is split into its independent cones
+    (connected components), which each cycle are evaluated in parallel with OpenMP
+    (the library is built with -fopenmp, and OMP_NUM_THREADS sets the number of
+    threads).  Cones are gathered into groups of at least parallel_threshold nets, as
+    smaller ones are not worth the cost of handing them to another thread; if that
+    leaves a single group, the simulation stays serial.
+
+    Only inputs and outputs (and wires probed by an output) are traced, unless other
+    wires are given in internal_wires (as wires or names, or True for all the wires
+    tracked by the tracer): the values of those are copied to a trace buffer every
+    cycle, so they can be traced and inspected too.  Ask only for the wires needed,
+    as every one of them slows the simulation down a little.
+
+    The rtl_assert assertions are checked by the C code after every step: a run stops
+    right after the first step in which one fails (with that step traced), and its
+    exception is raised, with failed_assertion set to the number of the failing
+    step (counted from the start of the simulation) and the name of the assertion.
     """
 
+    optimization_levels = (0, 1, 2, 3)
+
     def __init__(
             self, tracer=True, register_value_map={}, memory_value_map={},
-            default_value=0, block=None):
-        self._dll = self._dir = None
+            default_value=0, block=None, optimization_level=0, cache_dir=None,
+            chunk_size=1000, internal_wires=(), parallel=False, parallel_threshold=2000):
+        self._lib = self._dir = None
+        if optimization_level not in self.optimization_levels:
+            raise PyrtlError('optimization_level must be one of %s'
+                             % (self.optimization_levels,))
+        self.optimization_level = optimization_level
+        self.cache_dir = cache_dir
+        if chunk_size is not None and chunk_size < 1:
+            raise PyrtlError('chunk_size must be at least 1 (or None)')
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.parallel_threshold = parallel_threshold
         self.block = working_block(block)
         self.block.sanity_check()
 
         if tracer is True:
             tracer = SimulationTrace()
         self.tracer = tracer
+        if internal_wires is True:
+            internal_wires = tracer.wires_to_track
+        self._internal = set()  # the internal wires copied to the trace buffer
+        for w in internal_wires:
+            if not isinstance(w, WireVector):
+                if w not in self.block.wirevector_by_name:
+                    raise PyrtlError('no wire named "%s" to trace' % w)
+                w = self.block.wirevector_by_name[w]
+            if not isinstance(w, (Input, Output)):
+                self._internal.add(w)
         self._remove_untraceable()
 
         self.default_value = default_value
         self._regmap, self._memmap = register_value_map, memory_value_map
         self._uid_counter = 0
         self.varname = {}  # mapping from wires and memories to C variables
+        self._consts = set()  # C variables of the constants
+        self._scalars = {}  # mapping from local wires held in native integers to their type
+        self._fields = {}  # mapping from wires and memories to fields of the state struct
+        self._state_fields = []  # the fields of the state struct, as ctypes fields
 
         self._create_dll()
+        self._init_state()
+        self._cycle = 0  # number of steps run so far
+        self.failed_assertion = None
+
+    def _init_state(self):
+        """Allocate the state of the simulation, with the initial register and memory values."""
+        fields = self._state_fields or [(str('pyrtlsim_empty'), ctypes.c_uint64)]
+        state_type = type(str('PyrtlsimState'), (ctypes.Structure,), {'_fields_': fields})
+        if ctypes.sizeof(state_type) != ctypes.c_uint64.in_dll(self._lib.dll,
+                                                                'pyrtlsim_state_size').value:
+            raise PyrtlInternalError('layout of the simulation state does not match the C code')
+        self._state = state_type()
+        for reg in self.block.wirevector_subset(Register):
+            val = self._regmap.get(reg, self.default_value)
+            buf = self._reg_buffer(reg)
+            for n in range(len(buf)):
+                buf[n] = val & ((1 << 64)-1)
+                val >>= 64
+        for mem, contents in self._memmap.items():
+            inspector = self.inspect_mem(mem)
+            for addr, val in contents.items():
+                if addr < len(inspector):
+                    inspector._set(addr, val)
 
     def inspect_mem(self, mem):
         """Get a view into the contents of a MemBlock."""
         return DllMemInspector(self, mem)
 
+    def checkpoint(self):
+        """Capture the state of the simulation so that it can be resumed later.
+
+        Returns a compact bytes object that can be given to restore() of any simulation
+        of the same block; see Simulation.checkpoint for details.
+        """
+        regs = {}
+        for r in self.block.wirevector_subset(Register):
+            val = 0
+            for limb in reversed(self._reg_buffer(r)):
+                val = (val << 64) | limb
+            regs[r.name] = val
+        mems = {mem.name: {addr: val for addr, val in self.inspect_mem(mem).items() if val}
+                for mem in self._mems()}
+        return _pack_checkpoint(regs, mems)
+
+    def restore(self, checkpoint):
+        """Return the simulation to the state captured by checkpoint()."""
+        regs, mems = _unpack_checkpoint(checkpoint)
+        for name, val in regs.items():
+            reg = self.block.wirevector_by_name.get(name)
+            if not isinstance(reg, Register):
+                raise PyrtlError('checkpoint has a value for unknown register "%s"' % name)
+            buf = self._reg_buffer(reg)
+            for n in range(len(buf)):
+                buf[n] = val & ((1 << 64)-1)
+                val >>= 64
+        known = {mem.name: mem for mem in self._mems()}
+        for name in mems:
+            if name not in known:
+                raise PyrtlError('checkpoint has the contents of unknown memory "%s"' % name)
+        for name, contents in mems.items():
+            inspector = self.inspect_mem(known[name])
+            inspector._clear()
+            for addr, val in contents.items():
+                inspector._set(addr, val)
+
+    def fork(self):
+        """Make an independent copy of the simulation in its current state.
+
+        The new simulation has a new (empty) tracer tracking the same wires.  Rather
+        than compiling the block again, it shares the compiled library, with its own
+        copy of the state.
+        """
+        sim = copy.copy(self)
+        sim._state = type(self._state).from_buffer_copy(self._state)
+        sim.tracer = SimulationTrace(wires_to_track=self.tracer.wires_to_track, block=self.block)
+        sim._remove_untraceable()
+        return sim
+
+    def run_many(self, runs, max_workers=None):
+        """Run many independent simulations at once, each from the current state.
+
+        :param runs: a list of the inputs of each simulation, each in any of the forms
+          taken by run()
+        :param max_workers: the number of threads to use, defaults to the number of cores
+        :return: a list of the simulations, forked from this one, that ran each of the
+          runs (their tracers hold the traces of the runs)
+
+        The simulations all share the compiled library, and run in parallel on a pool
+        of threads (the simulation code runs without holding the GIL).  This simulation
+        is left as it was.
+        """
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            raise PyrtlError('run_many needs concurrent.futures (python 3)')
+        sims = [self.fork() for inputs in runs]
+        with ThreadPoolExecutor(max_workers or _cpu_count()) as pool:
+            for done in [pool.submit(sim.run, inputs) for sim, inputs in zip(sims, runs)]:
+                done.result()
+        return sims
+
+    def _reg_buffer(self, reg):
+        return getattr(self._state, self._fields[reg])
+
+    def _mems(self):
+        """The memories of the block that hold state (so not the RomBlocks)."""
+        return {net.op_param[1] for net in self.block.logic_subset('m@')
+                if not isinstance(net.op_param[1], RomBlock)}
+
     def inspect(self, w):
         """Get the latest value of the wire given, if possible."""
         if isinstance(w, WireVector):
@@ -120,7 +304,8 @@ class CompiledSimulation(object):
             if not vals:
                 raise PyrtlError('No context available. Please run a simulation step')
             return vals[-1]
-        raise PyrtlError('CompiledSimulation does not support inspecting internal WireVectors')
+        raise PyrtlError('CompiledSimulation can only inspect internal WireVectors '
+                         'given in internal_wires')
 
     def step(self, inputs):
         """Run one step of the simulation.
@@ -240,20 +425,94 @@ class CompiledSimulation(object):
                 file.write("{0:>5} {1:>10} {2:>8} {3:>8}\n".format(step, name, expected, actual))
             file.flush()
 
-    def run(self, inputs):
+    def run(self, inputs, nsteps=None, out=None):
         """Run many steps of the simulation.
 
-        The argument is a list of input mappings for each step,
-        and its length is the number of steps to be executed.
+        The argument is either a list of input mappings for each step, and its length
+        is the number of steps to be executed, or else it holds whole columns of input
+        values at once, which is much faster for long runs (it needs numpy):
+
+          - a mapping from each input (or its name) to the values for every step, as
+            a numpy array or any other object supporting the buffer protocol (or a
+            list); an input wider than 64 bits takes an array of nsteps rows of its
+            64-bit limbs, least significant first (or a list of ints);
+          - or an already packed array of nsteps rows of input_width 64-bit words,
+            laid out as given by input_layout, which is passed on without any copy.
+
+        In the columnar form nsteps defaults to the number of values given for each
+        input (and must be given if there are none), and the outputs of the run are
+        returned as a dict from the name of each output to a numpy view of its values
+        (with a row of limbs per step for outputs wider than 64 bits).  The outputs are
+        written into out, if given, which must be a writable uint64 array of nsteps rows
+        of output_width words (see output_layout), so that it can be reused from run
+        to run.
         """
+        if not isinstance(inputs, (list, tuple)):
+            return self._run_columns(inputs, nsteps, out)
+
         steps = len(inputs)
-        # create i/o arrays of the appropriate length
-        ibuf_type = ctypes.c_uint64*(steps*self._ibufsz)
-        obuf_type = ctypes.c_uint64*(steps*self._obufsz)
-        ibuf = ibuf_type()
-        obuf = obuf_type()
-        # these array will be passed to _crun
-        self._crun.argtypes = [ctypes.c_uint64, ibuf_type, obuf_type]
+        buffers = self._buffers(steps)
+        ran, failed = self._run_block(inputs, buffers)
+        self.tracer.extend(self._block_values(ran, buffers))
+        self._check_assertion(failed)
+
+    def run_stream(self, inputs, nsteps=None, block_size=4096, callback=None, file=None,
+                   trace=False):
+        """Run the simulation on a stream of inputs, in blocks of a fixed number of steps.
+
+        :param inputs: an iterable (such as a generator) of the input mappings for each
+          step, as in run(); it is consumed block_size steps at a time
+        :param nsteps: the number of steps to run, defaults to as many as there are inputs
+        :param block_size: the number of steps simulated by each call to the C code
+        :param callback: a function called after each block with a dict from the name
+          of each traced wire to the list of its values in the block
+        :param file: a file to write the traced wires to as text, a line with their
+          names and then a line of values for each step
+        :param trace: whether to also add the values to the tracer (so memory use is
+          only bounded if the tracer is)
+        :return: the number of steps run
+
+        The i/o buffers are allocated once, for one block, so however many steps are
+        run, the memory used stays the same.
+        """
+        if block_size < 1:
+            raise PyrtlError('block_size must be at least 1')
+        names = sorted(self.tracer.trace, key=_trace_sort_key)
+        if file is not None:
+            file.write(' '.join(names) + '\n')
+        buffers = self._buffers(block_size)
+        inputs = iter(inputs)
+        total = 0
+        while nsteps is None or total < nsteps:
+            size = block_size if nsteps is None else min(block_size, nsteps - total)
+            block = list(itertools.islice(inputs, size))
+            if not block:
+                break
+            ctypes.memset(buffers[0], 0, ctypes.sizeof(buffers[0]))
+            ran, failed = self._run_block(block, buffers)
+            values = self._block_values(ran, buffers)
+            total += ran
+            if trace:
+                self.tracer.extend(values)
+            if callback is not None:
+                callback(values)
+            if file is not None:
+                columns = [values[name] for name in names]
+                file.writelines(' '.join(str(v) for v in row) + '\n' for row in zip(*columns))
+            self._check_assertion(failed)
+        if nsteps is not None and total < nsteps:
+            raise PyrtlError('inputs ran out after %d of the %d steps' % (total, nsteps))
+        return total
+
+    def _buffers(self, steps):
+        """The input, output and trace arrays for running the given number of steps."""
+        return ((ctypes.c_uint64*(steps*self._ibufsz))(),
+                (ctypes.c_uint64*(steps*self._obufsz))(),
+                (ctypes.c_uint64*(steps*self._tbufsz))())
+
+    def _run_block(self, inputs, buffers):
+        """Run the steps with the given list of input mappings, using the given arrays."""
+        ibuf, obuf, tbuf = buffers
 
         # build the input array
         for n, inmap in enumerate(inputs):
@@ -275,9 +534,32 @@ class CompiledSimulation(object):
                     val >>= 64
 
         # run the simulation
-        self._crun(steps, ibuf, obuf)
+        return self._call(len(inputs), ibuf, obuf, tbuf)
 
-        # save traced wires
+    def _call(self, steps, ibuf, obuf, tbuf):
+        """Run the simulation code on the given arrays (or addresses of arrays).
+
+        Returns the number of steps run, which is fewer than asked for if an rtl_assert
+        failed, and the index of the failed assertion (or None).
+        """
+        failed = ctypes.c_uint64(0)
+        ran = self._lib.run(ctypes.byref(self._state), steps, ibuf, obuf, tbuf,
+                            ctypes.byref(failed))
+        self._cycle += ran
+        return ran, (failed.value - 1 if failed.value else None)
+
+    def _check_assertion(self, failed):
+        """Raise the exception of the failed rtl_assert, if any (see _call)."""
+        if failed is not None:
+            wire = self._asserts[failed]
+            self.failed_assertion = (self._cycle - 1, wire.name)
+            self.tracer.assertion_failed(wire.name)
+            raise self.block.rtl_assert_dict[wire]
+
+    def _block_values(self, steps, buffers):
+        """The values of the traced wires in the given number of steps of the arrays."""
+        ibuf, obuf, tbuf = buffers
+        values = {}
         for name in self.tracer.trace:
             rname = self._probe_mapping.get(name, name)
             if rname in self._outputpos:
@@ -286,6 +568,9 @@ class CompiledSimulation(object):
             elif rname in self._inputpos:
                 start, count = self._inputpos[rname]
                 buf, sz = ibuf, self._ibufsz
+            elif rname in self._tracepos:
+                start, count = self._tracepos[rname]
+                buf, sz = tbuf, self._tbufsz
             else:
                 raise PyrtlInternalError('Untraceable wire in tracer')
             res = []
@@ -297,14 +582,155 @@ class CompiledSimulation(object):
                     val |= buf[pos]
                 res.append(val)
                 start += sz
-            self.tracer.trace[name].extend(res)
+            values[name] = res
+        return values
+
+    @property
+    def input_width(self):
+        """Number of 64-bit words taken by the inputs of one step, in a packed array."""
+        return self._ibufsz
+
+    @property
+    def output_width(self):
+        """Number of 64-bit words taken by the outputs of one step, in a packed array."""
+        return self._obufsz
+
+    @property
+    def input_layout(self):
+        """Map from each input name to its (first word, number of words) in a packed row."""
+        return dict(self._inputpos)
+
+    @property
+    def output_layout(self):
+        """Map from each output name to its (first word, number of words) in a packed row."""
+        return dict(self._outputpos)
+
+    def _run_columns(self, inputs, nsteps, out):
+        """Run the simulation on columns of inputs (see run)."""
+        np = _import_numpy()
+        if isinstance(inputs, collections.Mapping):
+            ibuf = self._pack_columns(np, inputs, nsteps)
+        else:
+            ibuf = np.asarray(inputs)
+            if ibuf.dtype != np.uint64 or ibuf.ndim != 2 or ibuf.shape[1] != self._ibufsz:
+                raise PyrtlError('packed inputs must be a uint64 array of rows of %d words'
+                                 % self._ibufsz)
+            if nsteps is not None:
+                if nsteps > len(ibuf):
+                    raise PyrtlError('nsteps is greater than the number of rows of inputs')
+                ibuf = ibuf[:nsteps]
+            ibuf = np.ascontiguousarray(ibuf)
+            for name, (start, count) in self._inputpos.items():
+                top = self._inputbw[name] - 64*(count-1)
+                if top < 64 and len(ibuf) and ibuf[:, start+count-1].max() >> top:
+                    raise PyrtlError('Wire {} has a value which cannot be represented '
+                                     'using its bitwidth'.format(name))
+        steps = len(ibuf)
+
+        if out is None:
+            obuf = np.empty((steps, self._obufsz), dtype=np.uint64)
+        else:
+            obuf = np.asarray(out)
+            if (obuf.dtype != np.uint64 or not obuf.flags.c_contiguous
+                    or not obuf.flags.writeable or obuf.size != steps*self._obufsz):
+                raise PyrtlError('out must be a writable contiguous uint64 array of '
+                                 '%d rows of %d words' % (steps, self._obufsz))
+            obuf = obuf.reshape((steps, self._obufsz))
+
+        # the arrays are handed to the simulation as they are, without copying
+        tbuf = np.empty((steps, self._tbufsz), dtype=np.uint64)
+        ran, failed = self._call(steps, ibuf.ctypes.data, obuf.ctypes.data, tbuf.ctypes.data)
+        ibuf, obuf, tbuf = ibuf[:ran], obuf[:ran], tbuf[:ran]
+
+        # save traced wires
+        columns = {}
+        for name in self.tracer.trace:
+            rname = self._probe_mapping.get(name, name)
+            if rname in self._outputpos:
+                start, count = self._outputpos[rname]
+                buf = obuf
+            elif rname in self._inputpos:
+                start, count = self._inputpos[rname]
+                buf = ibuf
+            elif rname in self._tracepos:
+                start, count = self._tracepos[rname]
+                buf = tbuf
+            else:
+                raise PyrtlInternalError('Untraceable wire in tracer')
+            if count == 1:
+                # copied straight out of the array into the trace (see TraceColumn)
+                columns[name] = buf[:, start]
+                continue
+            vals = buf[:, start].tolist()
+            for n in range(1, count):
+                vals = [v | (limb << 64*n) for v, limb in zip(vals, buf[:, start+n].tolist())]
+            columns[name] = vals
+        self.tracer.extend(columns)
+        self._check_assertion(failed)
+
+        return {name: obuf[:, start] if count == 1 else obuf[:, start:start+count]
+                for name, (start, count) in self._outputpos.items()}
+
+    def _pack_columns(self, np, inputs, nsteps):
+        """Pack a mapping of input columns into an array of rows of input words."""
+        columns = {}
+        for w, column in inputs.items():
+            name = w.name if isinstance(w, WireVector) else w
+            if name not in self._inputpos:
+                raise PyrtlError('"%s" is not an input of the simulation' % name)
+            columns[name] = column
+        missing = set(self._inputpos) - set(columns)
+        if missing:
+            raise PyrtlError('no values given for inputs %s' % ', '.join(sorted(missing)))
+        if nsteps is None:
+            if not columns:
+                raise PyrtlError('need to supply either input values or a number of steps')
+            nsteps = max(len(column) for column in columns.values())
+        if any(len(column) < nsteps for column in columns.values()):
+            raise PyrtlError('must supply a value for each input for each step of simulation')
+
+        ibuf = np.empty((nsteps, self._ibufsz), dtype=np.uint64)
+        for name, column in columns.items():
+            start, count = self._inputpos[name]
+            bitwidth = self._inputbw[name]
+            if count == 1 and isinstance(column, (list, tuple)):
+                # python ints: checked here, as numpy would make floats of a mix of
+                # values of 2**63 and over with smaller ones
+                col = column[:nsteps]
+                if len(col) and (min(col) < 0 or max(col) >> bitwidth):
+                    raise PyrtlError('Wire {} has a value which cannot be represented '
+                                     'using its bitwidth'.format(name))
+                ibuf[:, start] = np.array(col, dtype=np.uint64)
+                continue
+            col = np.asarray(column)
+            if col.dtype == object or (count > 1 and col.ndim == 1):
+                # python ints, possibly wider than 64 bits: split them into limbs
+                col = np.array(column[:nsteps], dtype=object).reshape(-1)
+                if len(col) and (min(col) < 0 or max(col) >> bitwidth):
+                    raise PyrtlError('Wire {} has a value which cannot be represented '
+                                     'using its bitwidth'.format(name))
+                for n in range(count):
+                    ibuf[:, start+n] = ((col >> 64*n) & ((1 << 64)-1)).astype(np.uint64)
+                continue
+            if col.dtype.kind not in 'uib' or col.shape[1:] != ((count,) if count > 1 else ()):
+                raise PyrtlError('values of input %s must be unsigned integers%s'
+                                 % (name, ' in rows of %d limbs' % count if count > 1 else ''))
+            col = col[:nsteps]
+            top = bitwidth - 64*(count-1)
+            last = col[:, -1] if count > 1 else col
+            if len(col) and ((col.dtype.kind == 'i' and col.min() < 0)
+                             or (top < 64 and int(last.max()) >> top)):
+                raise PyrtlError('Wire {} has a value which cannot be represented '
+                                 'using its bitwidth'.format(name))
+            ibuf[:, start:start+count] = col.reshape((nsteps, count))
+        return ibuf
 
     def _traceable(self, wv):
         """Check if wv is able to be traced
 
         If it is traceable due to a probe, record that probe in _probe_mapping.
         """
-        if isinstance(wv, (Input, Output)):
+        if isinstance(wv, (Input, Output)) or wv in self._internal:
             return True
         for net in self.block.logic:
             if net.op == 'w' and net.args[0].name == wv.name and isinstance(net.dests[0], Output):
@@ -319,27 +745,97 @@ class CompiledSimulation(object):
         """
         self._probe_mapping = {}
         wvs = {wv for wv in self.tracer.wires_to_track if self._traceable(wv)}
+        wvs.update(self._internal)
         self.tracer.wires_to_track = wvs
         self.tracer._wires = {wv.name: wv for wv in wvs}
-        self.tracer.trace.__init__(wvs)
+        self.tracer.trace = self.tracer._new_storage(wvs)
 
     def _create_dll(self):
-        """Create a dynamically-linked library implementing the simulation logic."""
+        """Create a dynamically-linked library implementing the simulation logic.
+
+        The state of the simulation is not part of the library, so the library can
+        be shared by any number of simulations of the same block (see fork), and the
+        compiled library is also shared, between processes, through the cache.
+        """
         self._dir = tempfile.mkdtemp()
-        with open(path.join(self._dir, 'pyrtlsim.c'), 'w') as f:
-            self._create_code(lambda s: f.write(s+'\n'))
+        files = self._create_code()
+        for name, source in files:
+            with open(path.join(self._dir, name), 'w') as f:
+                f.write(source)
+        sources = [name for name, source in files if name.endswith('.c')]
+        flags = self._compile_flags()
+
+        if self.cache_dir is False:
+            self._compile(flags, sources)
+        else:
+            directory = simcache.cache_dir('compiledsim', self.cache_dir)
+            key = simcache.content_key(*([part for f in files for part in f] + [
+                ' '.join(flags), _compiler_version(), platform.machine(), _cpu_target()]))
+            cached = path.join(directory, key + '.so')
+            if not self._copy_cached(cached):
+                # another process may be compiling the same code, so wait for it
+                with simcache.lock(path.join(directory, key + '.lock')):
+                    if not self._copy_cached(cached):
+                        self._compile(flags, sources)
+                        with open(path.join(self._dir, 'pyrtlsim.so'), 'rb') as f:
+                            simcache.write(cached, f.read())
+        self._lib = _Library(self._dir)
+        self._dir = None  # now owned by the library
+
+    def _compile_flags(self):
+        flags = ['-O%d' % self.optimization_level, '-march=native', '-std=c99', '-m64']
+        if self.parallel:
+            flags.append('-fopenmp')
+        return flags
+
+    def _compile(self, flags, sources):
+        """Compile the C files into pyrtlsim.so.
+
+        A single file is compiled and linked in one go; otherwise the files are compiled
+        to object files in parallel (as many at once as there are cpus), then linked.
+        """
         if platform.system() == 'Darwin':
             shared = '-dynamiclib'
         else:
             shared = '-shared'
-        subprocess.check_call([
-            'gcc', '-O0', '-march=native', '-std=c99', '-m64',
-            shared, '-fPIC',
-            path.join(self._dir, 'pyrtlsim.c'), '-o', path.join(self._dir, 'pyrtlsim.so'),
-            ], shell=(platform.system() == 'Windows'))
-        self._dll = ctypes.CDLL(path.join(self._dir, 'pyrtlsim.so'))
-        self._crun = self._dll.sim_run_all
-        self._crun.restype = None  # argtypes set on use
+        shell = platform.system() == 'Windows'
+        sofile = path.join(self._dir, 'pyrtlsim.so')
+        sources = [path.join(self._dir, name) for name in sources]
+        if len(sources) == 1:
+            subprocess.check_call(['gcc'] + flags + [shared, '-fPIC'] + sources + ['-o', sofile],
+                                  shell=shell)
+            return
+
+        jobs = _cpu_count()
+        objects = [source[:-2] + '.o' for source in sources]
+        pending = list(zip(sources, objects))
+        running = []
+        failed = None
+        try:
+            while pending or running:
+                while pending and len(running) < jobs:
+                    source, obj = pending.pop(0)
+                    cmd = ['gcc'] + flags + ['-fPIC', '-c', source, '-o', obj]
+                    running.append((subprocess.Popen(cmd, shell=shell), cmd))
+                proc, cmd = running.pop(0)
+                if proc.wait() != 0 and failed is None:
+                    failed = subprocess.CalledProcessError(proc.returncode, cmd)
+                    pending = []
+        finally:
+            for proc, cmd in running:
+                proc.wait()
+        if failed is not None:
+            raise failed
+        subprocess.check_call(['gcc'] + flags + [shared, '-fPIC'] + objects + ['-o', sofile],
+                              shell=shell)
+
+    def _copy_cached(self, cached):
+        """Copy the cached library, if there is one, returning whether there was."""
+        try:
+            shutil.copyfile(cached, path.join(self._dir, 'pyrtlsim.so'))
+        except (IOError, OSError):
+            return False
+        return True
 
     def _limbs(self, w):
         """Number of 64-bit words needed to store value of wire."""
@@ -381,10 +877,22 @@ class CompiledSimulation(object):
 
         Returns '0' when the wire does not have sufficient limbs.
         """
-        return '{vn}[{n}]'.format(vn=self.varname[arg], n=n) if arg.bitwidth > 64*n else '0'
+        if arg.bitwidth <= 64*n:
+            return '0'
+        if arg in self._scalars:
+            return '((uint64_t)({vn}>>{shift}))'.format(vn=self.varname[arg], shift=64*n) \
+                if n else '((uint64_t){vn})'.format(vn=self.varname[arg])
+        return '{vn}[{n}]'.format(vn=self.varname[arg], n=n)
 
     def _clean_name(self, prefix, obj):
-        """Create a C variable name with the given prefix based on the name of obj."""
+        """Create a C variable name with the given prefix based on the name of obj.
+
+        The names PyRTL made up for unnamed wires and memories are left out, as they
+        come from a global counter and would make the code of the same design differ
+        every time it is built (and so miss the cache).
+        """
+        if _is_internal_name(obj.name):
+            return '{}{}'.format(prefix, self._uid())
         return '{}{}_{}'.format(prefix, self._uid(), ''.join(c for c in obj.name if c.isalnum()))
 
     def _uid(self):
@@ -394,61 +902,73 @@ class CompiledSimulation(object):
         return x
 
     def _declare_mem(self, write, mem):
-        self.varname[mem] = vn = self._clean_name('m', mem)
+        vn = self._clean_name('m', mem)
         if isinstance(mem, RomBlock):
             # extract data from mem
-            romval = [mem._get_read_data(n) for n in range(1 << mem.addrwidth)]
-            write('static const uint{width}_t {name}[][{limbs}] = {{'.format(
+            self.varname[mem] = vn
+            romval = mem._get_table()
+            if not isinstance(romval, tuple):  # read every address, reporting any problem
+                read = mem._get_read_data if romval is None else romval.__getitem__
+                romval = [read(n) for n in range(1 << mem.addrwidth)]
+            write('const uint{width}_t {name}[][{limbs}] = {{'.format(
                 name=vn, width=self._memwidth(mem), limbs=self._limbs(mem)))
             for rv in romval:
                 write(self._makeini(mem, rv)+',')
             write('};')
         else:
-            write('EXPORT')
-            if mem in self._memmap:
-                highest = min(1 << mem.addrwidth, max(self._memmap[mem])+1)
-                memval = [self._memmap[mem].get(n, 0) for n in range(highest)]
-                write('uint{width}_t {name}[{size}][{limbs}] = {{'.format(
-                    name=vn, width=self._memwidth(mem),
-                    size=1 << mem.addrwidth, limbs=self._limbs(mem)))
-                for mv in memval:
-                    write(self._makeini(mem, mv)+',')
-                write('};')
-            else:
-                # initialize to zero by default
-                write('uint{width}_t {name}[{size}][{limbs}] = {{{{0}}}};'.format(
-                    name=vn, width=self._memwidth(mem),
-                    size=1 << mem.addrwidth, limbs=self._limbs(mem)))
+            # part of the state, whose initial value is set when the state is allocated
+            scalar = getattr(ctypes, 'c_uint%d' % self._memwidth(mem))
+            self._add_field(mem, vn, scalar*self._limbs(mem)*(1 << mem.addrwidth))
+            write('uint{width}_t {name}[{size}][{limbs}];'.format(
+                name=vn, width=self._memwidth(mem),
+                size=1 << mem.addrwidth, limbs=self._limbs(mem)))
 
     def _declare_wv(self, write, w):
-        self.varname[w] = vn = self._clean_name('w', w)
         if isinstance(w, Const):
-            write('const uint64_t {name}[{limbs}] = {val};'.format(
-                limbs=self._limbs(w), name=vn, val=self._makeini(w, w.val)))
-        elif isinstance(w, Register):
-            write('static uint64_t {name}[{limbs}] = {val};'.format(
-                limbs=self._limbs(w), name=vn,
-                val=self._makeini(w, self._regmap.get(w, self.default_value))))
+            # named by value, so that equal constants share one, whichever wire they are
+            vn = 'k{}_{:x}'.format(w.bitwidth, w.val)
+            if vn not in self._consts:
+                self._consts.add(vn)
+                write('static const uint64_t {name}[{limbs}] = {val};'.format(
+                    limbs=self._limbs(w), name=vn, val=self._makeini(w, w.val)))
+            self.varname[w] = vn
+            return
+        vn = self._clean_name('w', w)
+        if w in self._scalars:
+            self.varname[w] = vn
+            write('{ctype} {name};'.format(ctype=self._scalars[w], name=vn))
         else:
+            self.varname[w] = vn
             write('uint64_t {name}[{limbs}];'.format(limbs=self._limbs(w), name=vn))
 
+    def _declare_state_wv(self, write, w):
+        """Declare a wire (like a register) that is part of the state struct."""
+        vn = self._clean_name('w', w)
+        self._add_field(w, vn, ctypes.c_uint64*self._limbs(w))
+        write('uint64_t {name}[{limbs}];'.format(limbs=self._limbs(w), name=vn))
+
+    def _add_field(self, obj, vn, ctype):
+        self._fields[obj] = vn
+        self._state_fields.append((str(vn), ctype))
+        self.varname[obj] = 's->' + vn
+
     def _build_memread(self, write, op, param, args, dest):
         mem = param[1]
         for n in range(self._limbs(dest)):
-            write('{dest}[{n}] = {mem}[{addr}[0]][{n}]{mask};'.format(
+            write('{dest}[{n}] = {mem}[{addr}][{n}]{mask};'.format(
                 dest=self.varname[dest], n=n, mem=self.varname[mem],
-                addr=self.varname[args[0]], mask=self._makemask(dest, mem.bitwidth, n)))
+                addr=self._read(args[0]), mask=self._makemask(dest, mem.bitwidth, n)))
 
     def _build_wire(self, write, op, param, args, dest):
         for n in range(self._limbs(dest)):
-            write('{dest}[{n}] = {arg}[{n}]{mask};'.format(
-                dest=self.varname[dest], n=n, arg=self.varname[args[0]],
+            write('{dest}[{n}] = {arg}{mask};'.format(
+                dest=self.varname[dest], n=n, arg=self._getarglimb(args[0], n),
                 mask=self._makemask(dest, args[0].bitwidth, n)))
 
     def _build_not(self, write, op, param, args, dest):
         for n in range(self._limbs(dest)):
-            write('{dest}[{n}] = (~{arg}[{n}]){mask};'.format(
-                dest=self.varname[dest], n=n, arg=self.varname[args[0]],
+            write('{dest}[{n}] = (~{arg}){mask};'.format(
+                dest=self.varname[dest], n=n, arg=self._getarglimb(args[0], n),
                 mask=self._makemask(dest, None, n)))
 
     def _build_bitwise(self, write, op, param, args, dest):  # &, |, ^ only
@@ -489,15 +1009,15 @@ class CompiledSimulation(object):
         write('{dest}[0] = {cond};'.format(dest=self.varname[dest], cond=cond))
 
     def _build_mux(self, write, op, param, args, dest):
-        write('if ({mux}[0]) {{'.format(mux=self.varname[args[0]]))
+        write('if ({mux}) {{'.format(mux=self._read(args[0])))
         for n in range(self._limbs(dest)):
-            write('{dest}[{n}] = {arg}[{n}]{mask};'.format(
-                dest=self.varname[dest], n=n, arg=self.varname[args[2]],
+            write('{dest}[{n}] = {arg}{mask};'.format(
+                dest=self.varname[dest], n=n, arg=self._getarglimb(args[2], n),
                 mask=self._makemask(dest, args[2].bitwidth, n)))
         write('} else {')
         for n in range(self._limbs(dest)):
-            write('{dest}[{n}] = {arg}[{n}]{mask};'.format(
-                dest=self.varname[dest], n=n, arg=self.varname[args[1]],
+            write('{dest}[{n}] = {arg}{mask};'.format(
+                dest=self.varname[dest], n=n, arg=self._getarglimb(args[1], n),
                 mask=self._makemask(dest, args[1].bitwidth, n)))
         write('}')
 
@@ -550,7 +1070,7 @@ class CompiledSimulation(object):
     def _build_concat(self, write, op, param, args, dest):
         cattotal = sum(x.bitwidth for x in args)
         pieces = (
-            (self.varname[a], l, 0, min(64, a.bitwidth-64*l))
+            (self._getarglimb(a, l), l, 0, min(64, a.bitwidth-64*l))
             for a in reversed(args) for l in range(self._limbs(a)))
         curr = next(pieces)
         for n in range(self._limbs(dest)):
@@ -558,14 +1078,14 @@ class CompiledSimulation(object):
             dpos = 0
             while True:
                 arg, alimb, astart, asize = curr
-                res.append('(({arg}[{limb}]>>{start})<<{pos})'.format(
-                    arg=arg, limb=alimb, start=astart, pos=dpos))
+                res.append('(({arg}>>{start})<<{pos})'.format(
+                    arg=arg, start=astart, pos=dpos))
                 dpos += asize
-                if dpos >= dest.bitwidth-64*n:
-                    break
                 if dpos > 64:
                     curr = (arg, alimb, 64-(dpos-asize), dpos-64)
                     break
+                if dpos >= dest.bitwidth-64*n:
+                    break
                 curr = next(pieces)
                 if dpos == 64:
                     break
@@ -576,20 +1096,171 @@ class CompiledSimulation(object):
     def _build_select(self, write, op, param, args, dest):
         for n in range(self._limbs(dest)):
             bits = [
-                '((1&({src}[{limb}]>>{sb}))<<{db})'.format(
-                    src=self.varname[args[0]], sb=(b % 64), limb=(b//64), db=en)
+                '((1&({src}>>{sb}))<<{db})'.format(
+                    src=self._getarglimb(args[0], b//64), sb=(b % 64), db=en)
                 for en, b in enumerate(param[64*n:min(dest.bitwidth, 64*(n+1))])]
             write('{dest}[{n}] = {bits};'.format(
                 dest=self.varname[dest], n=n, bits='|'.join(bits)))
 
-    def _create_code(self, write):
-        write('#include <stdint.h>')
+    # Nets whose wires are all at most 128 bits wide are built as single C expressions
+    # on native integers (uint64_t, or unsigned __int128 beyond 64 bits), and the
+    # local wires they drive are scalars of the smallest type that fits, which gcc
+    # can keep in registers.  Only nets involving wider wires use the limb code above.
+
+    def _is_native(self, net):
+        """Whether the net can be built on native integers."""
+        widths = [w.bitwidth for w in net.args + net.dests]
+        if net.op == 'm':
+            widths.append(net.op_param[1].bitwidth)
+        return max(widths) <= 128
+
+    def _ctype(self, bitwidth):
+        """The smallest native integer type holding the given number of bits."""
+        for n in (8, 16, 32, 64):
+            if bitwidth <= n:
+                return 'uint%d_t' % n
+        return 'unsigned __int128'
+
+    def _mask(self, bitwidth):
+        if bitwidth <= 64:
+            return '0x{:X}ULL'.format((1 << bitwidth)-1)
+        return '(((unsigned __int128)1<<{})-1)'.format(bitwidth)
+
+    def _read(self, w):
+        """The value of a wire of at most 128 bits, as a C expression."""
+        if w in self._scalars:
+            return self.varname[w]
+        if isinstance(w, Const):
+            limbs = ['0x{:X}ULL'.format((w.val >> 64*n) & ((1 << 64)-1))
+                     for n in range(self._limbs(w))]
+        else:
+            limbs = ['{vn}[{n}]'.format(vn=self.varname[w], n=n) for n in range(self._limbs(w))]
+        if len(limbs) == 1:
+            return limbs[0]
+        return '(((unsigned __int128){}<<64)|{})'.format(limbs[1], limbs[0])
+
+    def _build_native(self, write, net):
+        op, param, args, dest = net.op, net.op_param, net.args, net.dests[0]
+        big = max(w.bitwidth for w in args + (dest,)) > 64
+        ctype = 'unsigned __int128' if big else 'uint64_t'
+        bits = 128 if big else 64
+        a = ['(({}){})'.format(ctype, self._read(arg)) for arg in args]
+        width = bits  # how many bits of the result may be set
+        if op == 'm':
+            mem = param[1]
+            row = '{mem}[{addr}]'.format(mem=self.varname[mem], addr=self._read(args[0]))
+            if mem.bitwidth <= 64:
+                expr = row + '[0]'
+            else:
+                expr = '(((unsigned __int128){row}[1]<<64)|{row}[0])'.format(row=row)
+            width = mem.bitwidth
+        elif op == 'w':
+            expr, width = self._read(args[0]), args[0].bitwidth
+        elif op == '~':
+            expr = '~' + a[0]
+        elif op in '&|^':
+            expr = '{}{}{}'.format(a[0], op, a[1])
+            width = max(args[0].bitwidth, args[1].bitwidth)
+        elif op == 'n':
+            expr = '~({}&{})'.format(a[0], a[1])
+        elif op in '=<>':
+            expr, width = '({}{}{})'.format(a[0], '==' if op == '=' else op, a[1]), 1
+        elif op == 'x':
+            expr = '({}?{}:{})'.format(self._read(args[0]), a[2], a[1])
+            width = max(args[1].bitwidth, args[2].bitwidth)
+        elif op == '+':
+            expr = '{}+{}'.format(a[0], a[1])
+            width = max(args[0].bitwidth, args[1].bitwidth) + 1
+        elif op == '-':
+            expr = '{}-{}'.format(a[0], a[1])
+        elif op == '*':
+            expr = '{}*{}'.format(a[0], a[1])
+            width = args[0].bitwidth + args[1].bitwidth
+        elif op == 'c':
+            pieces, pos = [], 0
+            for arg, value in reversed(list(zip(args, a))):
+                pieces.append('({}<<{})'.format(value, pos) if pos else value)
+                pos += arg.bitwidth
+            expr, width = '|'.join(reversed(pieces)), pos
+        elif op == 's':
+            if list(param) == list(range(param[0], param[0]+len(param))):
+                expr = '({}>>{})'.format(a[0], param[0]) if param[0] else a[0]
+                width = args[0].bitwidth - param[0]
+            else:
+                expr = '|'.join('((({}>>{})&1)<<{})'.format(a[0], b, n)
+                                for n, b in enumerate(param))
+                width = len(param)
+        else:
+            raise PyrtlInternalError('no native code for op "%s"' % op)
+        if dest.bitwidth < min(width, bits):
+            expr = '({})&{}'.format(expr, self._mask(dest.bitwidth))
+
+        if dest in self._scalars:
+            write('{dest} = {expr};'.format(dest=self.varname[dest], expr=expr))
+        elif dest.bitwidth <= 64:
+            write('{dest}[0] = {expr};'.format(dest=self.varname[dest], expr=expr))
+        else:
+            write('{{ unsigned __int128 v = {expr}; {dest}[0] = (uint64_t)v; '
+                  '{dest}[1] = (uint64_t)(v>>64); }}'.format(dest=self.varname[dest], expr=expr))
+
+    def _partition(self, nets):
+        """Split the nets (in topological order) into groups to be evaluated in parallel.
+
+        The nets are grouped into their connected components (through the wires
+        between them, not through registers or memories), which are independent of
+        each other within a cycle, and the components are then gathered into groups of
+        at least parallel_threshold nets each.  The nets of each group keep their
+        topological order.
+        """
+        parent = list(range(len(nets)))
+
+        def find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+
+        driver = {net.dests[0]: n for n, net in enumerate(nets)}
+        for n, net in enumerate(nets):
+            for arg in net.args:
+                if arg in driver:
+                    parent[find(n)] = find(driver[arg])
+        components = collections.OrderedDict()
+        for n in range(len(nets)):
+            components.setdefault(find(n), []).append(n)
+
+        groups = [[]]
+        for component in components.values():
+            if len(groups[-1]) >= self.parallel_threshold:
+                groups.append([])
+            groups[-1].extend(component)
+        if len(groups) > 1 and len(groups[-1]) < self.parallel_threshold:
+            groups[-2].extend(groups.pop())  # too small to be worth a thread of its own
+        # merging components loses the topological order between them, so restore it
+        return [[nets[n] for n in sorted(group)] for group in groups]
+
+    def _create_code(self):
+        """Generate the C code of the simulation, as a list of (filename, code).
+
+        The combinational logic (in topological order) is split into functions of at
+        most chunk_size nets each.  When there is more than one, each goes into its own
+        file, so that gcc never has to deal with one huge function and the files can be
+        compiled in parallel.
+
+        The state of the simulation (registers, memories, and the wires used outside
+        of the function that computes them) is kept in a struct pyrtlsim_state, which
+        is passed to every function, so that the library holds no state of its own and
+        can run any number of simulations.  Other wires are locals of their function.
+        """
+        header = []
+        hwrite = header.append
+        hwrite('#include <stdint.h>')
 
         # windows dllexport needed to make symbols visible
         if platform.system() == 'Windows':
-            write('#define EXPORT __declspec(dllexport)')
+            hwrite('#define EXPORT __declspec(dllexport)')
         else:
-            write('#define EXPORT')
+            hwrite('#define EXPORT')
 
         # multiplication macro
         #  for efficient 64x64 -> 128 bit multiplication without uint128_t
@@ -605,38 +1276,71 @@ class CompiledSimulation(object):
                       '"=r"(*pl),"=r"(*ph):"r"(t0),"r"(t1)',
         }
         if machine in mulinstr:
-            write('#define mul128(t0, t1, pl, ph) __asm__({})'.format(mulinstr[machine]))
+            hwrite('#define mul128(t0, t1, pl, ph) __asm__({})'.format(mulinstr[machine]))
+
+        main = ['#include "pyrtlsim.h"']
+        write = main.append
+        state = []  # declarations of the fields of the state struct
 
         # declare memories
+        # (everything is declared in a fixed order, so that the same design always
+        # generates the same code, which lets the compiled library be cached; names
+        # are sorted as in traces, so that made up names keep the order they were made)
         mems = {net.op_param[1] for net in self.block.logic_subset('m@')}
         for key in self._memmap:
             if key not in mems:
                 raise PyrtlError('unrecognized MemBlock in memory_value_map')
             if isinstance(key, RomBlock):
                 raise PyrtlError('RomBlock in memory_value_map')
-        for mem in mems:
-            self._declare_mem(write, mem)
-
-        # single step function
-        write('static void sim_run_step(uint64_t inputs[], uint64_t outputs[]) {')
-        write('uint64_t tmp, carry, tmphi, tmplo;')  # temporary variables
-
-        # declare wire vectors
-        for w in self.block.wirevector_set:
-            self._declare_wv(write, w)
-
-        # inputs copied in
-        inputs = list(self.block.wirevector_subset(Input))
-        self._inputpos = {}  # for each input wire, start and number of elements in input array
-        self._inputbw = {}  # bitwidth of each input wire
-        ipos = 0
-        for w in inputs:
-            self._inputpos[w.name] = ipos, self._limbs(w)
-            self._inputbw[w.name] = w.bitwidth
-            for n in range(self._limbs(w)):
-                write('{vn}[{n}] = inputs[{pos}];'.format(vn=self.varname[w], n=n, pos=ipos))
-                ipos += 1
-        self._ibufsz = ipos  # total length of input array
+        for mem in sorted(mems, key=lambda m: (_trace_sort_key(m.name), m.id)):
+            if isinstance(mem, RomBlock):
+                self._declare_mem(write, mem)
+                hwrite('extern const uint{width}_t {name}[][{limbs}];'.format(
+                    name=self.varname[mem], width=self._memwidth(mem),
+                    limbs=self._limbs(mem)))
+            else:
+                self._declare_mem(state.append, mem)
+
+        # declare registers, whose values are part of the state
+        wires = sorted(self.block.wirevector_set, key=lambda w: _trace_sort_key(w.name))
+        for w in wires:
+            if isinstance(w, Register):
+                self._declare_state_wv(state.append, w)
+        for w in sorted(self.block.wirevector_subset(Const), key=lambda w: (w.bitwidth, w.val)):
+            self._declare_wv(hwrite, w)
+
+        # split the logic into chunks, and find the wires needed outside of their chunk
+        nets = [net for net in self.block if net.op not in 'r@']  # topological order
+        groups = self._partition(nets) if self.parallel else [nets]
+        chunks, parts = [], []  # parts are the chunks of each group
+        for group in groups:
+            size = self.chunk_size or max(len(group), 1)
+            parts.append(range(len(chunks), len(chunks) + (len(group) + size - 1) // size))
+            chunks.extend(group[i:i+size] for i in range(0, len(group), size))
+        chunks = chunks or [[]]
+        chunk_of = {}
+        for i, chunk in enumerate(chunks):
+            for net in chunk:
+                chunk_of[net.dests[0]] = i
+        shared = set(self.block.wirevector_subset((Input, Output)))
+        shared.update(self._internal)
+        for net in self.block.logic_subset('r@'):
+            shared.update(net.args)
+        for i, chunk in enumerate(chunks):
+            for net in chunk:
+                shared.update(arg for arg in net.args if chunk_of.get(arg, i) != i)
+
+        # the local wires driven by native nets are scalars
+        self._scalars = {net.dests[0]: self._ctype(net.dests[0].bitwidth) for net in nets
+                         if net.dests[0] not in shared and self._is_native(net)}
+        local_decls = [[] for chunk in chunks]
+        for w in wires:
+            if isinstance(w, (Register, Const)):
+                continue
+            if w in shared or w not in chunk_of:
+                self._declare_state_wv(state.append, w)
+            else:
+                self._declare_wv(local_decls[chunk_of[w]].append, w)
 
         # combinational logic
         op_builders = {
@@ -657,16 +1361,84 @@ class CompiledSimulation(object):
             'c': self._build_concat,
             's': self._build_select,
         }
-        for net in self.block:  # topological order
-            if net.op in 'r@':
-                continue  # skip synchronized nets
-            op, param, args, dest = net.op, net.op_param, net.args, net.dests[0]
-            write('// net {op} : {args} -> {dest}'.format(
-                op=op, args=', '.join(self.varname[x] for x in args), dest=self.varname[dest]))
-            op_builders[op](write, op, param, args, dest)
+        hwrite('struct pyrtlsim_state {')
+        header.extend(state or ['uint64_t pyrtlsim_empty;'])
+        hwrite('};')
+        write('EXPORT')
+        write('const uint64_t pyrtlsim_state_size = sizeof(struct pyrtlsim_state);')
+
+        files = []
+        for i, chunk in enumerate(chunks):
+            if len(chunks) == 1:
+                code = main
+                write('static void pyrtlsim_chunk0(struct pyrtlsim_state *s) {')
+            else:
+                code = ['#include "pyrtlsim.h"',
+                        'void pyrtlsim_chunk%d(struct pyrtlsim_state *s) {' % i]
+                hwrite('void pyrtlsim_chunk%d(struct pyrtlsim_state *s);' % i)
+                files.append(('pyrtlsim%d.c' % i, code))
+            if not all(self._is_native(net) for net in chunk):
+                code.append('uint64_t tmp, carry, tmphi, tmplo;')  # temporary variables
+            code.extend(local_decls[i])
+            for net in chunk:
+                op, param, args, dest = net.op, net.op_param, net.args, net.dests[0]
+                code.append('// net {op} : {args} -> {dest}'.format(
+                    op=op, args=', '.join(self.varname[x] for x in args),
+                    dest=self.varname[dest]))
+                if self._is_native(net):
+                    self._build_native(code.append, net)
+                else:
+                    op_builders[op](code.append, op, param, args, dest)
+            code.append('}')
+
+        # functions evaluating the groups of independent logic
+        if len(parts) > 1:
+            for g, part in enumerate(parts):
+                write('static void pyrtlsim_part%d(struct pyrtlsim_state *s) {' % g)
+                for i in part:
+                    write('pyrtlsim_chunk%d(s);' % i)
+                write('}')
+            write('static void (*const pyrtlsim_parts[])(struct pyrtlsim_state *) = {%s};'
+                  % ', '.join('pyrtlsim_part%d' % g for g in range(len(parts))))
+
+        # single step function
+        write('static void sim_run_step(struct pyrtlsim_state *s, '
+              'uint64_t inputs[], uint64_t outputs[], uint64_t traces[]) {')
+
+        # inputs copied in
+        inputs = sorted(self.block.wirevector_subset(Input), key=lambda w: _trace_sort_key(w.name))
+        self._inputpos = {}  # for each input wire, start and number of elements in input array
+        self._inputbw = {}  # bitwidth of each input wire
+        ipos = 0
+        for w in inputs:
+            self._inputpos[w.name] = ipos, self._limbs(w)
+            self._inputbw[w.name] = w.bitwidth
+            for n in range(self._limbs(w)):
+                write('{vn}[{n}] = inputs[{pos}];'.format(vn=self.varname[w], n=n, pos=ipos))
+                ipos += 1
+        self._ibufsz = ipos  # total length of input array
+
+        if len(parts) > 1:
+            write('#pragma omp parallel for schedule(dynamic, 1)')
+            write('for (int part = 0; part < {}; part++) {{'.format(len(parts)))
+            write('pyrtlsim_parts[part](s);')
+            write('}')
+        else:
+            for i in range(len(chunks)):
+                write('pyrtlsim_chunk%d(s);' % i)
+
+        # internal wires copied to the trace buffer (before the registers are updated)
+        self._tracepos = {}  # for each traced internal wire, start and number of elements
+        tpos = 0
+        for w in sorted(self._internal, key=lambda w: _trace_sort_key(w.name)):
+            self._tracepos[w.name] = tpos, self._limbs(w)
+            for n in range(self._limbs(w)):
+                write('traces[{pos}] = {vn}[{n}];'.format(pos=tpos, vn=self.varname[w], n=n))
+                tpos += 1
+        self._tbufsz = tpos  # total length of trace array
 
         # memory writes
-        for net in self.block.logic_subset('@'):
+        for net in [net for net in self.block if net.op == '@']:
             mem = net.op_param[1]
             write('if ({enable}[0]) {{'.format(enable=self.varname[net.args[2]]))
             for n in range(self._limbs(mem)):
@@ -678,7 +1450,8 @@ class CompiledSimulation(object):
             write('}')
 
         # register updates
-        regnets = list(self.block.logic_subset('r'))
+        regnets = sorted(self.block.logic_subset('r'),
+                         key=lambda net: _trace_sort_key(net.dests[0].name))
         for x, net in enumerate(regnets):
             rin = net.args[0]
             write('uint64_t regtmp{x}[{limbs}];'.format(x=x, limbs=self._limbs(rin)))
@@ -691,7 +1464,9 @@ class CompiledSimulation(object):
                 write('{vn}[{n}] = regtmp{x}[{n}];'.format(vn=self.varname[rout], x=x, n=n))
 
         # output copied out
-        outputs = list(self.block.wirevector_subset(Output))
+        outputs = sorted(self.block.wirevector_subset(Output),
+                         key=lambda w: _trace_sort_key(w.name))
+        self._asserts = [w for w in outputs if w in self.block.rtl_assert_dict]
         self._outputpos = {}  # for each output wire, start and number of elements in output array
         opos = 0
         for w in outputs:
@@ -704,23 +1479,112 @@ class CompiledSimulation(object):
 
         # entry point
         write('EXPORT')
-        write('void sim_run_all(uint64_t stepcount, uint64_t inputs[], uint64_t outputs[]) {')
-        write('uint64_t input_pos = 0, output_pos = 0;')
+        write('uint64_t sim_run_all(struct pyrtlsim_state *s, uint64_t stepcount, '
+              'uint64_t inputs[], uint64_t outputs[], uint64_t traces[], uint64_t *failed) {')
+        write('uint64_t input_pos = 0, output_pos = 0, trace_pos = 0;')
         write('for (uint64_t stepnum = 0; stepnum < stepcount; stepnum++) {')
-        write('sim_run_step(inputs+input_pos, outputs+output_pos);')
+        write('sim_run_step(s, inputs+input_pos, outputs+output_pos, traces+trace_pos);')
+        # stop right after the first step in which an rtl_assert fails
+        for n, w in enumerate(self._asserts):
+            write('if (!{vn}[0]) {{ *failed = {id}; return stepnum+1; }}'.format(
+                vn=self.varname[w], id=n+1))
         write('input_pos += {};'.format(self._ibufsz))
         write('output_pos += {};'.format(self._obufsz))
-        write('}}')
+        write('trace_pos += {};'.format(self._tbufsz))
+        write('}')
+        write('return stepcount;')
+        write('}')
+
+        files = [('pyrtlsim.h', header), ('pyrtlsim.c', main)] + files
+        return [(name, '\n'.join(code) + '\n') for name, code in files]
 
     def __del__(self):
-        """Handle removal of the DLL when the simulator is deleted."""
-        if self._dll is not None:
-            handle = self._dll._handle
-            if platform.system() == 'Windows':
-                _ctypes.FreeLibrary(handle)  # pylint: disable=no-member
-            else:
-                _ctypes.dlclose(handle)  # pylint: disable=no-member
-            self._dll = None
-        if self._dir is not None:
+        """Handle removal of the build directory if the library was never loaded."""
+        if getattr(self, '_dir', None) is not None:
             shutil.rmtree(self._dir)
             self._dir = None
+
+
+class _Library(object):
+    """A loaded simulation library, unloaded (and its files removed) once unused.
+
+    It is shared by all the simulations using it, which hold their own state.
+    """
+
+    def __init__(self, directory):
+        self.dir = directory
+        self.dll = ctypes.CDLL(path.join(directory, 'pyrtlsim.so'))
+        self.run = self.dll.sim_run_all
+        self.run.restype = ctypes.c_uint64
+        self.run.argtypes = [ctypes.c_void_p, ctypes.c_uint64, ctypes.c_void_p,
+                             ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+
+        # kept here as the module may already be torn down when this is deleted
+        if platform.system() == 'Windows':
+            self._unload = _ctypes.FreeLibrary  # pylint: disable=no-member
+        else:
+            self._unload = _ctypes.dlclose  # pylint: disable=no-member
+        self._rmtree = shutil.rmtree
+
+    def __del__(self):
+        if self.dll is not None:
+            handle = self.dll._handle
+            self.dll = self.run = None
+            self._unload(handle)
+        self._rmtree(self.dir, ignore_errors=True)
+
+
+def _cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+_compiler_versions = []
+
+
+def _compiler_version():
+    """The version of gcc, which is part of the key of the cached libraries."""
+    if not _compiler_versions:
+        try:
+            version = subprocess.check_output(['gcc', '--version'],
+                                              shell=(platform.system() == 'Windows'))
+        except (OSError, subprocess.CalledProcessError):
+            version = b''
+        _compiler_versions.append(version)
+    return _compiler_versions[0]
+
+
+_cpu_targets = []
+
+
+def _cpu_target():
+    """The cpu that -march=native compiles for, which is part of the key of the cached
+    libraries, so that a cache shared between hosts never hands one a library using
+    instructions its cpu does not have.
+
+    This is the cpu model and feature flags (from /proc/cpuinfo, where there is one),
+    along with the target options gcc picks for -march=native.
+    """
+    if not _cpu_targets:
+        parts = []
+        try:
+            with open('/proc/cpuinfo') as f:
+                for line in f:
+                    if not line.strip():
+                        break  # the first processor is enough
+                    field = line.split(':', 1)[0].strip()
+                    if field in ('vendor_id', 'model name', 'flags', 'Features', 'CPU part'):
+                        parts.append(line.strip())
+        except (IOError, OSError):
+            parts.append(platform.processor())
+        try:
+            parts.append(subprocess.check_output(
+                ['gcc', '-march=native', '-Q', '--help=target'],
+                shell=(platform.system() == 'Windows'), stderr=subprocess.STDOUT
+            ).decode('utf-8', 'replace'))
+        except (OSError, subprocess.CalledProcessError):
+            pass
+        _cpu_targets.append('\n'.join(parts))
+    return _cpu_targets[0]
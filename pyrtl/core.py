@@ -10,6 +10,7 @@ Included in this file you will find:
 """
 from __future__ import print_function, unicode_literals
 import collections
+import heapq
 import re
 import keyword
 # from .helperfuncs import _currently_in_ipython
@@ -174,6 +175,109 @@ class LogicNet(collections.namedtuple('LogicNet', ['op', 'op_param', 'args', 'de
     __ge__ = _compare_error
 
 
+class _NetlistSet(set):
+    """ A set of wires or nets that tells the Block owning it whenever it changes.
+
+    Adding a single item is reported with owner._netlist_added(item) so that the
+    block can patch its cached netlist structures, while every other kind of
+    modification is reported with owner._netlist_changed() so that they are dropped.
+    Copies (and the results of the set operators, which python 2 makes without
+    calling __init__) belong to no block.
+    """
+
+    _owner = None
+
+    def __init__(self, iterable=(), owner=None):
+        super(_NetlistSet, self).__init__(iterable)
+        self._owner = owner
+
+    def copy(self):
+        return set(self)
+
+    def _changed(self):
+        if self._owner is not None:
+            self._owner._netlist_changed()
+
+    def add(self, item):
+        if item not in self:
+            super(_NetlistSet, self).add(item)
+            if self._owner is not None:
+                self._owner._netlist_added(self, item)
+
+    def remove(self, item):
+        super(_NetlistSet, self).remove(item)
+        self._changed()
+
+    def discard(self, item):
+        super(_NetlistSet, self).discard(item)
+        self._changed()
+
+    def pop(self):
+        item = super(_NetlistSet, self).pop()
+        self._changed()
+        return item
+
+    def clear(self):
+        super(_NetlistSet, self).clear()
+        self._changed()
+
+    def update(self, *others):
+        super(_NetlistSet, self).update(*others)
+        self._changed()
+
+    def difference_update(self, *others):
+        super(_NetlistSet, self).difference_update(*others)
+        self._changed()
+
+    def intersection_update(self, *others):
+        super(_NetlistSet, self).intersection_update(*others)
+        self._changed()
+
+    def symmetric_difference_update(self, other):
+        super(_NetlistSet, self).symmetric_difference_update(other)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
+_digits = re.compile('([0-9]+)')
+
+
+def _name_sort_key(name):
+    """ A key to sort names by, comparing the numbers in them as numbers.
+
+    So 'tmp9' comes before 'tmp10', and the names made up for unnamed wires (from a
+    global counter) sort in the order they were made, however far the counter has got.
+    """
+    parts = _digits.split(name)
+    parts[1::2] = [int(digits) for digits in parts[1::2]]
+    return parts
+
+
+def _net_sort_key(net):
+    """ A deterministic (name based) ordering of nets, independent of object ids.
+
+    Building the same design again gives the same order, see _name_sort_key.
+    """
+    param = net.op_param[0] if net.op in 'm@' else net.op_param
+    return (tuple(_name_sort_key(w.name) for w in net.dests), net.op,
+            tuple(_name_sort_key(w.name) for w in net.args), param)
+
+
 class Block(object):
     """ Block encapsulates a netlist.
 
@@ -256,6 +360,9 @@ class Block(object):
 
     def __init__(self):
         """Creates an empty hardware block."""
+        self._net_seq = {}  # map from net->sequence number, the order in which nets were added
+        self._next_net_seq = 0
+        self._netlist_cache = None  # (wire_src_dict, wire_dst_dict, topological order or None)
         self.logic = set()  # set of nets, each is a LogicNet named tuple
         self.wirevector_set = set()  # set of all wirevectors
         self.wirevector_by_name = {}  # map from name->wirevector, used for performance
@@ -277,6 +384,84 @@ class Block(object):
         except ImportError:
             return '\n'.join(str(l) for l in self)
 
+    @property
+    def logic(self):
+        """ The set of LogicNets in the block. """
+        return self._logic
+
+    @logic.setter
+    def logic(self, nets):
+        self._net_seq = {}
+        self._logic = _NetlistSet(nets, owner=self)
+        self._netlist_changed()
+
+    @property
+    def wirevector_set(self):
+        """ The set of all WireVectors in the block. """
+        return self._wirevector_set
+
+    @wirevector_set.setter
+    def wirevector_set(self, wires):
+        self._wirevector_set = _NetlistSet(wires, owner=self)
+        self._netlist_changed()
+
+    def _netlist_changed(self):
+        """ Drop the cached connectivity and ordering of the netlist. """
+        self._netlist_cache = None
+
+    def _number_nets(self):
+        """ Make sure every net has a sequence number, and forget those of removed nets.
+
+        Nets added one at a time are numbered as they are added; nets that entered the
+        block in bulk (e.g. by assigning block.logic) are numbered in a deterministic,
+        name based order.
+        """
+        seq = {net: self._net_seq[net] for net in self.logic if net in self._net_seq}
+        for net in sorted((net for net in self.logic if net not in seq), key=_net_sort_key):
+            seq[net] = self._next_net_seq
+            self._next_net_seq += 1
+        self._net_seq = seq
+
+    def _logic_in_order(self):
+        """ The nets of the block, in the order they were added (see _number_nets). """
+        self._number_nets()
+        return sorted(self.logic, key=self._net_seq.__getitem__)
+
+    def _netlist_added(self, container, item):
+        """ Patch the cached connectivity and ordering to account for a single new net.
+
+        New wires do not change the cache.  A new net is appended to the cached
+        topological order when all of its arguments are already available and none of
+        its destinations are used yet (the common case when building up a design);
+        otherwise the order is recomputed the next time it is needed.
+        """
+        if container is not self._logic:
+            return
+        net = item
+        self._net_seq[net] = self._next_net_seq
+        self._next_net_seq += 1
+        if self._netlist_cache is None:
+            return
+        src_dict, dst_dict, order = self._netlist_cache
+        if any(w in src_dict for w in net.dests):
+            self._netlist_changed()  # multiple drivers, let net_connections report it
+            return
+
+        if order is not None:
+            from .wire import Input, Const, Register
+            ready = all(isinstance(w, (Input, Const, Register)) or w in src_dict
+                        for w in net.args)
+            if ready and not any(w in dst_dict for w in net.dests):
+                order.append(net)
+            else:
+                order = None
+
+        for arg in set(net.args):
+            dst_dict.setdefault(arg, []).append(net)
+        for dest in net.dests:
+            src_dict[dest] = net
+        self._netlist_cache = (src_dict, dst_dict, order)
+
     def add_wirevector(self, wirevector):
         """ Add a wirevector object to the block."""
         self.sanity_check_wirevector(wirevector)
@@ -426,6 +611,33 @@ class Block(object):
         Look at input_output.net_graph for one such graph that uses the information
         from this function
         """
+        wire_src_dict, wire_dst_dict = self._cached_net_connections()
+        src_list = dict(wire_src_dict)
+        dst_list = {wire: list(nets) for wire, nets in wire_dst_dict.items()}
+
+        if include_virtual_nodes:
+            from .wire import Input, Output, Const
+            for wire in self.wirevector_subset((Input, Const)):
+                if wire in src_list:
+                    raise PyrtlError('Wire "{}" has multiple drivers (check for multiple '
+                                     'assignments with "<<=" or accidental mixing of "|=" '
+                                     'and "<<=")'.format(wire))
+                src_list[wire] = wire
+
+            for wire in self.wirevector_subset(Output):
+                dst_list.setdefault(wire, []).append(wire)
+
+        return src_list, dst_list
+
+    def _cached_net_connections(self):
+        """ Return the (shared, not to be modified) wire_src_dict and wire_dst_dict.
+
+        These are computed once and then kept up to date as the block changes, see
+        _netlist_added and _netlist_changed.
+        """
+        if self._netlist_cache is not None:
+            return self._netlist_cache[:2]
+
         src_list = {}
         dst_list = {}
 
@@ -443,19 +655,13 @@ class Block(object):
             else:
                 dst_list[edge] = [node]
 
-        if include_virtual_nodes:
-            from .wire import Input, Output, Const
-            for wire in self.wirevector_subset((Input, Const)):
-                add_wire_src(wire, wire)
-
-            for wire in self.wirevector_subset(Output):
-                add_wire_dst(wire, wire)
-
-        for net in self.logic:
+        # in the order the nets were added, so that the lists of users are deterministic
+        for net in self._logic_in_order():
             for arg in set(net.args):  # prevents unexpected duplicates when doing b <<= a & a
                 add_wire_dst(arg, net)
             for dest in net.dests:
                 add_wire_src(dest, net)
+        self._netlist_cache = (src_list, dst_list, None)
         return src_list, dst_list
 
     def _repr_svg_(self):
@@ -469,34 +675,57 @@ class Block(object):
         that all of it's "parents" have already been returned earlier in the iteration.
 
         Note: this method will throw an error if there are loops in the
-        logic that do not involve registers
-        Also, the order of the nets is not guaranteed to be the the same
-        over multiple iterations"""
+        logic that do not involve registers.
+
+        The order is computed once and cached on the block (it is patched or recomputed
+        as the block is modified), so iterating a block many times is cheap.  The order is
+        deterministic: among the nets that are ready at any point, the one that was added
+        to the block earliest comes first."""
+        return iter(self._topological_order()[:])
+
+    def _topological_order(self):
+        """ Return the (shared, not to be modified) cached list of nets in topological order. """
+        self._cached_net_connections()
+        src_dict, dest_dict, order = self._netlist_cache
+        if order is not None:
+            return order
+
         from .wire import Input, Const, Register
-        src_dict, dest_dict = self.net_connections()
-        to_clear = self.wirevector_subset((Input, Const, Register))
-        cleared = set()
-        remaining = self.logic.copy()
-        try:
-            while len(to_clear):
-                wire_to_check = to_clear.pop()
-                cleared.add(wire_to_check)
-                if wire_to_check in dest_dict:
-                    for gate in dest_dict[wire_to_check]:  # loop over logicnets not yet returned
-                        if all(arg in cleared for arg in gate.args):  # if all args ready
-                            yield gate
-                            remaining.remove(gate)
-                            if gate.op != 'r':
-                                to_clear.update(gate.dests)
-        except KeyError as e:
-            import six
-            six.raise_from(PyrtlError("Cannot Iterate through malformed block"), e)
-
-        if len(remaining) != 0:
+        cleared = self.wirevector_subset((Input, Const, Register))
+        # work with positions in the list of nets sorted by sequence number (which are
+        # much cheaper to hash than the nets themselves)
+        nets = sorted(self.logic, key=self._net_seq.__getitem__)
+        users = {}  # wire -> positions of the nets using it
+        waiting = [0] * len(nets)  # number of args of each net not yet produced
+        ready = []  # heap of positions of the nets with all args produced
+        for i, net in enumerate(nets):
+            for arg in set(net.args):
+                users.setdefault(arg, []).append(i)
+                if arg not in cleared:
+                    waiting[i] += 1
+            if not waiting[i]:
+                ready.append(i)  # built in increasing order, so already a heap
+
+        order = []
+        while ready:
+            gate = nets[heapq.heappop(ready)]
+            order.append(gate)
+            if gate.op == 'r':
+                continue  # registers were cleared to begin with
+            for dest in gate.dests:
+                for i in users.get(dest, ()):
+                    waiting[i] -= 1
+                    if not waiting[i]:
+                        heapq.heappush(ready, i)
+
+        if len(order) != len(self.logic):
             from pyrtl.helperfuncs import find_and_print_loop
             find_and_print_loop(self)
             raise PyrtlError("Failure in Block Iterator due to non-register loops")
 
+        self._netlist_cache = (src_dict, dest_dict, order)
+        return order
+
     def sanity_check(self):
         """ Check block and throw PyrtlError or PyrtlInternalError if there is an issue.
 
@@ -102,6 +102,9 @@ def check_rtl_assertions(sim):
         try:
             value = sim.inspect(w)
             if not value:
+                tracer = getattr(sim, 'tracer', None)
+                if tracer is not None:
+                    tracer.assertion_failed(w.name)
                 raise exp
         except KeyError:
             pass
@@ -216,6 +216,70 @@ def input_from_blif(blif, block=None, merge_io_vectors=True, clock_name='clk'):
         extract_commands(model)
 
 
+def input_from_memory_image(image, fmt='hex', bitwidth=None, start=0):
+    """ Read a memory image, returning a dictionary of {address: value}.
+
+    :param image: an open file, or the contents of the file as a string (or bytes)
+    :param fmt: 'hex' or 'bin' for the text formats of Verilog's $readmemh and
+      $readmemb, or 'raw' for a binary file of little endian words
+    :param bitwidth: the bitwidth of the memory, which is needed for 'raw' images
+      (where each word takes bitwidth/8 bytes, rounded up) and otherwise used to check
+      that the values fit
+    :param start: the address of the first value in the image
+    :return: a dictionary of {address: value}, as can be passed in the memory_value_map
+      of any of the simulations
+
+    In the text formats the values are separated by whitespace, may contain _ as a
+    separator, and '@' followed by a hex address moves to that address.  Comments in
+    // and /* */ are ignored. ::
+
+        with open('program.hex') as f:
+            sim = pyrtl.Simulation(memory_value_map={imem: input_from_memory_image(f)},
+                                   dense_memories=True)
+    """
+    if fmt not in ('hex', 'bin', 'raw'):
+        raise PyrtlError('unknown memory image format "%s", expected hex, bin, or raw' % fmt)
+    try:
+        data = image.read()
+    except AttributeError:
+        data = image
+
+    contents = {}
+    if fmt == 'raw':
+        if bitwidth is None:
+            raise PyrtlError('the bitwidth is needed to read a raw memory image')
+        data = bytearray(data)
+        wordsize = (bitwidth + 7) // 8
+        if len(data) % wordsize:
+            raise PyrtlError('raw memory image is not a whole number of %d byte words'
+                             % wordsize)
+        for i in range(len(data) // wordsize):
+            word = data[i * wordsize:(i + 1) * wordsize]
+            contents[start + i] = sum(b << (8 * j) for j, b in enumerate(word))
+    else:
+        if isinstance(data, bytes):
+            data = data.decode('ascii')
+        data = re.sub(r'//[^\n]*|/\*.*?\*/', ' ', data, flags=re.DOTALL)
+        base = 16 if fmt == 'hex' else 2
+        addr = start
+        for token in data.split():
+            try:
+                if token.startswith('@'):
+                    addr = int(token[1:], 16)
+                    continue
+                contents[addr] = int(token.replace('_', ''), base)
+            except ValueError:
+                raise PyrtlError('cannot read "%s" in a %s memory image' % (token, fmt))
+            addr += 1
+
+    if bitwidth is not None:
+        for addr, value in contents.items():
+            if value >> bitwidth:
+                raise PyrtlError('value %s at address %s does not fit in %d bits'
+                                 % (value, addr, bitwidth))
+    return contents
+
+
 # ----------------------------------------------------------------
 #    __       ___  __       ___
 #   /  \ |  |  |  |__) |  |  |
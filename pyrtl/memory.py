@@ -260,6 +260,19 @@ class MemBlock(_MemReadBase):
                         block=block)
 
 
+class _RomTable(dict):
+    """ The values of a RomBlock by address, each read from the ROM when first indexed. """
+    __slots__ = ('_rom',)
+
+    def __init__(self, rom):
+        super(_RomTable, self).__init__()
+        self._rom = rom
+
+    def __missing__(self, address):
+        value = self[address] = self._rom._get_read_data(address)
+        return value
+
+
 class RomBlock(_MemReadBase):
     """ PyRTL Read Only Memory.
 
@@ -299,6 +312,7 @@ class RomBlock(_MemReadBase):
         self.build_new_roms = build_new_roms
         self.current_copy = self
         self.pad_with_zeros = pad_with_zeros
+        self._table_memo = None  # (romdata function, its _RomTable) once one is made
 
     def __getitem__(self, item):
         import numbers
@@ -346,6 +360,45 @@ class RomBlock(_MemReadBase):
                              .format(value, self))
         return value
 
+    # the largest ROMs given as a list that the simulations will copy into a table
+    _max_table_addrwidth = 20
+
+    def _get_table(self):
+        """ The (validated) values of the ROM by address, for the simulations to index.
+
+        A ROM given as a list (or tuple) is copied into a tuple of the values at every
+        address, a snapshot of the list when it is asked for.  This is None if the ROM
+        is too big for a tuple, or if reading some address is an error (then
+        _get_read_data is left to report it, if that address is ever read).
+
+        Any other ROM gets a _RomTable, which reads each address the first time it is
+        indexed and remembers its value, so that a big ROM only ever reads the addresses
+        that are used.  For a function the table is kept (until the function is
+        replaced), as calling it can be expensive, so it is called once per address.
+        """
+        import types
+        if isinstance(self.data, (list, tuple)):
+            if self.addrwidth > self._max_table_addrwidth:
+                return None
+            size = 1 << self.addrwidth
+            table = tuple(self.data[:size])
+            if len(table) < size:
+                if not self.pad_with_zeros:
+                    return None
+                table += (0,) * (size - len(table))
+            try:
+                if table and (min(table) < 0 or max(table) >= 2**self.bitwidth):
+                    return None
+            except TypeError:
+                return None
+            return table
+
+        if not isinstance(self.data, types.FunctionType):
+            return _RomTable(self)
+        if self._table_memo is None or self._table_memo[0] is not self.data:
+            self._table_memo = (self.data, _RomTable(self))
+        return self._table_memo[1]
+
     def _build_read_port(self, addr):
         if self.build_new_roms and \
                 (self.current_copy.read_ports >= self.current_copy.max_read_ports):
@@ -0,0 +1,170 @@
+"""Run many independent simulations of the same block across a pool of processes.
+
+The block is pickled once and sent to each worker process, which builds its simulator
+a single time and then runs job after job on it, restoring a checkpoint of the initial
+state between jobs.  Results are streamed back as each job finishes, and a job that
+raises an exception (such as a failing rtl_assert) fails on its own.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import collections
+import pickle
+import traceback
+import six
+
+from .pyrtlexceptions import PyrtlError
+from .core import working_block
+from .simulation import Simulation, FastSimulation, SimulationTrace
+from .compilesim import CompiledSimulation
+
+
+__all__ = ['parallel_step_multiple', 'JobResult']
+
+
+class JobResult(collections.namedtuple('JobResult', ['index', 'passed', 'report', 'trace'])):
+    """ The outcome of one job run by parallel_step_multiple.
+
+    index is the position of the job in the list of jobs, passed is False if any expected
+    output did not match or the job raised an exception, report is the text step_multiple
+    wrote about the mismatches (followed by the traceback of the exception, if any), and
+    trace is a SimulationTrace of the job up to where it stopped (or None if traces were
+    not requested).
+    """
+    __slots__ = ()
+
+
+def parallel_step_multiple(jobs, simulation=FastSimulation, max_workers=None, trace=False,
+                           wires_to_track=None, register_value_map=None,
+                           memory_value_map=None, block=None, **kwargs):
+    """ Run many independent step_multiple jobs on a block, spread over several processes.
+
+    :param jobs: a list of jobs, each a dictionary with the keyword arguments to
+      step_multiple (provided_inputs, and optionally expected_outputs, nsteps and
+      stop_after_first_error)
+    :param simulation: the simulation class to use (Simulation, FastSimulation or
+      CompiledSimulation, or a subclass of one of them)
+    :param max_workers: the number of processes to use, defaults to the number of cores
+    :param trace: if True, a SimulationTrace of each job is sent back with its result
+    :param wires_to_track: names of the wires to trace, defaults to the usual named wires
+    :param register_value_map: the initial value of registers at the start of every job
+    :param memory_value_map: the initial value of memories at the start of every job
+    :param block: the block to simulate, defaults to the working block
+    :param kwargs: further arguments to the simulation class, such as mode or
+      dense_memories
+    :return: a generator of JobResult, yielded in the order that the jobs finish
+
+    Each job starts from the same initial state, as if it were run on a freshly created
+    simulation.  The simulation class is built only once per worker process, so the cost
+    of building a FastSimulation or compiling a CompiledSimulation is paid once per
+    process rather than once per job.  An exception raised by a job, such as the
+    exception of a failing rtl_assert or a PyrtlError about bad inputs, only fails that
+    job, with the traceback in its report. ::
+
+        jobs = [{'provided_inputs': {'a': ins}, 'expected_outputs': {'o': outs}}
+                for ins, outs in testcases]
+        for result in pyrtl.parallel_step_multiple(jobs, max_workers=8):
+            if not result.passed:
+                print(result.index, result.report)
+    """
+    try:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+    except ImportError:
+        raise PyrtlError('parallel_step_multiple needs concurrent.futures (python 3)')
+    if not (isinstance(simulation, type) and
+            issubclass(simulation, (Simulation, FastSimulation, CompiledSimulation))):
+        raise PyrtlError('parallel_step_multiple can only run Simulation, FastSimulation '
+                         'or CompiledSimulation')
+    if 'tracer' in kwargs:
+        raise PyrtlError('the tracer of parallel_step_multiple is chosen by trace')
+
+    block = working_block(block)
+    block.sanity_check()
+    if wires_to_track is not None:
+        wires_to_track = [w.name if not isinstance(w, six.string_types) else w
+                          for w in wires_to_track]
+    # the worker processes have their own copies of the wires and memories, so
+    # the initial state is sent by register name and memory id
+    regs = {r.name: v for r, v in (register_value_map or {}).items()}
+    mems = {m.id: dict(v) for m, v in (memory_value_map or {}).items()}
+    setup = pickle.dumps((block, simulation, regs, mems, trace, wires_to_track, kwargs),
+                         pickle.HIGHEST_PROTOCOL)
+
+    jobs = list(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(setup,)) as executor:
+        futures = [executor.submit(_run_job, index, job) for index, job in enumerate(jobs)]
+        for future in as_completed(futures):
+            index, passed, report, values = future.result()
+            sim_trace = None
+            if values is not None:
+                sim_trace = SimulationTrace(
+                    wires_to_track=[block.wirevector_by_name[name] for name in values],
+                    block=block)
+                for name, vals in values.items():
+                    sim_trace.trace[name].extend(vals)
+            yield JobResult(index, passed, report, sim_trace)
+
+
+class _Worker(object):
+    """ The simulation held by one worker process, reset to its initial state per job. """
+
+    def __init__(self, setup):
+        block, simulation, regs, mems, trace, wires_to_track, kwargs = pickle.loads(setup)
+        self.block = block
+        self.simulation = simulation
+        self.trace = trace
+        self.wires_to_track = wires_to_track
+        register_value_map = {block.wirevector_by_name[name]: v for name, v in regs.items()}
+        memory_value_map = {}
+        for net in block.logic_subset('m@'):
+            mem = net.op_param[1]
+            if mem.id in mems:
+                memory_value_map[mem] = mems[mem.id]
+
+        self.sim = simulation(tracer=self._tracer(), register_value_map=register_value_map,
+                              memory_value_map=memory_value_map, block=block, **kwargs)
+        self.initial_state = self.sim.checkpoint()
+
+    def _tracer(self):
+        # CompiledSimulation needs a tracer to inspect outputs, the others can go without
+        if not self.trace and not issubclass(self.simulation, CompiledSimulation):
+            return None
+        wires = None
+        if self.trace and self.wires_to_track is not None:
+            wires = [self.block.wirevector_by_name[name] for name in self.wires_to_track]
+        return SimulationTrace(wires_to_track=wires, block=self.block)
+
+    def reset(self):
+        """ Put the simulation back into its initial state, with an empty trace. """
+        sim = self.sim
+        sim.restore(self.initial_state)
+        sim.tracer = self._tracer()
+        if isinstance(sim, CompiledSimulation):
+            sim._remove_untraceable()
+
+    def run(self, job):
+        self.reset()
+        report = six.StringIO()
+        failed = False
+        try:
+            self.sim.step_multiple(file=report, **job)
+        except Exception:
+            report.write(traceback.format_exc())
+            failed = True
+        values = None
+        if self.trace:
+            values = {name: list(vals) for name, vals in self.sim.tracer.trace.items()}
+        return not failed and not report.getvalue(), report.getvalue(), values
+
+
+_worker = None
+
+
+def _init_worker(setup):
+    global _worker
+    _worker = _Worker(setup)
+
+
+def _run_job(index, job):
+    return (index,) + _worker.run(job)
@@ -6,7 +6,8 @@ ways to change a block.
 
 from __future__ import print_function, unicode_literals
 
-from .core import working_block, set_working_block, debug_mode, LogicNet, PostSynthBlock
+from .core import (working_block, set_working_block, debug_mode, LogicNet, PostSynthBlock,
+                   _net_sort_key, _name_sort_key)
 from .helperfuncs import _NetCount
 from .corecircuits import (_basic_mult, _basic_add, _basic_sub, _basic_eq,
                            _basic_lt, _basic_gt, _basic_select, concat_list,
@@ -284,7 +285,8 @@ def _has_normal_dest_wire(net):
 def _process_nets_to_discard(nets, wire_map, unnecessary_nets):
     if len(nets) == 1:
         return  # also deals with nets with no dest wires
-    nets_to_consider = list(filter(_has_normal_dest_wire, nets))
+    # keep the first by name, so that optimizing the same design always gives the same block
+    nets_to_consider = sorted(filter(_has_normal_dest_wire, nets), key=_net_sort_key)
 
     if len(nets_to_consider) > 1:  # needed to handle cases with only special wires
         net_to_keep = nets_to_consider[0]
@@ -403,7 +405,8 @@ def synthesize(update_working_block=True, block=None):
         # Next, create all of the new wires for the new block
         # from the original wires and store them in the wirevector_map
         # for reference.
-        for wirevector in block_in.wirevector_subset():
+        for wirevector in sorted(block_in.wirevector_subset(),
+                                 key=lambda w: _name_sort_key(w.name)):
             for i in range(len(wirevector)):
                 new_name = '_'.join((wirevector.name, 'synth', str(i)))
                 if isinstance(wirevector, Const):
@@ -416,12 +419,18 @@ def synthesize(update_working_block=True, block=None):
                 wirevector_map[(wirevector, i)] = new_wirevector
 
         # Now connect up the inputs and outputs to maintain the interface
-        for wirevector in block_in.wirevector_subset(Input):
+        for wirevector in sorted(block_in.wirevector_subset(Input),
+                                 key=lambda w: _name_sort_key(w.name)):
             input_vector = Input(name=wirevector.name, bitwidth=len(wirevector))
             for i in range(len(wirevector)):
                 wirevector_map[(wirevector, i)] <<= input_vector[i]
-        for wirevector in block_in.wirevector_subset(Output):
+        # the rtl_asserts of the block are kept, on the outputs of the same name
+        asserts = {w.name: exp for w, exp in block_pre.rtl_assert_dict.items()}
+        for wirevector in sorted(block_in.wirevector_subset(Output),
+                                 key=lambda w: _name_sort_key(w.name)):
             output_vector = Output(name=wirevector.name, bitwidth=len(wirevector))
+            if wirevector.name in asserts:
+                block_out.rtl_assert_dict[output_vector] = asserts[wirevector.name]
             # the "reversed" is needed because most significant bit comes first in concat
             output_bits = [wirevector_map[(wirevector, i)]
                            for i in range(len(output_vector))]
@@ -430,7 +439,7 @@ def synthesize(update_working_block=True, block=None):
         # Now that we have all the wires built and mapped, walk all the blocks
         # and map the logic to the equivalent set of primitives in the system
         out_mems = block_out.mem_map  # dictionary: PreSynth Map -> PostSynth Map
-        for net in block_in.logic:
+        for net in block_in._logic_in_order():
             _decompose(net, wirevector_map, out_mems, block_out)
 
     if update_working_block:
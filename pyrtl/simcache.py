@@ -0,0 +1,127 @@
+"""Helpers for the on-disk caches of generated simulation code.
+
+The simulators that generate code (FastSimulation, CompiledSimulation) can store the
+result in a cache directory, keyed by a hash of the generated code itself, so that
+building the same design again (for example in every test case of a test suite) can skip
+the expensive compile step.  Entries are written atomically, so that several processes
+can share one cache directory.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import os
+import sys
+import hashlib
+import tempfile
+import contextlib
+
+
+def cache_dir(kind, directory=None):
+    """ The directory in which to cache generated code of the given kind.
+
+    :param kind: the subdirectory for one kind of cached code (e.g. 'fastsim')
+    :param directory: the cache directory to use, defaults to $PYRTL_CACHE_DIR, or
+      else pyrtl in the user's cache directory ($XDG_CACHE_HOME or ~/.cache)
+    """
+    if directory is None:
+        directory = os.environ.get('PYRTL_CACHE_DIR')
+    if directory is None:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        directory = os.path.join(base, 'pyrtl')
+    return os.path.join(directory, kind)
+
+
+def python_tag():
+    """ A tag for the running python, as marshalled code is specific to its version. """
+    implementation = getattr(sys, 'implementation', None)
+    if implementation is not None and implementation.cache_tag:
+        return implementation.cache_tag
+    return 'py%d%d' % sys.version_info[:2]
+
+
+def content_key(*parts):
+    """ The hex sha256 digest of the given strings (or bytes). """
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part.encode('utf-8')
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def read(path):
+    """ The contents of a cache entry, or None if it is not there (or unreadable). """
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def _makedirs(directory):
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        return os.path.isdir(directory)  # maybe made by someone else in the meantime
+    return True
+
+
+def write(path, data):
+    """ Atomically create a cache entry, ignoring any errors (the cache is optional). """
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    directory = os.path.dirname(path)
+    if not _makedirs(directory):
+        return False
+    try:
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)  # mkstemp makes it private, but the cache may be shared
+            os.rename(tmp, path)  # atomic on posix, so readers never see a partial entry
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except (IOError, OSError):
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def lock(path):
+    """ Hold an exclusive lock on the given lock file while in the with statement.
+
+    This keeps several processes from doing the same expensive work to create an entry
+    at once.  It is only a best effort: where there is no fcntl (or the lock file
+    cannot be created) it does not lock at all, which is still safe as entries are
+    written atomically.  The lock file is removed again when the lock is released, so
+    that the cache is not left with a lock file for every entry (a process still
+    waiting on the removed file gets the lock once it is released, and finds the entry
+    made in the meantime).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    f = None
+    if fcntl is not None and _makedirs(os.path.dirname(path)):
+        try:
+            f = open(path, 'a')
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        except (IOError, OSError):
+            if f is not None:
+                f.close()
+            f = None
+    try:
+        yield
+    finally:
+        if f is not None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already removed, by a process that held the lock before
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
@@ -2,17 +2,29 @@
 
 from __future__ import print_function, unicode_literals
 
+import os
+import io
 import sys
 import re
+import heapq
+import marshal
 import numbers
+import operator
 import collections
+import itertools
+import copy
+import array
+import pickle
+import zlib
+import six
 
 from .pyrtlexceptions import PyrtlError, PyrtlInternalError
-from .core import working_block, PostSynthBlock, _PythonSanitizer
+from .core import working_block, Block, PostSynthBlock, _name_sort_key
 from .wire import Input, Register, Const, Output, WireVector
 from .memory import RomBlock
 from .helperfuncs import check_rtl_assertions, _currently_in_ipython
 from .verilog import _VerilogSanitizer
+from . import simcache
 
 # ----------------------------------------------------------------
 #    __                         ___    __
@@ -31,9 +43,36 @@ class Simulation(object):
     * *.tracer*: stores the SimulationTrace in which results are stored
     * *.value*: a map from every signal in the block to its current simulation value
     * *.regvalue*: a map from register to its value on the next tick
-    * *.memvalue*: a map from memid to a dictionary of address: value
+    * *.memvalue*: a map from memid to a dictionary of address: value (or a
+      DenseMemory, which acts like one)
+
+    The default evaluation mode ('interpret') walks the nets and looks up every
+    argument by WireVector on each cycle.  Passing mode='slots' instead lowers the
+    block once into a flat list of integer "slots" (one per wire) and a precompiled
+    closure for every net, so that each step only indexes into a Python list.  In
+    that mode *.value* and *.regvalue* are live views of the slot lists and remain
+    usable for debugging just as before.
+
+    Passing mode='event' uses the same slots and closures, but is activity based:
+    each cycle only the nets downstream of inputs, registers, or memories whose
+    values actually changed since the last cycle are re-evaluated.  For designs
+    that are mostly idle this is much faster than evaluating every net each cycle.
     """
 
+    modes = ('interpret', 'slots', 'event')
+
+    _slot_binary_func = {  # same semantics as simple_func, but as C-level callables
+        '&': operator.and_,
+        '|': operator.or_,
+        '^': operator.xor,
+        '+': operator.add,
+        '-': operator.sub,
+        '*': operator.mul,
+        '<': operator.lt,  # the bool results become ints when masked
+        '>': operator.gt,
+        '=': operator.eq,
+    }
+
     simple_func = {  # OPS
         'w': lambda x: x,
         '~': lambda x: ~x,
@@ -52,7 +91,7 @@ class Simulation(object):
 
     def __init__(
             self, tracer=True, register_value_map=None, memory_value_map=None,
-            default_value=0, block=None):
+            default_value=0, block=None, mode='interpret', dense_memories=False):
         """ Creates a new circuit simulator
 
         :param tracer: an instance of SimulationTrace used to store execution results.
@@ -70,6 +109,14 @@ class Simulation(object):
           use the value stored in the object (default to 0)
         :param block: the hardware block to be traced (which might be of type PostSynthesisBlock).
           defaults to the working block
+        :param mode: the evaluation strategy to use, one of Simulation.modes.  'interpret'
+          (the default) evaluates each net directly from the netlist every cycle, while
+          'slots' precompiles the block into per-net closures over a flat list of values.
+          'event' uses the same closures but only re-evaluates nets whose inputs changed.
+        :param dense_memories: if True, memories with an addrwidth of up to
+          DenseMemory.max_addrwidth (20) are held as a DenseMemory, a list with an entry
+          for every address, which is faster to read and write than a dictionary.  The
+          memory_value_map is then copied into the simulation rather than used directly.
 
         Warning: Simulation initializes some things when called with __init__,
         so changing items in the block for Simulation will likely break
@@ -82,7 +129,12 @@ class Simulation(object):
 
         block = working_block(block)
         block.sanity_check()  # check that this is a good hw block
+        if mode not in self.modes:
+            raise PyrtlError('unknown simulation mode "%s", expected one of %s'
+                             % (mode, self.modes))
 
+        self.mode = mode
+        self.dense_memories = dense_memories
         self.value = {}  # map from signal->value
         self.regvalue = {}  # map from register->value on next tick
         self.memvalue = {}  # map from {memid :{address: value}}
@@ -119,10 +171,14 @@ class Simulation(object):
 
         # set memories to their passed values
 
+        self._rom_tables = {}  # memid -> the values of the RomBlock (or None, see _get_table)
         for mem_net in self.block.logic_subset('m@'):
-            memid = mem_net.op_param[1].id
-            if memid not in self.memvalue:
-                self.memvalue[memid] = {}
+            mem = mem_net.op_param[1]
+            if isinstance(mem, RomBlock) and mem.id not in self._rom_tables:
+                self._rom_tables[mem.id] = mem._get_table()
+            if mem.id not in self.memvalue:
+                dense = _dense_memory(mem, default_value, self.dense_memories)
+                self.memvalue[mem.id] = {} if dense is None else dense
 
         if memory_value_map is not None:
             for (mem, mem_map) in memory_value_map.items():
@@ -130,7 +186,6 @@ class Simulation(object):
                     raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
                 if isinstance(self.block, PostSynthBlock):
                     mem = self.block.mem_map[mem]  # pylint: disable=maybe-no-member
-                self.memvalue[mem.id] = mem_map
                 max_addr_val, max_bit_val = 2**mem.addrwidth, 2**mem.bitwidth
                 for (addr, val) in mem_map.items():
                     if addr < 0 or addr >= max_addr_val:
@@ -139,6 +194,10 @@ class Simulation(object):
                     if val < 0 or val >= max_bit_val:
                         raise PyrtlError('error, %s at %s in %s outside of bounds' %
                                          (str(val), str(addr), mem.name))
+                if isinstance(self.memvalue.get(mem.id), DenseMemory):
+                    self.memvalue[mem.id].update(mem_map)
+                else:
+                    self.memvalue[mem.id] = mem_map
 
         # set all other variables to default value
         for w in self.block.wirevector_set:
@@ -149,6 +208,11 @@ class Simulation(object):
         self.reg_update_nets = tuple((self.block.logic_subset('r')))
         self.mem_update_nets = tuple((self.block.logic_subset('@')))
 
+        if self.mode in ('slots', 'event'):
+            self._initialize_slots()
+        if self.mode == 'event':
+            self._initialize_events()
+
     def step(self, provided_inputs):
         """ Take the simulation forward one cycle
 
@@ -194,24 +258,29 @@ class Simulation(object):
             for i in input_set.difference(supplied_inputs):
                 raise PyrtlError('Input "%s" has no input value specified' % i.name)
 
-        self.value.update(self.regvalue)  # apply register updates from previous step
+        if self.mode == 'slots':
+            self._step_slots()
+        elif self.mode == 'event':
+            self._step_events()
+        else:
+            self.value.update(self.regvalue)  # apply register updates from previous step
 
-        for net in self.ordered_nets:
-            self._execute(net)
+            for net in self.ordered_nets:
+                self._execute(net)
 
-        # Do all of the mem operations based off the new values changed in _execute()
-        for net in self.mem_update_nets:
-            self._mem_update(net)
+            # Do all of the mem operations based off the new values changed in _execute()
+            for net in self.mem_update_nets:
+                self._mem_update(net)
 
-        # at the end of the step, record the values to the trace
-        # print self.value # Helpful Debug Print
-        if self.tracer is not None:
-            self.tracer.add_step(self.value)
+            # at the end of the step, record the values to the trace
+            # print self.value # Helpful Debug Print
+            if self.tracer is not None:
+                self.tracer.add_step(self.value)
 
-        # Do all of the reg updates based off of the new values
-        for net in self.reg_update_nets:
-            argval = self.value[net.args[0]]
-            self.regvalue[net.dests[0]] = self._sanitize(argval, net.dests[0])
+            # Do all of the reg updates based off of the new values
+            for net in self.reg_update_nets:
+                argval = self.value[net.args[0]]
+                self.regvalue[net.dests[0]] = self._sanitize(argval, net.dests[0])
 
         # finally, if any of the rtl_assert assertions are failing then we should
         # raise the appropriate exceptions
@@ -354,6 +423,62 @@ class Simulation(object):
         """
         return self.memvalue[mem.id]
 
+    def checkpoint(self):
+        """ Capture the state of the simulation so that it can be resumed later.
+
+        :return: a compact (compressed) bytes object holding the value every register
+          will take on the next cycle and the contents of every memory
+
+        The checkpoint can be passed to restore() on this or any other simulation
+        (Simulation, FastSimulation, or CompiledSimulation) of the same block.  The
+        tracer is not part of the checkpoint.
+        """
+        regs = {r.name: self.regvalue.get(r, self.value[r])
+                for r in self.block.wirevector_subset(Register)}
+        mems = {name: self.memvalue[mem.id] for name, mem in _state_mems(self.block).items()}
+        return _pack_checkpoint(regs, mems)
+
+    def restore(self, checkpoint):
+        """ Return the simulation to the state captured by checkpoint().
+
+        :param checkpoint: the bytes returned by checkpoint()
+        """
+        regs, mems = _unpack_checkpoint(checkpoint)
+        for name, val in regs.items():
+            reg = self.block.wirevector_by_name.get(name)
+            if not isinstance(reg, Register):
+                raise PyrtlError('checkpoint has a value for unknown register "%s"' % name)
+            self.regvalue[reg] = val
+        known = _state_mems(self.block)
+        for name in mems:
+            if name not in known:
+                raise PyrtlError('checkpoint has the contents of unknown memory "%s"' % name)
+        for name, mem in mems.items():
+            memid = known[name].id
+            self.memvalue[memid].clear()
+            self.memvalue[memid].update(mem)
+        if self.mode == 'event':
+            # memories (and so their readers) may have changed, so start over
+            self._pending[:] = range(len(self._net_funcs))
+            self._queued[:] = bytearray([1]) * len(self._net_funcs)
+
+    def fork(self):
+        """ Make an independent copy of the simulation in its current state.
+
+        :return: a new simulation that continues from where this one is, with a new
+          (empty) tracer tracking the same wires
+
+        This is handy to, for example, boot a design once and then run many different
+        experiments from that point.
+        """
+        tracer = None
+        if self.tracer is not None:
+            tracer = SimulationTrace(wires_to_track=self.tracer.wires_to_track, block=self.block)
+        sim = type(self)(tracer=tracer, default_value=self.default_value, block=self.block,
+                         mode=self.mode, dense_memories=self.dense_memories)
+        sim.restore(self.checkpoint())
+        return sim
+
     @staticmethod
     def _sanitize(val, wirevector):
         """Return a modified version of val that would fit in wirevector.
@@ -391,7 +516,13 @@ class Simulation(object):
             mem = net.op_param[1]
             read_addr = self.value[net.args[0]]
             if isinstance(mem, RomBlock):
-                result = mem._get_read_data(read_addr)
+                table = self._rom_tables[memid]
+                if table is not None:
+                    result = table[read_addr]
+                else:
+                    result = mem._get_read_data(read_addr)
+            elif isinstance(self.memvalue[memid], DenseMemory):
+                result = self.memvalue[memid].data[read_addr]
             else:
                 result = self.memvalue[memid].get(read_addr, self.default_value)
         else:
@@ -416,6 +547,339 @@ class Simulation(object):
         if write_enable:
             self.memvalue[memid][write_addr] = write_val
 
+    def _initialize_slots(self):
+        """ Lower the block into a flat list of values and a closure per net.
+
+        Every wire is assigned an integer slot in self._slots, and every combinational
+        net becomes a closure (with its argument slots, destination slot and mask bound
+        ahead of time) that reads and writes that list.  After this, self.value and
+        self.regvalue become views onto the slot lists.
+        """
+        wires = sorted(self.block.wirevector_set, key=lambda w: w.name)
+        self._slot = {w: i for i, w in enumerate(wires)}
+        self._slots = [self.value[w] for w in wires]
+
+        regs = sorted((net.dests[0] for net in self.reg_update_nets), key=lambda w: w.name)
+        self._reg_slots = [self._slot[r] for r in regs]
+        self._regnext = [self.regvalue.get(r, self.value[r]) for r in regs]
+        srcs = {net.dests[0]: net.args[0] for net in self.reg_update_nets}
+        self._reg_next_srcs = [(self._slot[srcs[r]], r.bitmask) for r in regs]
+
+        self._net_funcs = tuple(self._slot_closure(net) for net in self.ordered_nets
+                                if net.op not in 'r@')
+        self._mem_funcs = tuple(self._slot_closure(net) for net in self.mem_update_nets)
+
+        self.value = _SlotMap(self._slot, self._slots)
+        self.regvalue = _SlotMap({r: i for i, r in enumerate(regs)}, self._regnext)
+
+    def _slot_closure(self, net):
+        """ Build a function f(slots) implementing the logic of net on the slot list.
+
+        The semantics are identical to those of _execute and _mem_update, but all of
+        the dispatch on net.op, the slot lookups and the masks are resolved here once.
+        """
+        op = net.op
+        args = tuple(self._slot[a] for a in net.args)
+
+        if op == '@':
+            memvalue, memid = self.memvalue, net.op_param[0]
+            addr, data_arg, enable = args
+
+            default = self.default_value
+            if isinstance(memvalue[memid], DenseMemory):
+                data = memvalue[memid].data
+
+                def f(v):
+                    if v[enable]:
+                        wa, wv = v[addr], v[data_arg]
+                        changed = data[wa] != wv
+                        data[wa] = wv
+                        return changed
+                    return False
+                return f
+
+            def f(v):  # returns True only if the contents of the memory changed
+                if v[enable]:
+                    mem, wa, wv = memvalue[memid], v[addr], v[data_arg]
+                    changed = mem.get(wa, default) != wv
+                    mem[wa] = wv
+                    return changed
+                return False
+            return f
+
+        d, m = self._slot[net.dests[0]], net.dests[0].bitmask
+        if op in '~w':
+            a, = args
+            if op == '~':
+                def f(v):
+                    v[d] = ~v[a] & m
+            else:
+                def f(v):
+                    v[d] = v[a] & m
+        elif op == 'n':
+            a, b = args
+
+            def f(v):
+                v[d] = ~(v[a] & v[b]) & m
+        elif op in self._slot_binary_func:
+            a, b = args
+            func = self._slot_binary_func[op]
+
+            def f(v):
+                v[d] = func(v[a], v[b]) & m
+        elif op == 'x':
+            sel, a, b = args
+
+            def f(v):
+                v[d] = (v[b] if v[sel] else v[a]) & m
+        elif op == 'c':
+            parts, shiftby = [], 0
+            for slot, arg in reversed(list(zip(args, net.args))):
+                parts.append((slot, shiftby))
+                shiftby += len(arg)
+            parts = tuple(parts)
+
+            def f(v):
+                result = 0
+                for slot, shiftby in parts:
+                    result |= v[slot] << shiftby
+                v[d] = result & m
+        elif op == 's':
+            # group the selected bits into runs of contiguous source bits
+            runs = []
+            for i, b in enumerate(net.op_param):
+                if runs and b == runs[-1][0] + runs[-1][1]:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([b, 1, i])
+            runs = tuple((start, (1 << length) - 1, pos) for start, length, pos in runs)
+            a, = args
+
+            def f(v):
+                source, result = v[a], 0
+                for start, runmask, pos in runs:
+                    result |= ((source >> start) & runmask) << pos
+                v[d] = result & m
+        elif op == 'm':
+            memid, mem = net.op_param
+            a, = args
+            table = self._rom_tables.get(memid)
+            if table is not None:
+                def f(v):
+                    v[d] = table[v[a]] & m
+            elif isinstance(mem, RomBlock):
+                def f(v):
+                    v[d] = mem._get_read_data(v[a]) & m
+            elif isinstance(self.memvalue[memid], DenseMemory):
+                data = self.memvalue[memid].data
+
+                def f(v):
+                    v[d] = data[v[a]] & m
+            else:
+                memvalue, default = self.memvalue, self.default_value
+
+                def f(v):
+                    v[d] = memvalue[memid].get(v[a], default) & m
+        else:
+            raise PyrtlInternalError('error, unknown op type')
+        return f
+
+    def _step_slots(self):
+        """ Take one cycle using the precompiled slot closures. """
+        v = self._slots
+        for slot, val in zip(self._reg_slots, self._regnext):
+            v[slot] = val  # apply register updates from previous step
+
+        for f in self._net_funcs:
+            f(v)
+
+        for f in self._mem_funcs:
+            f(v)
+
+        if self.tracer is not None:
+            self.tracer.add_step(self.value)
+
+        self._regnext[:] = [v[slot] & mask for slot, mask in self._reg_next_srcs]
+
+    def _initialize_events(self):
+        """ Build the fanout lists used by the event-driven mode.
+
+        Nets are numbered by their position in the (topologically ordered) self._net_funcs,
+        so always evaluating the lowest numbered pending net first means each net is
+        evaluated at most once per cycle, and only after all of its changed arguments.
+        """
+        comb_nets = [net for net in self.ordered_nets if net.op not in 'r@']
+        net_index = {net: i for i, net in enumerate(comb_nets)}
+        self._net_dests = [self._slot[net.dests[0]] for net in comb_nets]
+
+        wire_src_dict, wire_dst_dict = self.block.net_connections()
+        self._fanout = [()] * len(self._slots)
+        for wire, nets in wire_dst_dict.items():
+            self._fanout[self._slot[wire]] = tuple(sorted(
+                net_index[net] for net in nets if net in net_index))
+
+        self._mem_readers = {}  # memid -> indices of the read port nets of that memory
+        for net in comb_nets:
+            if net.op == 'm':
+                self._mem_readers.setdefault(net.op_param[0], []).append(net_index[net])
+        self._mem_write_ids = tuple(net.op_param[0] for net in self.mem_update_nets)
+
+        # the values of the inputs and registers as of the last evaluation
+        sources = self.block.wirevector_subset((Input, Register))
+        self._source_slots = sorted(self._slot[w] for w in sources)
+        self._source_last = [self._slots[slot] for slot in self._source_slots]
+
+        # everything needs to be evaluated on the first cycle
+        self._pending = list(range(len(comb_nets)))
+        self._queued = bytearray([1]) * len(comb_nets)
+
+    def _step_events(self):
+        """ Take one cycle, re-evaluating only the nets affected by changed values. """
+        v = self._slots
+        for slot, val in zip(self._reg_slots, self._regnext):
+            v[slot] = val  # apply register updates from previous step
+
+        pending, queued, fanout = self._pending, self._queued, self._fanout
+        push, pop = heapq.heappush, heapq.heappop
+
+        # find which inputs and registers changed since last cycle
+        last = self._source_last
+        for i, slot in enumerate(self._source_slots):
+            if v[slot] != last[i]:
+                last[i] = v[slot]
+                for n in fanout[slot]:
+                    if not queued[n]:
+                        queued[n] = 1
+                        push(pending, n)
+
+        # propagate the changes in topological order
+        funcs, dests = self._net_funcs, self._net_dests
+        while pending:
+            n = pop(pending)
+            queued[n] = 0
+            d = dests[n]
+            old = v[d]
+            funcs[n](v)
+            if v[d] != old:
+                for m in fanout[d]:
+                    if not queued[m]:
+                        queued[m] = 1
+                        push(pending, m)
+
+        # memory writes that change contents wake up the read ports for the next cycle
+        for f, memid in zip(self._mem_funcs, self._mem_write_ids):
+            if f(v):
+                for n in self._mem_readers.get(memid, ()):
+                    if not queued[n]:
+                        queued[n] = 1
+                        push(pending, n)
+
+        if self.tracer is not None:
+            self.tracer.add_step(self.value)
+
+        self._regnext[:] = [v[slot] & mask for slot, mask in self._reg_next_srcs]
+
+
+class _SlotMap(collections.MutableMapping):
+    """ Dictionary-like view, keyed by WireVector, of a list of slot values. """
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, wire):
+        return self._values[self._index[wire]]
+
+    def __setitem__(self, wire, value):
+        self._values[self._index[wire]] = value
+
+    def __delitem__(self, wire):
+        raise PyrtlError('cannot remove a wire from a running simulation')
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, wire):
+        return wire in self._index
+
+
+class DenseMemory(collections.MutableMapping):
+    """ The contents of a memory, held in a list with an entry for every address.
+
+    Simulation and FastSimulation use these (when passed dense_memories=True) for the
+    memories with an addrwidth of at most DenseMemory.max_addrwidth, so that reads and
+    writes index into a list rather than hashing the address into a dictionary.  The
+    list itself is .data.  Seen as a dictionary of {address: value}, the addresses are
+    those holding something other than the default value, and it compares equal to any
+    dictionary holding the same values (where missing addresses hold the default value).
+    """
+
+    max_addrwidth = 20
+
+    def __init__(self, addrwidth, default_value=0, contents=None):
+        self.default_value = default_value
+        self.data = [default_value] * (1 << addrwidth)
+        if contents is not None:
+            self.update(contents)
+
+    def __getitem__(self, addr):
+        if not 0 <= addr < len(self.data):
+            raise KeyError(addr)
+        return self.data[addr]
+
+    def __setitem__(self, addr, value):
+        if not 0 <= addr < len(self.data):
+            raise PyrtlError('error, address %s outside of the bounds of the memory' % addr)
+        self.data[addr] = value
+
+    def __delitem__(self, addr):
+        self[addr] = self.default_value
+
+    def __iter__(self):
+        default = self.default_value
+        return (addr for addr, value in enumerate(self.data) if value != default)
+
+    def __len__(self):
+        return len(self.data) - self.data.count(self.default_value)
+
+    def __eq__(self, other):
+        # addresses missing from a dictionary hold the default value, as in a memory
+        if not isinstance(other, collections.Mapping):
+            return NotImplemented
+        default = self.default_value
+        return all(0 <= addr < len(self.data) for addr in other) and \
+            all(value == other.get(addr, default) for addr, value in enumerate(self.data))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def clear(self):
+        self.data[:] = [self.default_value] * len(self.data)  # in place, it may be bound
+
+    def copy(self):
+        mem = DenseMemory(0, self.default_value)
+        mem.data = list(self.data)
+        return mem
+
+    def __repr__(self):
+        return 'DenseMemory(%r)' % dict(self)
+
+
+def _dense_memory(mem, default_value, dense_memories):
+    """ A new DenseMemory for mem if it should have one, otherwise None. """
+    if dense_memories and not isinstance(mem, RomBlock) and \
+            mem.addrwidth <= DenseMemory.max_addrwidth:
+        return DenseMemory(mem.addrwidth, default_value)
+    return None
+
 
 # ----------------------------------------------------------------
 #    ___       __  ___     __
@@ -440,7 +904,8 @@ class FastSimulation(object):
 
     def __init__(
             self, register_value_map=None, memory_value_map=None,
-            default_value=0, tracer=True, block=None, code_file=None):
+            default_value=0, tracer=True, block=None, code_file=None, cache_dir=None,
+            dense_memories=False):
         """ Instantiates a Fast Simulation instance.
 
         The interface for FastSimulation and Simulation should be almost identical.
@@ -448,6 +913,12 @@ class FastSimulation(object):
 
         :param code_file: The file in which to store a copy of the generated
         python code. Defaults to no code being stored.
+        :param cache_dir: The directory in which to cache the compiled code, so that
+        simulating the same design again skips compiling it (see pyrtl.simcache for the
+        default location).  Pass False to not use a cache on disk.
+        :param dense_memories: if True, memories with an addrwidth of up to
+        DenseMemory.max_addrwidth (20) are held as a DenseMemory, and the generated code
+        indexes straight into its list of values.
 
         Look at Simulation.__init__ for descriptions for the other parameters
 
@@ -465,10 +936,12 @@ class FastSimulation(object):
             tracer = SimulationTrace()
         self.tracer = tracer
         self.sim_func = None
+        self._sim_run = None
         self.code_file = code_file
         self.mems = {}
         self.regs = {}
-        self.internal_names = _PythonSanitizer('_fastsim_tmp_')
+        self.cache_dir = cache_dir
+        self.dense_memories = dense_memories
         self._initialize(register_value_map, memory_value_map)
 
     def _initialize(self, register_value_map=None, memory_value_map=None, default_value=None):
@@ -477,9 +950,6 @@ class FastSimulation(object):
         if register_value_map is None:
             register_value_map = {}
 
-        for wire in self.block.wirevector_set:
-            self.internal_names.make_valid_string(wire.name)
-
         # set registers to their values
         reg_set = self.block.wirevector_subset(Register)
         for r in reg_set:
@@ -490,21 +960,160 @@ class FastSimulation(object):
 
         self._initialize_mems(memory_value_map)
 
-        s = self._compiled()
-        if self.code_file is not None:
-            with open(self.code_file, 'w') as file:
-                file.write(s)
-
         context = {}
-        logic_creator = compile(s, '<string>', 'exec')
-        exec(logic_creator, context)
-        self.sim_func = context['sim_func']
+        exec(self._compile_cached(), context)
+        self.sim_func, self._sim_run = context['make_sim_func'](
+            self._code_names, self._code_mems, self._code_roms)
+
+    # (code object, bindings) by the structural key of the design, shared by all
+    # FastSimulations
+    _code_cache = {}
+
+    def _compile_cached(self):
+        """ Compile the generated code, reusing the code of an earlier simulation of a
+        design of the same structure if there is one.
+
+        The cache (in memory and on disk) is keyed by _structure_key, which is looked
+        up before any code is generated, so a hit only costs hashing the block.  The
+        generated code takes the names of the wires, the keys of the memories and the
+        tables of the RomBlocks as arguments of make_sim_func, so along with the code
+        the cache keeps which wire or memory (by its token in the key) each of those
+        arguments is, to bind the code to the wires of this block.  When a code_file is
+        asked for the code is always generated, to write it there.
+        """
+        tag = simcache.python_tag()
+        structure, wire_tokens, mem_tokens = self._structure_key()
+        key = simcache.content_key(tag, structure)
+        entry = None
+        if self.code_file is None:
+            entry = FastSimulation._code_cache.get(key)
+
+        directory = None
+        if self.cache_dir is not False:
+            directory = simcache.cache_dir('fastsim', self.cache_dir)
+            if entry is None and self.code_file is None:
+                data = simcache.read(os.path.join(directory, key + '.' + tag))
+                if data is not None:
+                    try:
+                        entry = marshal.loads(data)
+                        code, bindings = entry
+                    except (EOFError, ValueError, TypeError):
+                        entry = None  # a damaged entry, just compile it again
+
+        if entry is None:
+            source = self._compiled()
+            if self.code_file is not None:
+                with open(self.code_file, 'w') as file:
+                    file.write(source)
+            code = compile(source, '<fastsim>', 'exec')
+            entry = (code, self._bindings(wire_tokens, mem_tokens))
+            if directory is not None:
+                simcache.write(os.path.join(directory, key + '.py'), source)
+                simcache.write(os.path.join(directory, key + '.' + tag), marshal.dumps(entry))
+        else:
+            self._bind(entry[1], wire_tokens, mem_tokens)
+
+        if len(FastSimulation._code_cache) >= 64:
+            FastSimulation._code_cache.clear()
+        FastSimulation._code_cache[key] = entry
+        return entry[0]
+
+    def _structure_key(self):
+        """ A string describing the design and the simulation options its code depends
+        on, and the tokens standing for its wires and memories in it.
+
+        Each wire is described by its type, bitwidth and name, except that the names
+        PyRTL made up for unnamed wires (which come from a global counter, and so differ
+        every time a design is built) are replaced by their rank among those of the
+        block.  Memories are numbered by the rank of their ids the same way.  Any two
+        designs with the same key are then the same circuit up to these tokens, and
+        building the same design again gives the same key.  The nets are described in
+        sorted order, as the logic of a block is a set.
+        """
+        block = self.block
+        internal = [w.name for w in block.wirevector_set
+                    if _is_internal_name(w.name) and not isinstance(w, Const)]
+        internal.sort(key=_trace_sort_key)  # so 'tmp9' comes before 'tmp10', as made
+        rank = {name: i for i, name in enumerate(internal)}
+        wire_tokens = {}
+        for w in block.wirevector_set:
+            if isinstance(w, Const):
+                wire_tokens[w] = 'K%d.%d' % (w.bitwidth, w.val)
+            elif w.name in rank:
+                wire_tokens[w] = '%s%d#%d' % (type(w).__name__, w.bitwidth, rank[w.name])
+            else:
+                wire_tokens[w] = '%s%d:%s' % (type(w).__name__, w.bitwidth, w.name)
+
+        mem_tokens = {}
+        for net in block.logic_subset('m@'):
+            mem_tokens[net.op_param[1].id] = net.op_param[1]
+        mem_tokens = {mem: '%s%d.%d#%d' % (type(mem).__name__, mem.bitwidth, mem.addrwidth, i)
+                      for i, (memid, mem) in enumerate(sorted(mem_tokens.items()))}
+
+        nets = []
+        for net in block.logic:
+            if net.op in 'm@':
+                param = mem_tokens[net.op_param[1]]
+            else:
+                param = net.op_param
+            nets.append('%s %s %s %s' % (net.op, param,
+                                         ','.join([wire_tokens[a] for a in net.args]),
+                                         ','.join([wire_tokens[d] for d in net.dests])))
+        nets.sort()
+
+        # what else the code depends on: the kinds of memories and tables of RomBlocks,
+        # the traced wires, the assertions and the default value of memories
+        mems = []
+        for mem, token in mem_tokens.items():
+            if isinstance(mem, RomBlock):
+                kind = 'read' if mem._get_table() is None else 'table'
+            else:
+                kind = 'dense' if self._is_dense(mem) else 'map'
+            mems.append('%s %s' % (token, kind))
+        traced = None
+        if self.tracer is not None:
+            traced = sorted(wire_tokens[block.wirevector_by_name[name]]
+                            for name in self.tracer.trace)
+        asserts = sorted(wire_tokens[w] for w in block.rtl_assert_dict)
+        key = '\n'.join(nets + sorted(mems) + [repr((traced, asserts, self.default_value))])
+        return key, wire_tokens, mem_tokens
+
+    def _bindings(self, wire_tokens, mem_tokens):
+        """ The arguments of the generated code (and the wires sim_run reads, returns and
+        checks) as the tokens of their wires and memories, to keep in the cache. """
+        by_name = {w.name: token for w, token in wire_tokens.items()}
+        by_key = {self._mem_varname(mem): token for mem, token in mem_tokens.items()}
+        by_id = {mem.id: token for mem, token in mem_tokens.items()}
+        roms = sorted((index, memid) for memid, index in self._code_rom_index.items()
+                      if index is not None)
+        return ([by_name[name] for name in self._code_names],
+                [by_key[name] for name in self._code_mems],
+                [by_id[memid] for index, memid in roms],
+                [by_name[name] for name in self._run_inputs],
+                [by_name[name] for name in self._run_traced],
+                [wire_tokens[w] for w in self._run_asserts])
+
+    def _bind(self, bindings, wire_tokens, mem_tokens):
+        """ Set up the arguments of cached code for the wires of this block. """
+        wires = {token: w for w, token in wire_tokens.items()}
+        mems = {token: mem for mem, token in mem_tokens.items()}
+        names, mem_keys, roms, run_inputs, run_traced, run_asserts = bindings
+        self._code_names = [wires[token].name for token in names]
+        self._code_mems = [self._mem_varname(mems[token]) for token in mem_keys]
+        self._code_roms = [mems[token]._get_table() for token in roms]
+        self._run_inputs = [wires[token].name for token in run_inputs]
+        self._run_traced = [wires[token].name for token in run_traced]
+        self._run_asserts = [wires[token] for token in run_asserts]
 
     def _initialize_mems(self, memory_value_map):
         if memory_value_map is not None:
             for (mem, mem_map) in memory_value_map.items():
                 if isinstance(mem, RomBlock):
                     raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
+                dense = _dense_memory(mem, self.default_value, self.dense_memories)
+                if dense is not None:
+                    dense.update(mem_map)
+                    mem_map = dense
                 self.mems[self._mem_varname(mem)] = mem_map
 
         for net in self.block.logic_subset('m@'):
@@ -513,7 +1122,8 @@ class FastSimulation(object):
                 if isinstance(mem, RomBlock):
                     self.mems[self._mem_varname(mem)] = mem
                 else:
-                    self.mems[self._mem_varname(mem)] = {}
+                    dense = _dense_memory(mem, self.default_value, self.dense_memories)
+                    self.mems[self._mem_varname(mem)] = {} if dense is None else dense
 
     def step(self, provided_inputs):
         """ Run the simulation for a cycle
@@ -549,6 +1159,92 @@ class FastSimulation(object):
         # check the rtl assertions
         check_rtl_assertions(self)
 
+    def sim_run(self, input_columns, nsteps=None):
+        """ Run the simulation for many cycles with a single call of the generated code.
+
+        :param input_columns: a dictionary mapping Inputs (or their names) to a list of
+          their values, one for each cycle
+        :param nsteps: the number of cycles to run, defaults to the number of values given
+          for the inputs (which must then all have the same number of values)
+        :return: a dictionary mapping the name of each traced wire to the list of its
+          values in the cycles that were run
+
+        This has the same effect as calling step() once per cycle: the tracer, registers,
+        memories and inspect() all end up in the same state.  It is much faster though,
+        as the generated code keeps the registers and memories in local variables across
+        cycles rather than building and unpacking dictionaries every cycle.  The rtl
+        assertions are still checked every cycle, and if one fails the simulation stops
+        after that cycle and raises its exception.
+        """
+        columns = {self._to_name(wire): values for wire, values in input_columns.items()}
+        if nsteps is None:
+            if not columns:
+                raise PyrtlError('need to supply either input values or a number of '
+                                 'steps to simulate')
+            nsteps = max(len(values) for values in columns.values())
+        if nsteps < 1:
+            raise PyrtlError("must simulate at least one step")
+
+        for name, values in columns.items():
+            wire = self.block.get_wirevector_by_name(name)
+            if len(values) < nsteps:
+                raise PyrtlError("must supply a value for each provided wire "
+                                 "for each step of simulation")
+            if len(values) > nsteps:
+                values = columns[name] = values[:nsteps]
+            if max(values) > wire.bitmask or min(values) < 0:
+                raise PyrtlError("Wire {} has a value which cannot be represented"
+                                 " using its bitwidth".format(wire))
+        for name in self._run_inputs:
+            if name not in columns:
+                raise PyrtlError('no values were provided for input "%s"' % name)
+
+        # propagate through logic
+        ran, failed, traced, self.context = self._sim_run(columns, self.regs, self.mems, nsteps)
+
+        results = dict(zip(self._run_traced, traced))
+        if self.tracer is not None:
+            for name in self.tracer.trace:
+                if name not in results:
+                    wire = self.block.wirevector_by_name[name]
+                    if isinstance(wire, Const):
+                        results[name] = [wire.val] * ran
+                    elif name in columns:
+                        results[name] = columns[name][:ran]
+                    else:
+                        raise PyrtlError('no values were provided for input "%s"' % name)
+            self.tracer.extend(results)
+        for name, values in columns.items():
+            self.context[name] = values[ran - 1]
+
+        # check the rtl assertions
+        if failed is not None:
+            wire = self._run_asserts[failed]
+            if self.tracer is not None:
+                self.tracer.assertion_failed(wire.name)
+            raise self.block.rtl_assert_dict[wire]
+        return results
+
+    def run(self, inputs):
+        """ Run many steps of the simulation (like CompiledSimulation.run).
+
+        :param inputs: a list of input mappings for each step, its length being the
+          number of steps to be executed
+
+        See sim_run, which takes the values of each input as a column instead.
+        """
+        if not inputs:
+            return
+        self.sim_run({wire: [inmap[wire] for inmap in inputs] for wire in inputs[0]},
+                     len(inputs))
+
+    def _can_sim_run(self, expected_outputs, stop_after_first_error):
+        """ Whether step_multiple can run all of its steps at once with sim_run """
+        if not expected_outputs:
+            return True
+        return not stop_after_first_error and self.tracer is not None and all(
+            self._to_name(w) in self.tracer.trace for w in expected_outputs)
+
     def step_multiple(self, provided_inputs, expected_outputs=None, nsteps=None,
                       file=sys.stdout, stop_after_first_error=False):
         """ Take the simulation forward N cycles, where N is the number of values
@@ -629,6 +1325,17 @@ class FastSimulation(object):
                 "each step of simulation")
 
         failed = []
+        if self._can_sim_run(expected_outputs, stop_after_first_error):
+            results = self.sim_run({w: [int(v[i]) for i in range(nsteps)]
+                                    for w, v in provided_inputs.items()}, nsteps)
+            for expvar in (expected_outputs or {}):
+                actuals = results[self._to_name(expvar)]
+                for i in range(nsteps):
+                    expected = int(expected_outputs[expvar][i])
+                    if expected != actuals[i]:
+                        failed.append((i, expvar, expected, actuals[i]))
+            nsteps = 0  # all done
+
         for i in range(nsteps):
             self.step({w: int(v[i]) for w, v in provided_inputs.items()})
 
@@ -692,6 +1399,56 @@ class FastSimulation(object):
             raise PyrtlError("ROM blocks are not stored in the simulation object")
         return self.mems[self._mem_varname(mem)]
 
+    def checkpoint(self):
+        """ Capture the state of the simulation so that it can be resumed later.
+
+        :return: a compact (compressed) bytes object holding the value every register
+          will take on the next cycle and the contents of every memory
+
+        See Simulation.checkpoint for details.
+        """
+        mems = {name: self.mems[self._mem_varname(mem)]
+                for name, mem in _state_mems(self.block).items()}
+        return _pack_checkpoint(self.regs, mems)
+
+    def restore(self, checkpoint):
+        """ Return the simulation to the state captured by checkpoint().
+
+        :param checkpoint: the bytes returned by checkpoint()
+        """
+        regs, mems = _unpack_checkpoint(checkpoint)
+        for name in regs:
+            if name not in self.regs:
+                raise PyrtlError('checkpoint has a value for unknown register "%s"' % name)
+        known = _state_mems(self.block)
+        for name in mems:
+            if name not in known:
+                raise PyrtlError('checkpoint has the contents of unknown memory "%s"' % name)
+        self.regs.update(regs)
+        for name, mem in mems.items():
+            varname = self._mem_varname(known[name])
+            if isinstance(self.mems[varname], DenseMemory):
+                self.mems[varname].clear()  # the generated code may hold on to its list
+                self.mems[varname].update(mem)
+            else:
+                self.mems[varname] = mem
+
+    def fork(self):
+        """ Make an independent copy of the simulation in its current state.
+
+        :return: a new simulation that continues from where this one is, with a new
+          (empty) tracer tracking the same wires
+
+        The generated code is shared with the new simulation rather than built again.
+        """
+        sim = copy.copy(self)
+        if self.tracer is not None:
+            sim.tracer = SimulationTrace(wires_to_track=self.tracer.wires_to_track,
+                                         block=self.block)
+        sim.regs = dict(self.regs)
+        sim.mems = {k: v if isinstance(v, RomBlock) else v.copy() for k, v in self.mems.items()}
+        return sim
+
     def _to_name(self, name):
         """ Converts Wires to strings, keeps strings as is """
         if isinstance(name, WireVector):
@@ -699,31 +1456,78 @@ class FastSimulation(object):
         return name
 
     def _varname(self, val):
-        """ Converts WireVectors to internal names """
-        return self.internal_names[val.name]
+        """ Converts WireVectors to internal local variables, numbered and named after
+        the wire (so that the generated code can be read) """
+        if val not in self._code_vars:
+            self._code_vars[val] = 'v%d_%s' % (len(self._code_vars),
+                                              re.sub('[^0-9A-Za-z_]', '_', val.name))
+        return self._code_vars[val]
+
+    def _namevar(self, val):
+        """ The variable to which the name of a WireVector is bound in the generated code """
+        if val not in self._code_namevars:
+            self._code_namevars[val] = 'n%d' % len(self._code_names)
+            self._code_names.append(val.name)
+        return self._code_namevars[val]
 
     def _mem_varname(self, val):
         return 'fs_mem' + str(val.id)
 
+    def _rom_namevar(self, mem):
+        """ The variable to which the table of a RomBlock is bound in the generated code,
+        or None if it has no table (see RomBlock._get_table) """
+        if not isinstance(mem, RomBlock):
+            return None
+        if mem.id not in self._code_rom_index:
+            table = mem._get_table()
+            self._code_rom_index[mem.id] = None if table is None else len(self._code_roms)
+            if table is not None:
+                self._code_roms.append(table)
+        index = self._code_rom_index[mem.id]
+        return None if index is None else 'rom%d' % index
+
+    def _is_dense(self, mem):
+        return isinstance(self.mems[self._mem_varname(mem)], DenseMemory)
+
+    def _mem_namevar(self, val):
+        """ The variable to which the key of a memory is bound in the generated code """
+        name = self._mem_varname(val)
+        if name not in self._code_mems:
+            self._code_mems.append(name)
+        return 'm%d' % self._code_mems.index(name)
+
     def _arg_varname(self, wire):
         """
         Input, Const, and Registers have special input values
+        (except in the loop of sim_run, where inputs and registers are locals too)
         """
-        if isinstance(wire, (Input, Register)):
-            return 'd[' + repr(wire.name) + ']'  # passed in
-        elif isinstance(wire, Const):
+        if isinstance(wire, Const):
             return str(wire.val)  # hardcoded
+        elif isinstance(wire, (Input, Register)) and not self._code_loop:
+            return 'd[' + self._namevar(wire) + ']'  # passed in
         else:
             return self._varname(wire)
 
     def _dest_varname(self, wire):
+        if self._code_loop:
+            if isinstance(wire, Register):
+                return self._next_varname(wire)  # the value it takes on next cycle
+            return self._varname(wire)
         if isinstance(wire, Output):
-            return 'outs[' + repr(wire.name) + ']'
+            return 'outs[' + self._namevar(wire) + ']'
         elif isinstance(wire, Register):
-            return 'regs[' + repr(wire.name) + ']'
+            return 'regs[' + self._namevar(wire) + ']'
         else:
             return self._varname(wire)
 
+    def _next_varname(self, reg):
+        """ The local holding the next value of a register in sim_run """
+        return 'x' + self._varname(reg)[1:]
+
+    def _column_varname(self, wire):
+        """ The local holding the column of values of an input or traced wire in sim_run """
+        return ('i' if isinstance(wire, Input) else 't') + self._varname(wire)[1:]
+
     _no_mask_bitwidth = {  # bitwidth that the dest has to have in order to not need masking
         'w': lambda net: len(net.args[0]),
         'r': lambda net: len(net.args[0]),
@@ -746,19 +1550,139 @@ class FastSimulation(object):
 
     # Yeah, triple quotes don't respect indentation (aka the 4 spaces on the
     # start of each line is part of the string)
-    _prog_start = """def sim_func(d):
-    regs = {}
-    outs = {}
-    mem_ws = []"""
+    _prog_start = """    def sim_func(d):
+        regs = {}
+        outs = {}
+        mem_ws = []"""
+
+    _run_start = """    def sim_run(ins, regs, mems, nsteps):
+        failed = None"""
 
     def _compiled(self):
         """Return a string of the self.block compiled to a block of
-         code that can be execed to get a function to execute"""
+         code that can be execed to get a function to execute
+
+        The code defines make_sim_func(names, mems, roms), which returns the sim_func (that
+        runs one cycle) and sim_run (that runs many cycles, see FastSimulation.sim_run).
+        The names of the wires (and the keys of the memories, and the tables of the
+        RomBlocks) are bound only when calling make_sim_func (with self._code_names,
+        self._code_mems and self._code_roms), so that the compiled code can be reused
+        for any block of the same structure (see _compile_cached)."""
         # Dev Notes:
         # Because of fast locals in functions in both CPython and PyPy, getting a
         # function to execute makes the code a few times faster than
-        # just executing it in the global exec scope.
+        # just executing it in the global exec scope.  The names are bound as
+        # closure variables, which are just as fast to read as constants.
+        self._code_vars, self._code_namevars = {}, {}
+        self._code_names, self._code_mems = [], []
+        self._code_roms, self._code_rom_index = [], {}
+        nets = list(self.block)
+
+        self._code_loop = False
         prog = [self._prog_start]
+        prog.extend(self._compiled_nets(nets, '        '))
+
+        # add traced wires to dict, in the order of their variables
+        if self.tracer is not None:
+            traced = (self.block.wirevector_by_name[wire_name] for wire_name in self.tracer.trace)
+            traced = [wire for wire in traced if wire in self._code_vars and
+                      not isinstance(wire, (Input, Const, Register, Output))]
+            for wire in self._in_var_order(traced):
+                prog.append('        outs[%s] = %s' % (self._namevar(wire), self._varname(wire)))
+
+        prog.append("        return regs, outs, mem_ws")
+        prog.extend(self._compiled_run(nets))
+        prog.append("    return sim_func, sim_run")
+
+        # bind the names last, now that all of them are known
+        header = ['def make_sim_func(names, mems, roms):']
+        if self._code_names:
+            header.append('    %s, = names' % ', '.join(
+                'n%d' % i for i in range(len(self._code_names))))
+        if self._code_mems:
+            header.append('    %s, = mems' % ', '.join(
+                'm%d' % i for i in range(len(self._code_mems))))
+        if self._code_roms:
+            header.append('    %s, = roms' % ', '.join(
+                'rom%d' % i for i in range(len(self._code_roms))))
+        return '\n'.join(header + prog)
+
+    def _compiled_run(self, nets):
+        """ The lines of code of sim_run, which loops over the cycles itself.
+
+        Registers, memories, and the columns of inputs and traced values are all held in
+        local variables for the whole run, and the names of the inputs it reads, the
+        wires whose columns it returns and the assertions it checks are recorded in
+        self._run_inputs, self._run_traced and self._run_asserts.
+        """
+        self._code_loop = True
+        regs = [net.dests[0] for net in nets if net.op == 'r']
+        for reg in regs:
+            self._varname(reg)  # even registers that are never read have a value
+        body = self._compiled_nets(nets, '            ')
+
+        inputs = self._in_var_order(w for w in self._code_vars if isinstance(w, Input))
+        traced = []
+        if self.tracer is not None:
+            traced = (self.block.wirevector_by_name[wire_name] for wire_name in self.tracer.trace)
+            traced = self._in_var_order(w for w in traced if w in self._code_vars and
+                                        not isinstance(w, (Input, Const)))
+        asserts = self._in_var_order(w for w in self.block.rtl_assert_dict
+                                     if w in self._code_vars)
+        self._run_inputs = [w.name for w in inputs]
+        self._run_traced = [w.name for w in traced]
+        self._run_asserts = asserts
+
+        prog = [self._run_start]
+        for wire in inputs:
+            prog.append('        %s = ins[%s]' % (self._column_varname(wire), self._namevar(wire)))
+        for reg in regs:
+            prog.append('        %s = regs[%s]' % (self._next_varname(reg), self._namevar(reg)))
+        for i, name in enumerate(self._code_mems):
+            data = '.data' if isinstance(self.mems[name], DenseMemory) else ''
+            prog.append('        M%d = mems[m%d]%s' % (i, i, data))
+        for wire in traced:
+            column = self._column_varname(wire)
+            prog.append('        %s = []' % column)
+            prog.append('        a%s = %s.append' % (column[1:], column))
+
+        prog.append('        for c in range(nsteps):')
+        for wire in inputs:
+            prog.append('            %s = %s[c]'
+                        % (self._varname(wire), self._column_varname(wire)))
+        for reg in regs:
+            prog.append('            %s = %s' % (self._varname(reg), self._next_varname(reg)))
+        prog.extend(body)
+        for wire in traced:
+            prog.append('            a%s(%s)' % (self._varname(wire)[1:], self._varname(wire)))
+        for i, wire in enumerate(asserts):
+            prog.append('            if not %s:' % self._varname(wire))
+            prog.append('                failed = %d' % i)
+            prog.append('                break')
+        if prog[-1] == '        for c in range(nsteps):':
+            prog.append('            pass')  # nothing to compute
+
+        for reg in regs:
+            prog.append('        regs[%s] = %s' % (self._namevar(reg), self._next_varname(reg)))
+        # the values of the last cycle, for inspect
+        traced_set = set(traced)
+        last = self._in_var_order(w for w in self._code_vars
+                                  if isinstance(w, (Register, Output)) or w in traced_set)
+        prog.append('        last = {%s}' % ', '.join(
+            '%s: %s' % (self._namevar(w), self._varname(w)) for w in last))
+        prog.append('        return c + 1, failed, [%s], last' % ', '.join(
+            self._column_varname(w) for w in traced))
+        self._code_loop = False
+        return prog
+
+    def _in_var_order(self, wires):
+        """ The wires sorted by the number of their variables in the generated code """
+        return sorted(wires, key=lambda w: int(self._code_vars[w][1:].split('_', 1)[0]))
+
+    def _compiled_nets(self, nets, indent):
+        """ The lines of code computing the nets, for one cycle of the simulation. """
+        prog = []
+        mem_writes = []
 
         simple_func = {  # OPS
             'w': lambda x: x,
@@ -792,7 +1716,7 @@ class FastSimulation(object):
                 bit = '(%d & (%s >> %d))' % ((1 << split_length) - 1, source, split_start_bit)
             return shift(bit, '<<', split_res_start_bit)
 
-        for net in self.block:
+        for net in nets:
             if net.op in simple_func:
                 argvals = (self._arg_varname(arg) for arg in net.args)
                 expr = simple_func[net.op](*argvals)
@@ -823,18 +1747,32 @@ class FastSimulation(object):
                 expr += make_split()
             elif net.op == 'm':
                 read_addr = self._arg_varname(net.args[0])
-                mem = net.op_param[1]
-                if isinstance(net.op_param[1], RomBlock):
-                    expr = 'd["%s"]._get_read_data(%s)' % (self._mem_varname(mem), read_addr)
+                table = self._rom_namevar(net.op_param[1])
+                if table is None:
+                    name = self._mem_namevar(net.op_param[1])
+                    mem = 'M' + name[1:] if self._code_loop else 'd[%s]' % name
+                if table is not None:  # a RomBlock turned into a table
+                    expr = '%s[%s]' % (table, read_addr)
+                elif isinstance(net.op_param[1], RomBlock):
+                    expr = '%s._get_read_data(%s)' % (mem, read_addr)
+                elif self._is_dense(net.op_param[1]):
+                    if not self._code_loop:  # in sim_run it is already the list
+                        mem += '.data'
+                    expr = '%s[%s]' % (mem, read_addr)
                 else:  # memories act async for reads
-                    expr = 'd["%s"].get(%s, %s)' % (self._mem_varname(mem),
-                                                    read_addr, self.default_value)
+                    expr = '%s.get(%s, %s)' % (mem, read_addr, self.default_value)
             elif net.op == '@':
-                mem = self._mem_varname(net.op_param[1])
+                mem = self._mem_namevar(net.op_param[1])
                 write_addr, write_val, write_enable = (self._arg_varname(a) for a in net.args)
-                prog.append('    if {}:'.format(write_enable))
-                prog.append('        mem_ws.append(("{}", {}, {}))'
-                            .format(mem, write_addr, write_val))
+                if self._code_loop:
+                    # written after all of the reads of the cycle
+                    mem_writes.append('{}if {}:'.format(indent, write_enable))
+                    mem_writes.append('{}    M{}[{}] = {}'
+                                      .format(indent, mem[1:], write_addr, write_val))
+                else:
+                    prog.append('{}if {}:'.format(indent, write_enable))
+                    prog.append('{}    mem_ws.append(({}, {}, {}))'
+                                .format(indent, mem, write_addr, write_val))
                 continue  # memwrites are special
             else:
                 raise PyrtlError('FastSimulation cannot handle primitive "%s"' % net.op)
@@ -842,21 +1780,11 @@ class FastSimulation(object):
             # prog.append('    #  ' + str(net))
             result = self._dest_varname(net.dests[0])
             if len(net.dests[0]) == self._no_mask_bitwidth[net.op](net):
-                prog.append("    %s = %s" % (result, expr))
+                prog.append("%s%s = %s" % (indent, result, expr))
             else:
                 mask = str(net.dests[0].bitmask)
-                prog.append('    %s = %s & %s' % (result, mask, expr))
-
-        # add traced wires to dict
-        if self.tracer is not None:
-            for wire_name in self.tracer.trace:
-                wire = self.block.wirevector_by_name[wire_name]
-                if not isinstance(wire, (Input, Const, Register, Output)):
-                    v_wire_name = self._varname(wire)
-                    prog.append('    outs["%s"] = %s' % (wire_name, v_wire_name))
-
-        prog.append("    return regs, outs, mem_ws")
-        return '\n'.join(prog)
+                prog.append('%s%s = %s & %s' % (indent, result, mask, expr))
+        return prog + mem_writes
 
 
 # ----------------------------------------------------------------
@@ -944,20 +1872,271 @@ def default_renderer():
     return AsciiWaveRenderer
 
 
-def _trace_sort_key(w):
-    def tryint(s):
+def _is_internal_name(name):
+    """ True for the names PyRTL makes up for wires that were not given one. """
+    return (name.startswith('tmp') or name.startswith('const') or
+            # or name.startswith('synth_')
+            name.endswith("'"))
+
+
+_checkpoint_version = 2
+
+
+def _state_mems(block):
+    """ The memories of the block that hold state (so not the RomBlocks), by name. """
+    return {mem.name: mem for mem in (net.op_param[1] for net in block.logic_subset('m@'))
+            if not isinstance(mem, RomBlock)}
+
+
+def _pack_checkpoint(regs, mems):
+    """ Serialize the register values {name: value} and memories {name: {addr: value}}.
+
+    Both are keyed by name, rather than by the wire or memory object (or its id), so
+    that a checkpoint can be restored into the same design built again, in this or
+    another process.
+    """
+    mems = {name: dict(mem) for name, mem in mems.items()}
+    return zlib.compress(pickle.dumps((_checkpoint_version, dict(regs), mems), 2))
+
+
+def _unpack_checkpoint(checkpoint):
+    """ The inverse of _pack_checkpoint, returning (regs, mems). """
+    try:
+        version, regs, mems = pickle.loads(zlib.decompress(checkpoint))
+    except (zlib.error, pickle.UnpicklingError, ValueError, TypeError):
+        raise PyrtlError('not a valid simulation checkpoint')
+    if version != _checkpoint_version:
+        raise PyrtlError('unsupported simulation checkpoint version %s' % version)
+    return regs, mems
+
+
+_trace_sort_key = _name_sort_key
+
+
+def _uint64_typecode():
+    """ The array typecode of 64-bit unsigned ints, or None (there is no 'Q' in py2). """
+    for code in ('Q', 'L'):
         try:
-            return int(s)
+            if array.array(str(code)).itemsize == 8:
+                return str(code)
         except ValueError:
-            return s
-    return [tryint(c) for c in re.split('([0-9]+)', w)]
+            pass
+    return None
+
+
+_UINT64 = _uint64_typecode()
+
+
+def _uint64_array(bitwidth, values=()):
+    """ An array of 64-bit unsigned ints if the values fit and there is one, else a list. """
+    if bitwidth <= 64 and _UINT64 is not None:
+        return array.array(_UINT64, values)
+    return list(values)
+
+
+def _ints(values):
+    """ Iterate over stored values as ints (python 2 makes longs of the items of an
+    array('L'), which would show as 3L). """
+    return (int(value) for value in values) if six.PY2 else iter(values)
+
+
+class TraceColumn(collections.MutableSequence):
+    """ The values of one wire in a trace, one per cycle, acting like a list.
+
+    The values of wires of up to 64 bits are stored unboxed in an array of 64-bit
+    unsigned ints, using a fraction of the memory of a list of ints; wider wires (and
+    all wires where python has no such array) fall back to a list.  Whole columns of
+    values can be added at once with extend, which copies the values of any buffer of
+    64-bit unsigned ints (like a numpy uint64 array) without a python loop.
+
+    The values of a trace used to be kept in lists, and TraceColumn does what code
+    reading them is likely to do with a list: it indexes, slices (into a list),
+    iterates, compares equal to a list of the same values, and concatenates and repeats
+    into lists (so trace['o'] + [0] is still a list).  It is not a list though, so where
+    one is really needed (for isinstance checks, or to serialize it with json) convert
+    it with tolist() or list(trace['o']).
+    """
+    __slots__ = ('_data',)
+
+    def __init__(self, bitwidth, values=()):
+        self._data = _uint64_array(bitwidth)
+        self.extend(values)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(_ints(self._data[index]))
+        value = self._data[index]
+        return int(value) if six.PY2 else value
+
+    def __setitem__(self, index, value):
+        self._data[index] = value
+
+    def __delitem__(self, index):
+        del self._data[index]
+
+    def __iter__(self):
+        return _ints(self._data)
+
+    def insert(self, index, value):
+        self._data.insert(index, value)
+
+    def append(self, value):
+        self._data.append(value)
+
+    def _appender(self):
+        """ A function adding one value at the end, as cheap to call as list.append. """
+        return self._data.append
+
+    def extend(self, values):
+        data = self._data
+        if type(values) is TraceColumn:
+            values = values._data
+        if isinstance(data, array.array) and not isinstance(values, (list, array.array)):
+            try:
+                view = memoryview(values)
+            except TypeError:
+                pass
+            else:
+                if view.ndim == 1 and view.itemsize == 8 and view.format.lstrip('@=<') in 'QL':
+                    if hasattr(data, 'frombytes'):
+                        data.frombytes(view.tobytes())
+                    else:
+                        data.fromstring(view.tobytes())
+                    return
+        if hasattr(values, 'tolist'):  # numpy arrays, so as not to store numpy ints
+            values = values.tolist()
+        data.extend(values)
+
+    def tolist(self):
+        return list(_ints(self._data))
+
+    def __eq__(self, other):
+        if not isinstance(other, (TraceColumn, list, tuple, array.array)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __lt__(self, other):
+        return self.tolist() < list(other)
+
+    def __le__(self, other):
+        return self.tolist() <= list(other)
+
+    def __gt__(self, other):
+        return self.tolist() > list(other)
+
+    def __ge__(self, other):
+        return self.tolist() >= list(other)
+
+    def __add__(self, other):
+        if not isinstance(other, (TraceColumn, list, tuple, array.array)):
+            return NotImplemented
+        return self.tolist() + list(other)
+
+    def __radd__(self, other):
+        if not isinstance(other, (list, tuple, array.array)):
+            return NotImplemented
+        return list(other) + self.tolist()
+
+    def __mul__(self, count):
+        return self.tolist() * count
+
+    __rmul__ = __mul__
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+class RingTraceColumn(TraceColumn):
+    """ The values of one wire in the last capacity cycles of a trace.
+
+    The values are kept in a circular buffer of a fixed size, which once full is
+    overwritten from its oldest value on.  Indexing and iterating go from the oldest
+    value retained to the newest, just as for a TraceColumn of those values.
+    """
+    __slots__ = ('_capacity', '_total')
+
+    def __init__(self, bitwidth, capacity, values=()):
+        if capacity < 1:
+            raise PyrtlError('a trace must keep at least one cycle')
+        self._capacity = capacity
+        self._total = 0  # the number of values ever added
+        self._data = _uint64_array(bitwidth, [0]) * capacity
+        self.extend(values)
+
+    def __len__(self):
+        return min(self._total, self._capacity)
+
+    def _index(self, index):
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('trace index out of range')
+        return (self._total - size + index) % self._capacity
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        value = self._data[self._index(index)]
+        return int(value) if six.PY2 else value
+
+    def __setitem__(self, index, value):
+        self._data[self._index(index)] = value
+
+    def __delitem__(self, index):
+        raise PyrtlError('cannot remove values from a bounded trace')
+
+    def insert(self, index, value):
+        raise PyrtlError('cannot insert values into a bounded trace')
+
+    def __iter__(self):
+        start = self._total % self._capacity
+        if self._total < self._capacity:
+            return _ints(itertools.islice(self._data, start))
+        return _ints(itertools.chain(itertools.islice(self._data, start, None),
+                                     itertools.islice(self._data, start)))
+
+    def append(self, value):
+        self._data[self._total % self._capacity] = value
+        self._total += 1
+
+    def _appender(self):
+        return self.append
+
+    def extend(self, values):
+        # gather the values with TraceColumn.extend, then copy the newest into the ring
+        chunk = TraceColumn(64 if isinstance(self._data, array.array) else 65)
+        TraceColumn.extend(chunk, values)
+        chunk = chunk._data
+        total, capacity = self._total + len(chunk), self._capacity
+        chunk = chunk[-capacity:]
+        start = (total - len(chunk)) % capacity
+        first = min(len(chunk), capacity - start)
+        self._data[start:start + first] = chunk[:first]
+        self._data[:len(chunk) - first] = chunk[first:]
+        self._total = total
+
+    def tolist(self):
+        return list(self)
 
 
 class TraceStorage(collections.Mapping):
-    __slots__ = ('__data',)
+    __slots__ = ('__data', '_columns')
 
-    def __init__(self, wvs):
-        self.__data = {wv.name: [] for wv in wvs}
+    def __init__(self, wvs, new_column=TraceColumn):
+        self.__data = {wv.name: new_column(wv.bitwidth) for wv in wvs}
+        # the append of each wire's column, to add a step without looking up every wire
+        # by name, or going through TraceColumn.append
+        self._columns = [(wv, self.__data[wv.name]._appender()) for wv in wvs]
 
     def __len__(self):
         return len(self.__data)
@@ -965,6 +2144,9 @@ class TraceStorage(collections.Mapping):
     def __iter__(self):
         return iter(self.__data)
 
+    def __contains__(self, key):
+        return getattr(key, 'name', key) in self.__data
+
     def __getitem__(self, key):
         if isinstance(key, WireVector):
             import warnings
@@ -979,9 +2161,25 @@ class TraceStorage(collections.Mapping):
         return self.__data[key]
 
 
+def _named_trace(bitwidths, names, block=None):
+    """ An empty SimulationTrace of the named wires, made in a new block if none given.
+
+    This is for traces read back from files, where the wires are only known by their
+    names and bitwidths (given as a dict) rather than by the design that made them.
+    """
+    if block is None:
+        block = Block()
+        wires = [WireVector(bitwidths[name], name, block) for name in names]
+    else:
+        wires = [block.get_wirevector_by_name(name) for name in names]
+    return SimulationTrace(wires_to_track=wires, block=block)
+
+
 class SimulationTrace(object):
     """ Storage and presentation of simulation waveforms. """
 
+    first_cycle = 0  # the cycle of the first value, for traces of a window of a run
+
     def __init__(self, wires_to_track=None, block=None):
         """
         Creates a new Simulation Trace
@@ -991,13 +2189,9 @@ class SimulationTrace(object):
         """
         self.block = working_block(block)
 
-        def is_internal_name(name):
-            return (name.startswith('tmp') or name.startswith('const') or
-                    # or name.startswith('synth_')
-                    name.endswith("'"))
-
         if wires_to_track is None:
-            wires_to_track = [w for w in self.block.wirevector_set if not is_internal_name(w.name)]
+            wires_to_track = [w for w in self.block.wirevector_set
+                              if not _is_internal_name(w.name)]
         elif wires_to_track == 'all':
             wires_to_track = self.block.wirevector_set
 
@@ -1005,8 +2199,20 @@ class SimulationTrace(object):
             raise PyrtlError("There needs to be at least one named wire "
                              "for simulation to be useful")
         self.wires_to_track = wires_to_track
-        self.trace = TraceStorage(wires_to_track)
+        self.trace = self._new_storage(wires_to_track)
         self._wires = {wv.name: wv for wv in wires_to_track}
+        self.sinks = []
+
+    def _new_storage(self, wires_to_track):
+        return TraceStorage(wires_to_track)
+
+    def assertion_failed(self, wire_name):
+        """ Called by the simulations when an rtl_assert fails, before raising its error.
+
+        :param wire_name: the name of the wire asserted, which was 0 in the last step
+          added to the trace
+        """
+        pass
 
     def __len__(self):
         """ Return the current length of the trace in cycles. """
@@ -1022,20 +2228,58 @@ class SimulationTrace(object):
             raise PyrtlError('error, simulation trace needs at least 1 signal to track '
                              '(by default, unnamed signals are not traced -- try either passing '
                              'a name to a WireVector or setting a "wirevector_subset" option)')
-        for wire in self.trace:
-            tracelist = self.trace[wire]
-            wirevec = self._wires[wire]
-            tracelist.append(value_map[wirevec])
+        for wirevec, append in self.trace._columns:
+            append(value_map[wirevec])
+        if self.sinks:
+            self._sink_step({wv.name: value_map[wv] for wv, _ in self.trace._columns})
 
     def add_step_named(self, value_map):
         for wire in value_map:
             if wire in self.trace:
                 self.trace[wire].append(value_map[wire])
+        if self.sinks:
+            self._sink_step({name: value_map[name] for name in self.trace if name in value_map})
 
     def add_fast_step(self, fastsim):
         """ Add the fastsim context to the trace. """
-        for wire_name in self.trace:
-            self.trace[wire_name].append(fastsim.context[wire_name])
+        context = fastsim.context
+        for wirevec, append in self.trace._columns:
+            append(context[wirevec.name])
+        if self.sinks:
+            self._sink_step(context)
+
+    def extend(self, columns):
+        """ Add many steps at once, given a mapping from wire names to lists of values.
+
+        The lists (which can also be numpy arrays, or any other buffer of 64-bit
+        unsigned ints) must all be of the same length, and there must be one for each
+        wire in the trace.
+        """
+        lengths = {len(columns[name]) for name in self.trace}
+        if len(lengths) > 1:
+            raise PyrtlError('cannot add columns of different lengths to the trace')
+        for name in self.trace:
+            self.trace[name].extend(columns[name])
+        for sink in self.sinks:
+            sink.extend(columns)
+
+    def _sink_step(self, values):
+        for sink in self.sinks:
+            sink.add_step(values)
+
+    def add_sink(self, sink):
+        """ Pass every step added to the trace from now on to sink as well.
+
+        :param sink: an object with the methods add_step(values), called with a dict
+          from the name of each traced wire to its value for each step added, and
+          extend(columns), called with a dict from each name to a list of values when
+          many steps are added at once (such as a VcdWriter)
+        """
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        """ Stop passing the steps added to the trace to sink. """
+        self.sinks = [s for s in self.sinks if s is not sink]
 
     def print_trace(self, file=sys.stdout, base=10, compact=False):
         """
@@ -1111,16 +2355,17 @@ class SimulationTrace(object):
 
         # dump values
         endtime = max([len(self.trace[w]) for w in self.trace])
+        first = self.first_cycle
         for timestamp in range(endtime):
-            print(''.join(['#', str(timestamp*10)]), file=file)
+            print(''.join(['#', str((first + timestamp)*10)]), file=file)
             print_trace_strs(timestamp)
             if include_clock:
                 print('b1 clk', file=file)
                 print('', file=file)
-                print(''.join(['#', str(timestamp*10+5)]), file=file)
+                print(''.join(['#', str((first + timestamp)*10+5)]), file=file)
                 print('b0 clk', file=file)
             print('', file=file)
-        print(''.join(['#', str(endtime*10)]), file=file)
+        print(''.join(['#', str((first + endtime)*10)]), file=file)
         file.flush()
 
     def render_trace(
@@ -1202,7 +2447,7 @@ class SimulationTrace(object):
         if segment_size is None:
             segment_size = maxtracelen
         spaces = ' '*(maxnamelen+1)
-        ticks = [renderer.tick_segment(n, symbol_len, segment_size)
+        ticks = [renderer.tick_segment(self.first_cycle + n, symbol_len, segment_size)
                  for n in range(0, maxtracelen, segment_size)]
         print(spaces + segment_delim.join(ticks), file=file)
 
@@ -1213,3 +2458,58 @@ class SimulationTrace(object):
             print(formatted_trace_line(w, self.trace[w]), file=file)
         if extra_line:
             print(file=file)
+
+
+class BoundedSimulationTrace(SimulationTrace):
+    """ A simulation trace keeping only the values of the last max_cycles cycles.
+
+    Each wire is traced into a circular buffer (see RingTraceColumn) of max_cycles
+    values, so the memory used stays the same however long the simulation runs.  The
+    trace looks just like a SimulationTrace of the cycles it still holds, so that
+    print_trace, render_trace, print_vcd and trace_to_html all show that window, with
+    first_cycle telling the cycle it starts at (which render_trace and print_vcd use
+    to number the cycles).
+
+    Example::
+
+        tracer = pyrtl.BoundedSimulationTrace(max_cycles=100, dump_file='failure.vcd')
+        sim = pyrtl.FastSimulation(tracer=tracer)
+        sim.step_multiple(stimulus)  # writes the last 100 cycles if an rtl_assert fails
+    """
+
+    def __init__(self, wires_to_track=None, block=None, max_cycles=1000, dump_file=None,
+                 include_clock=False):
+        """
+        :param wires_to_track: the wires that the tracer should track
+        :param block: the block of the wires
+        :param max_cycles: the number of the most recent cycles to keep
+        :param dump_file: a file (or the name of a file to create) to write the trace
+          to as a VCD (see print_vcd) when an rtl_assert fails, if any
+        :param include_clock: whether the VCD dump includes the implicit clock
+        """
+        if max_cycles < 1:
+            raise PyrtlError('max_cycles must be at least 1')
+        self.max_cycles = max_cycles
+        self.dump_file = dump_file
+        self.include_clock = include_clock
+        super(BoundedSimulationTrace, self).__init__(wires_to_track, block)
+
+    def _new_storage(self, wires_to_track):
+        return TraceStorage(wires_to_track,
+                            lambda bitwidth: RingTraceColumn(bitwidth, self.max_cycles))
+
+    @property
+    def first_cycle(self):
+        """ The cycle of the oldest value still in the trace. """
+        column = next(iter(self.trace.values()))
+        return column._total - len(column)
+
+    def assertion_failed(self, wire_name):
+        """ Dump the trace to dump_file, if given (see __init__). """
+        if self.dump_file is None:
+            return
+        if isinstance(self.dump_file, six.string_types):
+            with io.open(self.dump_file, 'w') as f:
+                self.print_vcd(f, include_clock=self.include_clock)
+        else:
+            self.print_vcd(self.dump_file, include_clock=self.include_clock)
@@ -0,0 +1,185 @@
+"""Comparing two simulation traces, wire by wire.
+
+trace_diff lines up two SimulationTraces by cycle (using their first_cycle, so that
+windows of longer runs compare too) and reports, for every wire in both, the first
+cycle its values diverge and how many cycles they differ in.  The columns of wires of
+up to 64 bits are compared with numpy, straight from the arrays they are stored in,
+when numpy is installed; other columns are compared a value at a time.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import array
+import collections
+import sys
+
+from .pyrtlexceptions import PyrtlError
+
+
+__all__ = ['trace_diff', 'TraceDiff', 'WireDiff']
+
+
+class WireDiff(collections.namedtuple(
+        'WireDiff', ['name', 'first_divergence', 'mismatches', 'expected', 'actual'])):
+    """ The differences in the values of one wire between two traces.
+
+    first_divergence is the first cycle in which the values differ (or None if they
+    never do), mismatches is the number of cycles they differ in, and expected and
+    actual are the values of the two traces in the first cycle they differ (or None).
+    """
+    __slots__ = ()
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _column_array(np, column, start, stop):
+    """ A numpy view of the values of a column, if stored in an array of uint64. """
+    from .simulation import TraceColumn
+    if type(column) is TraceColumn and isinstance(column._data, array.array):
+        return np.frombuffer(column._data, dtype=np.uint64)[start:stop]
+    return None
+
+
+def _compare(np, expected, actual, estart, astart, cycles):
+    """ The number of differences and the offset of the first one in two columns. """
+    if np is not None:
+        a = _column_array(np, expected, estart, estart + cycles)
+        b = _column_array(np, actual, astart, astart + cycles)
+        if a is not None and b is not None:
+            differ = a != b
+            count = int(np.count_nonzero(differ))
+            return count, (int(np.argmax(differ)) if count else None)
+    count, first = 0, None
+    for i, (a, b) in enumerate(zip(expected[estart:estart + cycles],
+                                   actual[astart:astart + cycles])):
+        if a != b:
+            if first is None:
+                first = i
+            count += 1
+    return count, first
+
+
+class TraceDiff(object):
+    """ The differences between two simulation traces, as made by trace_diff.
+
+    * *.wires*: a dict from the name of each wire compared to its WireDiff
+    * *.cycles*: the cycles compared (those in both traces), as a pair of the first
+      cycle and the one after the last
+    * *.only_expected*, *.only_actual*: the names of the wires in one trace only
+    * *.expected_cycles*, *.actual_cycles*: the cycles of each of the two traces, as
+      pairs like cycles
+    """
+
+    def __init__(self, wires, cycles, only_expected, only_actual, expected_cycles,
+                 actual_cycles):
+        self.wires = wires
+        self.cycles = cycles
+        self.only_expected = only_expected
+        self.only_actual = only_actual
+        self.expected_cycles = expected_cycles
+        self.actual_cycles = actual_cycles
+
+    @property
+    def diverged(self):
+        """ The WireDiffs of the wires whose values differ, by first divergence. """
+        return sorted((d for d in self.wires.values() if d.mismatches),
+                      key=lambda d: (d.first_divergence, d.name))
+
+    @property
+    def first_divergence(self):
+        """ The first cycle in which any wire differs, or None. """
+        diverged = self.diverged
+        return diverged[0].first_divergence if diverged else None
+
+    @property
+    def mismatches(self):
+        """ The total number of values that differ, over all wires and cycles. """
+        return sum(d.mismatches for d in self.wires.values())
+
+    def __bool__(self):
+        """ Whether the traces differ at all (in values, wires, or cycles). """
+        return bool(self.mismatches or self.only_expected or self.only_actual
+                    or self.expected_cycles != self.actual_cycles)
+
+    __nonzero__ = __bool__
+
+    def print_summary(self, file=sys.stdout):
+        """ Print the differences found, a line per wire that differs. """
+        if not self:
+            print('traces match (%d wires, %d cycles)'
+                  % (len(self.wires), self.cycles[1] - self.cycles[0]), file=file)
+            return
+        if self.expected_cycles != self.actual_cycles:
+            print('cycles differ: expected %d to %d, actual %d to %d'
+                  % (self.expected_cycles[0], self.expected_cycles[1] - 1,
+                     self.actual_cycles[0], self.actual_cycles[1] - 1), file=file)
+        if self.only_expected:
+            print('only in expected: ' + ', '.join(self.only_expected), file=file)
+        if self.only_actual:
+            print('only in actual: ' + ', '.join(self.only_actual), file=file)
+        diverged = self.diverged
+        print('%d of %d wires differ in %d values over %d cycles'
+              % (len(diverged), len(self.wires), self.mismatches,
+                 self.cycles[1] - self.cycles[0]), file=file)
+        for d in diverged:
+            print('  %s: first differs in cycle %d (expected %d, actual %d), %d cycles differ'
+                  % (d.name, d.first_divergence, d.expected, d.actual, d.mismatches),
+                  file=file)
+
+
+def trace_diff(expected, actual, names=None):
+    """ Compare two simulation traces, wire by wire and cycle by cycle.
+
+    :param expected: the SimulationTrace to compare against (such as a golden model)
+    :param actual: the SimulationTrace to compare
+    :param names: the names of the wires to compare, defaults to those in both traces
+    :return: a TraceDiff, which is true if the traces differ at all
+
+    The traces are compared in the cycles they both hold, going by their first_cycle
+    (which is 0 but for windows of runs, as kept by a BoundedSimulationTrace or read
+    with TraceFileReader.trace).  This makes it easy to check two simulations of a
+    design against each other, or a design against the trace of an external simulator
+    read with input_from_vcd. ::
+
+        diff = pyrtl.trace_diff(golden_sim.tracer, sim.tracer)
+        if diff:
+            diff.print_summary()
+    """
+    from .simulation import _trace_sort_key
+    if names is None:
+        names = [name for name in expected.trace if name in actual.trace]
+        only_expected = sorted((name for name in expected.trace if name not in actual.trace),
+                               key=_trace_sort_key)
+        only_actual = sorted((name for name in actual.trace if name not in expected.trace),
+                             key=_trace_sort_key)
+    else:
+        missing = [name for name in names if name not in expected.trace or
+                   name not in actual.trace]
+        if missing:
+            raise PyrtlError('cannot find %s in both traces' % ', '.join(missing))
+        only_expected, only_actual = [], []
+
+    expected_cycles = (expected.first_cycle, expected.first_cycle + len(expected))
+    actual_cycles = (actual.first_cycle, actual.first_cycle + len(actual))
+    first = max(expected_cycles[0], actual_cycles[0])
+    cycles = (first, max(first, min(expected_cycles[1], actual_cycles[1])))
+
+    np = _numpy()
+    wires = {}
+    for name in names:
+        ecolumn, acolumn = expected.trace[name], actual.trace[name]
+        estart, astart = first - expected.first_cycle, first - actual.first_cycle
+        count, offset = _compare(np, ecolumn, acolumn, estart, astart, cycles[1] - first)
+        if offset is None:
+            wires[name] = WireDiff(name, None, 0, None, None)
+        else:
+            wires[name] = WireDiff(name, first + offset, count, ecolumn[estart + offset],
+                                   acolumn[astart + offset])
+    return TraceDiff(wires, cycles, only_expected, only_actual, expected_cycles,
+                     actual_cycles)
@@ -0,0 +1,344 @@
+"""A compact binary file format for simulation traces, with random access by cycle.
+
+A trace file starts with a header giving the name and bitwidth of each traced wire.
+The values follow in blocks of a fixed number of cycles.  Each block holds one stream
+per wire, which encodes the runs of equal values in the block: the length of each run,
+then the difference from the value of the previous run.  Both are LEB128 varints, and
+the difference is zigzag encoded.  The first run of a block is relative to 0, so every
+block can be decoded on its own.  The file ends with an index of the blocks (their
+first cycle, number of cycles and offset) and a trailer that points to the index.
+
+A TraceFileWriter writes a trace file while the simulation runs, attached to its trace
+just like a VcdWriter.  A TraceFileReader memory-maps a trace file.  Looking up the
+value of a wire at some cycle, or a window of cycles, only decodes the blocks it needs.
+
+Layout (all integers little endian)::
+
+    header:  b'PYRTLTRC', version (u16), wire count (u32), first cycle (u64),
+             cycles per block (u32), then for each wire its bitwidth (u32),
+             the length of its utf-8 name (u16) and the name
+    block:   cycle count (u32), byte length of each wire's stream (u32 each),
+             then the streams
+    index:   for each block its first cycle, cycle count and offset (u64 each)
+    trailer: offset of the index (u64), block count (u64), b'PYRTLIDX'
+"""
+
+from __future__ import print_function, unicode_literals
+
+import bisect
+import io
+import mmap
+import struct
+import six
+
+from .pyrtlexceptions import PyrtlError
+
+
+__all__ = ['TraceFileWriter', 'TraceFileReader']
+
+
+_MAGIC = b'PYRTLTRC'
+_INDEX_MAGIC = b'PYRTLIDX'
+_VERSION = 1
+_HEADER = struct.Struct(str('<8sHIQI'))
+_WIRE = struct.Struct(str('<IH'))
+_INDEX_ENTRY = struct.Struct(str('<QQQ'))
+_TRAILER = struct.Struct(str('<QQ8s'))
+
+
+def _encode_runs(values, out):
+    """ Append the run-length and delta encoding of a list of values to a bytearray. """
+    prev = 0
+    i, n = 0, len(values)
+    while i < n:
+        value = values[i]
+        j = i + 1
+        while j < n and values[j] == value:
+            j += 1
+        delta = value - prev
+        for number in (j - i, (delta << 1) if delta >= 0 else ((-delta << 1) - 1)):
+            while number > 0x7f:
+                out.append((number & 0x7f) | 0x80)
+                number >>= 7
+            out.append(number)
+        prev = value
+        i = j
+
+
+def _varint(data, pos):
+    """ The LEB128 varint at data[pos] and the position after it. """
+    number = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+def _decode_runs(data, start, end):
+    """ The (run length, value) pairs encoded in data[start:end]. """
+    runs = []
+    value = 0
+    pos = start
+    while pos < end:
+        length, pos = _varint(data, pos)
+        zigzag, pos = _varint(data, pos)
+        value += -((zigzag + 1) >> 1) if zigzag & 1 else zigzag >> 1
+        runs.append((length, value))
+    return runs
+
+
+class TraceFileWriter(object):
+    """ Writes the trace of a simulation to a binary trace file as it runs.
+
+    Example::
+
+        sim = pyrtl.FastSimulation(tracer=pyrtl.BoundedSimulationTrace(max_cycles=1))
+        with pyrtl.TraceFileWriter('run.trace', sim):
+            sim.sim_run(stimulus)
+
+    Like a VcdWriter, the writer adds itself to the sinks of the trace, to be handed
+    every cycle the simulation adds to it, and removes itself when closed.  The cycles
+    are collected until there are enough for a block, which is then encoded and
+    written, so only one block of values is held in memory at a time.  The index is
+    written when the writer is closed, and a file is only readable after that.
+    """
+
+    def __init__(self, file, trace, block_cycles=4096):
+        """
+        :param file: the binary file (or the name of a file to create) to write to
+        :param trace: the SimulationTrace to write, or a simulation with a tracer
+        :param block_cycles: the number of cycles in each block of the file
+        """
+        trace = getattr(trace, 'tracer', trace)
+        if trace is None:
+            raise PyrtlError('the simulation has no tracer to write a trace file of')
+        if block_cycles < 1:
+            raise PyrtlError('block_cycles must be at least 1')
+        from .simulation import _trace_sort_key
+        self._names = sorted(trace.trace, key=_trace_sort_key)
+        self._pending = [[] for name in self._names]
+        self._index = []
+        self.block_cycles = block_cycles
+        self.cycle = trace.first_cycle + len(trace)
+
+        self._owns_file = isinstance(file, six.string_types)
+        self.file = io.open(file, 'wb') if self._owns_file else file
+        header = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(self._names), self.cycle,
+                                        block_cycles))
+        for name in self._names:
+            encoded = name.encode('utf-8')
+            header += _WIRE.pack(trace._wires[name].bitwidth, len(encoded))
+            header += encoded
+        self.file.write(bytes(header))
+        self._offset = len(header)
+
+        self.trace = trace
+        trace.add_sink(self)
+
+    def _write_block(self, steps):
+        streams = []
+        for pending in self._pending:
+            stream = bytearray()
+            _encode_runs(pending[:steps], stream)
+            del pending[:steps]
+            streams.append(stream)
+        block = bytearray(struct.pack(str('<%dI' % (len(streams) + 1)), steps,
+                                      *[len(stream) for stream in streams]))
+        for stream in streams:
+            block += stream
+        self.file.write(bytes(block))
+        self._index.append((self.cycle, steps, self._offset))
+        self._offset += len(block)
+        self.cycle += steps
+
+    def add_step(self, values):
+        """ Add one cycle, given a mapping from wire names to their values. """
+        for name, pending in zip(self._names, self._pending):
+            pending.append(values[name])
+        if len(self._pending[0]) >= self.block_cycles:
+            self._write_block(self.block_cycles)
+
+    def extend(self, columns):
+        """ Add many cycles, given a mapping from wire names to lists of values. """
+        for name, pending in zip(self._names, self._pending):
+            column = columns[name]
+            pending.extend(column.tolist() if hasattr(column, 'tolist') else column)
+        while len(self._pending[0]) >= self.block_cycles:
+            self._write_block(self.block_cycles)
+
+    def close(self):
+        """ Write the last block and the index, detach from the trace and close the file
+        (if opened here). """
+        if self.trace is None:
+            return
+        self.trace.remove_sink(self)
+        self.trace = None
+        if self._pending[0]:
+            self._write_block(len(self._pending[0]))
+        index = bytearray()
+        for entry in self._index:
+            index += _INDEX_ENTRY.pack(*entry)
+        index += _TRAILER.pack(self._offset, len(self._index), _INDEX_MAGIC)
+        self.file.write(bytes(index))
+        self.file.flush()
+        if self._owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TraceFileReader(object):
+    """ Reads a binary trace file written by a TraceFileWriter, without loading it all.
+
+    Example::
+
+        with pyrtl.TraceFileReader('run.trace') as reader:
+            print(reader.value('o', 123456))
+            reader.trace(1000, 1100).render_trace()
+
+    The file is memory mapped, and only the blocks holding the cycles asked for are
+    decoded.  Cycles are numbered as in the simulation, from first_cycle (the cycle
+    the writer was attached at) to first_cycle + len(reader).
+    """
+
+    def __init__(self, file):
+        """
+        :param file: the name of the trace file (or a binary file object open on it)
+        """
+        self._owns_file = isinstance(file, six.string_types)
+        self.file = io.open(file, 'rb') if self._owns_file else file
+        try:
+            self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):  # also raised for empty files
+            self._map = None
+            self.close()
+            raise PyrtlError('cannot memory map the trace file')
+        data = self._map
+        if len(data) < _HEADER.size + _TRAILER.size:
+            self.close()
+            raise PyrtlError('not a PyRTL trace file (too short)')
+        magic, version, nwires, self.first_cycle, self.block_cycles = \
+            _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise PyrtlError('not a PyRTL trace file')
+        if version != _VERSION:
+            self.close()
+            raise PyrtlError('unsupported trace file version %d' % version)
+        index_offset, nblocks, magic = _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+        if magic != _INDEX_MAGIC:
+            self.close()
+            raise PyrtlError('trace file has no index (was its writer closed?)')
+
+        self.names = []
+        self.bitwidths = {}
+        pos = _HEADER.size
+        for i in range(nwires):
+            bitwidth, length = _WIRE.unpack_from(data, pos)
+            pos += _WIRE.size
+            name = data[pos:pos + length].decode('utf-8')
+            pos += length
+            self.names.append(name)
+            self.bitwidths[name] = bitwidth
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+        self._index = [_INDEX_ENTRY.unpack_from(data, index_offset + i * _INDEX_ENTRY.size)
+                       for i in range(nblocks)]
+        self._starts = [entry[0] for entry in self._index]
+        self._cycles = sum(entry[1] for entry in self._index)
+
+    def __len__(self):
+        """ The number of cycles in the file. """
+        return self._cycles
+
+    def _block(self, cycle):
+        if not self.first_cycle <= cycle < self.first_cycle + self._cycles:
+            raise PyrtlError('cycle %d is not in the trace file (cycles %d to %d)'
+                             % (cycle, self.first_cycle, self.first_cycle + self._cycles - 1))
+        return bisect.bisect_right(self._starts, cycle) - 1
+
+    def _runs(self, block, name):
+        if name not in self._positions:
+            raise PyrtlError('cannot find "%s" in the trace file' % name)
+        first, steps, offset = self._index[block]
+        position = self._positions[name]
+        lengths = struct.unpack_from(str('<%dI' % (position + 1)), self._map,
+                                     offset + 4)
+        start = offset + 4 * (len(self.names) + 1) + sum(lengths[:position])
+        # a bytearray of the stream, as indexing the map gives strs on python 2
+        stream = bytearray(self._map[start:start + lengths[position]])
+        return _decode_runs(stream, 0, len(stream))
+
+    def value(self, name, cycle):
+        """ The value of the wire of the given name in the given cycle. """
+        block = self._block(cycle)
+        remaining = cycle - self._starts[block]
+        for length, value in self._runs(block, name):
+            if remaining < length:
+                return value
+            remaining -= length
+        raise PyrtlError('corrupt trace file')
+
+    def window(self, start=None, stop=None, names=None):
+        """ The values of the cycles from start up to (but not including) stop.
+
+        :param start: the first cycle, defaults to the first in the file
+        :param stop: the cycle after the last, defaults to the end of the file
+        :param names: the names of the wires to read, defaults to all of them
+        :return: a dict from the name of each wire to the list of its values
+        """
+        end = self.first_cycle + self._cycles
+        start = self.first_cycle if start is None else start
+        stop = end if stop is None else min(stop, end)
+        names = self.names if names is None else names
+        columns = {name: [] for name in names}
+        if start >= stop:
+            return columns
+        for block in range(self._block(start), self._block(stop - 1) + 1):
+            first = self._starts[block]
+            lo, hi = max(start - first, 0), stop - first
+            for name in names:
+                values = []
+                for length, value in self._runs(block, name):
+                    values.extend([value] * length)
+                columns[name].extend(values[lo:hi])
+        return columns
+
+    def trace(self, start=None, stop=None, names=None, block=None):
+        """ A SimulationTrace of the cycles from start up to (but not including) stop.
+
+        :param start: the first cycle, defaults to the first in the file
+        :param stop: the cycle after the last, defaults to the end of the file
+        :param names: the names of the wires to include, defaults to all of them
+        :param block: a block with wires of the names in the file to trace, by
+          default a new block is made with a WireVector for each of them
+        :return: a SimulationTrace with first_cycle set to start
+        """
+        from .simulation import _named_trace
+        names = self.names if names is None else names
+        columns = self.window(start, stop, names)
+        trace = _named_trace(self.bitwidths, names, block)
+        trace.extend(columns)
+        trace.first_cycle = self.first_cycle if start is None else start
+        return trace
+
+    def close(self):
+        """ Unmap the file (and close it, if opened here). """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -20,7 +20,7 @@ structures (through Block.logic, block.Wirevector_set, etc).
 """
 import functools
 
-from .core import set_working_block, LogicNet, working_block
+from .core import set_working_block, LogicNet, working_block, _name_sort_key
 from .wire import Const, Input, Output, WireVector, Register
 
 
@@ -34,7 +34,7 @@ def net_transform(transform_func, block=None, **kwargs):
     """
     block = working_block(block)
     with set_working_block(block, True):
-        for net in block.logic.copy():
+        for net in block._logic_in_order():
             keep_orig_net = transform_func(net, **kwargs)
             if not keep_orig_net:
                 block.logic.remove(net)
@@ -115,7 +115,8 @@ def replace_wires(wire_map, block=None):
     """
     block = working_block(block)
     src_nets, dst_nets = block.net_connections(include_virtual_nodes=False)
-    for old_w, new_w in wire_map.items():
+    # in order of the names, so that the new nets are always numbered the same way
+    for old_w, new_w in sorted(wire_map.items(), key=lambda item: _name_sort_key(item[0].name)):
         replace_wire_fast(old_w, new_w, new_w, src_nets, dst_nets, block)
 
 
@@ -192,7 +193,7 @@ def copy_block(block=None, update_working_block=True):
     block_in = working_block(block)
     block_out, temp_wv_map = _clone_block_and_wires(block_in)
     mems = {}
-    for net in block_in.logic:
+    for net in block_in._logic_in_order():
         _copy_net(block_out, net, temp_wv_map, mems)
     block_out.mem_map = mems
 
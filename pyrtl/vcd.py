@@ -0,0 +1,335 @@
+"""Streaming value change dumps of simulation traces.
+
+Where SimulationTrace.print_vcd dumps a whole trace once the simulation is over, a
+VcdWriter is attached to the trace of a running simulation and writes each cycle to
+the file as the simulation adds it, so that the dump never needs the whole trace at
+once.  Only the values that changed are written for each cycle, as short VCD
+identifier codes, which makes the files far smaller than those of print_vcd.
+
+input_from_vcd goes the other way, reading a VCD file (from PyRTL or from another
+simulator) back into a SimulationTrace.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import collections
+import io
+import re
+import six
+
+from .pyrtlexceptions import PyrtlError
+from .verilog import _VerilogSanitizer
+
+
+__all__ = ['VcdWriter', 'input_from_vcd']
+
+
+def _identifier(index):
+    """ The VCD identifier code for the index-th signal ('!', '"', ..., '!!', ...). """
+    code = ''
+    index += 1
+    while index:
+        index, digit = divmod(index - 1, 94)
+        code = chr(33 + digit) + code
+    return code
+
+
+class VcdWriter(object):
+    """ Writes the trace of a simulation to a VCD file, cycle by cycle, as it runs.
+
+    Example::
+
+        sim = pyrtl.Simulation()
+        with pyrtl.VcdWriter('waves.vcd', sim, include_clock=True):
+            for cycle in range(1000000):
+                sim.step({'a': cycle & 0xff})
+
+    The writer adds itself to the sinks of the trace, which hand it every cycle the
+    simulation adds to the trace (whether one step at a time or a whole run at once),
+    and it removes itself again when closed.  Writing to the file is buffered, so that
+    it is done in large pieces rather than a line at a time.  The time of a cycle is
+    ten times its index in the trace (as in print_vcd), with the optional clock rising
+    at the start of each cycle and falling half way through.
+
+    The writer can also be given the values of cycles directly (with add_step and
+    extend, as the trace does), for example as the callback of
+    CompiledSimulation.run_stream, to dump a run that is not traced in memory at all.
+    """
+
+    def __init__(self, file, trace, include_clock=False, buffer_size=1 << 16):
+        """
+        :param file: the file (or the name of a file to create) to write the dump to
+        :param trace: the SimulationTrace to write, or a simulation with a tracer
+        :param include_clock: whether to include the implicit clock as a signal 'clk'
+        :param buffer_size: the number of characters to collect before writing them
+        """
+        trace = getattr(trace, 'tracer', trace)
+        if trace is None:
+            raise PyrtlError('the simulation has no tracer to write a VCD of')
+        from .simulation import _trace_sort_key
+        names = sorted(trace.trace, key=_trace_sort_key)
+        sanitizer = _VerilogSanitizer('_vcd_tmp_')
+        self._names = names
+        self._codes = [_identifier(i) for i in range(len(names))]
+        self._widths = [trace._wires[name].bitwidth for name in names]
+        self._last = [None] * len(names)
+        self._started = False
+        self._clock = _identifier(len(names)) if include_clock else None
+        self._buffer = []
+        self._buffered = 0
+        self.buffer_size = buffer_size
+        self.cycle = trace.first_cycle + len(trace)
+
+        self._owns_file = isinstance(file, six.string_types)
+        self.file = io.open(file, 'w') if self._owns_file else file
+        self._write('$timescale 1ns $end\n$scope module logic $end\n')
+        if include_clock:
+            self._write('$var wire 1 %s clk $end\n' % self._clock)
+        for name, code, width in zip(names, self._codes, self._widths):
+            self._write('$var wire %d %s %s $end\n'
+                        % (width, code, sanitizer.make_valid_string(name)))
+        self._write('$upscope $end\n$enddefinitions $end\n')
+
+        self.trace = trace
+        trace.add_sink(self)
+
+    def _write(self, text):
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size:
+            self.flush(file=False)
+
+    def flush(self, file=True):
+        """ Write out everything buffered so far (and flush the file itself too). """
+        if self._buffer:
+            self.file.write(''.join(self._buffer))
+            del self._buffer[:]
+            self._buffered = 0
+        if file:
+            self.file.flush()
+
+    def _change(self, i, value):
+        if self._widths[i] == 1:
+            return '%d%s\n' % (value, self._codes[i])
+        return 'b{0:b} {1}\n'.format(value, self._codes[i])
+
+    def _cycle(self, changes):
+        time = self.cycle * 10
+        if not self._started:
+            # the first cycle dumps every signal
+            self._started = True
+            changes = '$dumpvars\n%s%s$end\n' % (
+                '1%s\n' % self._clock if self._clock else '', changes)
+        elif self._clock:
+            changes = '1%s\n%s' % (self._clock, changes)
+        if self._clock:
+            self._write('#%d\n%s#%d\n0%s\n' % (time, changes, time + 5, self._clock))
+        elif changes:
+            self._write('#%d\n%s' % (time, changes))
+
+    def add_step(self, values):
+        """ Write one cycle, given a mapping from wire names to their values. """
+        last = self._last
+        changes = []
+        for i, name in enumerate(self._names):
+            value = values.get(name, last[i])
+            if value != last[i]:
+                changes.append(self._change(i, value))
+                last[i] = value
+        self._cycle(''.join(changes))
+        self.cycle += 1
+
+    def extend(self, columns):
+        """ Write many cycles, given a mapping from wire names to lists of values. """
+        steps = len(columns[self._names[0]])
+        changes = collections.defaultdict(list)
+        for i, name in enumerate(self._names):
+            column = columns[name]
+            if hasattr(column, 'tolist'):  # numpy arrays, to compare python ints
+                column = column.tolist()
+            prev = self._last[i]
+            for step, value in enumerate(column):
+                if value != prev:
+                    changes[step].append(self._change(i, value))
+                    prev = value
+            self._last[i] = prev
+        # without a clock, only the cycles in which something changed are written
+        start = self.cycle
+        for step in range(steps) if self._clock else sorted(changes):
+            self.cycle = start + step
+            self._cycle(''.join(changes.get(step, ())))
+        self.cycle = start + steps
+
+    def close(self):
+        """ Finish the dump, detach from the trace and close the file if opened here. """
+        if self.trace is None:
+            return
+        self.trace.remove_sink(self)
+        self.trace = None
+        self._write('#%d\n' % (self.cycle * 10))
+        self.flush()
+        if self._owns_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _vcd_tokens(lines):
+    for line in lines:
+        for token in line.split():
+            yield token
+
+
+def _skip_to_end(tokens):
+    for token in tokens:
+        if token == '$end':
+            return
+    raise PyrtlError('unexpected end of VCD file, missing $end')
+
+
+def _vcd_value(text, bitwidth):
+    """ The integer of a VCD vector value (with x and z read as 0). """
+    text = _XZ.sub('0', text)
+    try:
+        return int(text, 2) & ((1 << bitwidth) - 1)
+    except ValueError:
+        raise PyrtlError('invalid VCD value "%s"' % text)
+
+
+_XZ = re.compile('[xXzZuUwW-]')
+
+
+def input_from_vcd(vcd, period=10, scope=None, names=None, block=None):
+    """ Read a VCD file into a SimulationTrace, one cycle every period time units.
+
+    :param vcd: an open VCD file, or its contents as a string
+    :param period: the time between cycles (10 for the dumps of PyRTL's print_vcd
+      and VcdWriter, and for the testbenches of output_verilog_testbench)
+    :param scope: the dotted path of the scope to read the variables of (such as
+      'tb.block'), defaults to all scopes, where a name declared in several of them
+      is read from the first
+    :param names: the names of the variables to read, defaults to all of them but the
+      clock 'clk' (which the VCD files of PyRTL add, and designs cannot use as a name)
+    :param block: a block with wires of the names read, by default a new block is
+      made with a WireVector for each variable of its size
+    :return: a SimulationTrace of the values of the variables in each cycle
+
+    Cycle i of the trace holds the values the variables had at time i*period (after
+    the changes at that time), and the trace runs up to the last time in the file.
+    The file is read as a stream, keeping only the changes of each variable until
+    the columns of the trace are built at the end.  Unknown (x) and high impedance (z)
+    bits are read as 0, and real values are not supported. ::
+
+        with open('waves.vcd') as f:
+            trace = pyrtl.input_from_vcd(f, scope='tb')
+    """
+    if isinstance(vcd, six.string_types):
+        vcd = vcd.splitlines()
+    if period < 1:
+        raise PyrtlError('period must be at least 1')
+    tokens = _vcd_tokens(vcd)
+
+    # the declarations: the name, bitwidth and changes of the variable of each code
+    variables = {}
+    order = []
+    scopes = []
+    for token in tokens:
+        if token == '$scope':
+            next(tokens, None)  # the kind of scope, such as module
+            scopes.append(next(tokens, ''))
+            _skip_to_end(tokens)
+        elif token == '$upscope':
+            scopes.pop()
+            _skip_to_end(tokens)
+        elif token == '$var':
+            fields = []
+            for field in tokens:
+                if field == '$end':
+                    break
+                fields.append(field)
+            if len(fields) < 4:
+                raise PyrtlError('invalid VCD variable "%s"' % ' '.join(fields))
+            size, code, name = int(fields[1]), fields[2], fields[3]
+            if scope is not None and '.'.join(scopes) != scope:
+                continue
+            if (name == 'clk') if names is None else (name not in names):
+                continue
+            if code not in variables and name not in order:
+                variables[code] = (name, size, [])
+                order.append(name)
+        elif token == '$enddefinitions':
+            _skip_to_end(tokens)
+            break
+        elif token.startswith('$'):
+            _skip_to_end(tokens)
+    if names is not None:
+        missing = set(names).difference(order)
+        if missing:
+            raise PyrtlError('cannot find %s in the VCD file' % ', '.join(sorted(missing)))
+    if not variables:
+        raise PyrtlError('no variables to read in the VCD file')
+
+    # the changes, as (cycle, value) pairs where cycle is the first one they show in
+    time = 0
+    cycle = 0
+    last_change = None
+    for token in tokens:
+        first = token[0]
+        if first == '#':
+            time = int(token[1:])
+            cycle = -(-time // period)
+        elif first in 'bB':
+            code = next(tokens, None)
+            if code in variables:
+                name, size, changes = variables[code]
+                _add_change(changes, cycle, _vcd_value(token[1:], size))
+                last_change = time
+        elif first in '01xXzZ':
+            code = token[1:]
+            if code in variables:
+                name, size, changes = variables[code]
+                _add_change(changes, cycle, 1 if first == '1' else 0)
+                last_change = time
+        elif first in 'rR':
+            code = next(tokens, None)
+            if code in variables:
+                raise PyrtlError('real values (of "%s") are not supported'
+                                 % variables[code][0])
+        elif token == '$comment':
+            _skip_to_end(tokens)
+        elif first != '$':
+            raise PyrtlError('invalid VCD value change "%s"' % token)
+
+    # the cycles up to the last time, and the last time too if there were changes then
+    cycles = -(-time // period)
+    if last_change == time and time % period == 0:
+        cycles += 1
+
+    bitwidths = {name: size for name, size, changes in variables.values()}
+    from .simulation import _named_trace
+    trace = _named_trace(bitwidths, order, block)
+    columns = {}
+    for name, size, changes in variables.values():
+        column = []
+        value = 0
+        start = 0
+        for change, new_value in changes:
+            if change >= cycles:
+                break
+            column.extend([value] * (change - start))
+            value, start = new_value, change
+        column.extend([value] * (cycles - start))
+        columns[name] = column
+    trace.extend(columns)
+    return trace
+
+
+def _add_change(changes, cycle, value):
+    if changes and changes[-1][0] == cycle:
+        changes[-1] = (cycle, value)  # only the last change before a cycle shows
+    else:
+        changes.append((cycle, value))
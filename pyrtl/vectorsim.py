@@ -0,0 +1,368 @@
+"""Lockstep simulation of many independent testbenches with NumPy.
+
+Every wire holds a NumPy vector with one entry per testbench ("lane"), so each net of
+the block is evaluated for all of the lanes with a single array operation.  Wires of up to
+64 bits are stored as uint64 vectors, and wider wires fall back to vectors of Python ints
+(dtype object).  NumPy is only needed when a VectorSimulation is created.
+"""
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import numbers
+
+from .pyrtlexceptions import PyrtlError
+from .core import working_block
+from .wire import Input, Const, Register, WireVector
+from .memory import RomBlock
+from .simulation import Simulation, FastSimulation, _trace_sort_key
+
+
+__all__ = ['VectorSimulation']
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise PyrtlError('need numpy installed for VectorSimulation (try "pip install numpy")')
+    return numpy
+
+
+class VectorSimulation(object):
+    """Simulate the same block for many independent stimulus streams at once.
+
+    Instead of a single value, every input takes a vector of values (one for each lane)
+    each cycle, and every wire, register and memory keeps separate state for each lane.
+    The lanes never interact; running a VectorSimulation with N lanes gives the same
+    results as running N separate Simulations, but evaluates each net only once per
+    cycle.  This makes it easy to run a constrained random test for thousands of seeds::
+
+        sim = pyrtl.VectorSimulation(lanes=1000)
+        for cycle in range(100):
+            sim.step({'a': numpy.random.randint(0, 256, 1000)})
+        results = sim.inspect('out')  # a vector with the value of 'out' in each lane
+
+    Memories are held as 2D arrays, indexed by [lane, address], and so are limited to
+    an address width of at most `max_mem_addrwidth` bits.  There is no SimulationTrace
+    (as each wire has a vector of values), but rtl_assert is checked every cycle, and
+    fails if it fails in any of the lanes.
+    """
+
+    max_mem_addrwidth = 16
+
+    # the ops whose semantics in Simulation.simple_func carry over to arrays unchanged
+    _elementwise_ops = 'w~&|^n+-*'
+
+    def __init__(
+            self, lanes, register_value_map=None, memory_value_map=None,
+            default_value=0, block=None):
+        """ Creates a new lockstep simulator.
+
+        :param lanes: the number of independent testbenches to run side by side
+        :param register_value_map: the initial value of registers, {Register: value}, where
+          value is either a single value for all lanes or a sequence of one value per lane
+        :param memory_value_map: initial values of memories in the format
+          {MemBlock: {address: value}}, where again value can be given for all lanes or
+          per lane
+        :param default_value: the value that all unspecified registers and memories will
+          initialize to
+        :param block: the block to simulate, defaults to the working block
+
+        All changes to the circuit after calling this function will not be reflected in
+        the simulation.
+        """
+        self.np = _import_numpy()
+        block = working_block(block)
+        block.sanity_check()  # check that this is a good hw block
+        if lanes < 1:
+            raise PyrtlError('VectorSimulation needs at least one lane')
+
+        self.block = block
+        self.lanes = lanes
+        self.default_value = default_value
+        self._lane_index = self.np.arange(lanes)
+        self._initialize(register_value_map, memory_value_map)
+
+    def _dtype(self, wire):
+        return self.np.uint64 if wire.bitwidth <= 64 else object
+
+    def _vector(self, value, wire):
+        """ Turn a value for all lanes (or a sequence of per-lane values) into a vector
+        for the given WireVector or MemBlock. """
+        np = self.np
+        if isinstance(value, numbers.Integral):
+            value = [int(value)] * self.lanes
+        vec = np.array(value, dtype=object)
+        if vec.shape != (self.lanes,):
+            raise PyrtlError('need a value for each of the %d lanes for "%s"'
+                             % (self.lanes, wire.name))
+        if (vec < 0).any() or (vec >> wire.bitwidth).any():
+            raise PyrtlError('Wire {} has a value which cannot be represented'
+                             ' using its bitwidth'.format(wire.name))
+        return vec.astype(self._dtype(wire))
+
+    def _initialize(self, register_value_map, memory_value_map):
+        np = self.np
+        if register_value_map is None:
+            register_value_map = {}
+        if memory_value_map is None:
+            memory_value_map = {}
+
+        wires = sorted(self.block.wirevector_set, key=lambda w: w.name)
+        self._slot = {w: i for i, w in enumerate(wires)}
+        self.value = [None] * len(wires)
+        for w in self.block.wirevector_subset(Const):
+            self.value[self._slot[w]] = np.full(self.lanes, w.val, dtype=self._dtype(w))
+
+        self._inputs = {w.name: w for w in self.block.wirevector_subset(Input)}
+        self._regs = sorted(self.block.wirevector_subset(Register), key=lambda r: r.name)
+        self._reg_slots = [self._slot[r] for r in self._regs]
+        self.regvalue = [self._vector(register_value_map.get(r, self.default_value), r)
+                         for r in self._regs]
+
+        self.memvalue = {}
+        for net in self.block.logic_subset('m@'):
+            mem = net.op_param[1]
+            if mem.id in self.memvalue:
+                continue
+            if isinstance(mem, RomBlock):
+                # the rom contents never change, so read them into a table once
+                table = mem._get_table()
+                if not isinstance(table, tuple):
+                    read = mem._get_read_data if table is None else table.__getitem__
+                    table = [read(a) for a in range(2 ** mem.addrwidth)]
+                self.memvalue[mem.id] = np.array(table, dtype=object).astype(self._dtype(mem))
+                continue
+            if mem.addrwidth > self.max_mem_addrwidth:
+                raise PyrtlError('memory "%s" is too large to hold for each lane (address '
+                                 'width %d is more than %d)' % (mem.name, mem.addrwidth,
+                                                                self.max_mem_addrwidth))
+            self.memvalue[mem.id] = np.full((self.lanes, 2 ** mem.addrwidth),
+                                            self.default_value, dtype=self._dtype(mem))
+        for mem, mem_map in memory_value_map.items():
+            if isinstance(mem, RomBlock):
+                raise PyrtlError('error, one or more of the memories in the map is a RomBlock')
+            if mem.id not in self.memvalue:
+                continue
+            for addr, val in mem_map.items():
+                if addr < 0 or addr >= 2 ** mem.addrwidth:
+                    raise PyrtlError('error, address %s in %s outside of bounds' %
+                                     (str(addr), mem.name))
+                self.memvalue[mem.id][:, addr] = self._vector(val, mem)
+
+        self._net_funcs = []
+        self._mem_writes = []
+        self._reg_srcs = {}
+        for net in self.block:
+            if net.op == 'r':
+                self._reg_srcs[net.dests[0]] = self._slot[net.args[0]]
+            elif net.op == '@':
+                self._mem_writes.append((net.op_param[0],) +
+                                        tuple(self._slot[a] for a in net.args))
+            else:
+                self._net_funcs.append(self._net_func(net))
+        self._reg_srcs = [self._reg_srcs[r] for r in self._regs]
+
+    def _net_func(self, net):
+        """ Build a function that evaluates net for every lane. """
+        np = self.np
+        values = self.value
+        dest = self._slot[net.dests[0]]
+        dtype = self._dtype(net.dests[0])
+        args = [self._slot[a] for a in net.args]
+        mask = net.dests[0].bitmask
+        if FastSimulation._no_mask_bitwidth.get(net.op, lambda n: -1)(net) == len(net.dests[0]):
+            mask = None
+
+        # wires wider than 64 bits are vectors of python ints, and mixing them with uint64
+        # vectors (or producing them from uint64 vectors) needs python int arithmetic
+        if any(w.bitwidth > 64 for w in net.args + net.dests):
+            narrow = [a.bitwidth <= 64 for a in net.args]
+
+            def get_args():
+                return [values[a].astype(object) if n else values[a]
+                        for a, n in zip(args, narrow)]
+        else:
+            def get_args():
+                return [values[a] for a in args]
+
+        if net.op in self._elementwise_ops:
+            op = Simulation.simple_func[net.op]
+
+            def compute():
+                return op(*get_args())
+        elif net.op in '<>=':
+            op = {'<': np.less, '>': np.greater, '=': np.equal}[net.op]
+
+            def compute():
+                return op(*get_args())
+        elif net.op == 'x':
+            def compute():
+                sel, f, t = get_args()
+                return np.where(sel != 0, t, f)
+        elif net.op == 'c':
+            shifts = [sum(len(a) for a in net.args[i + 1:]) for i in range(len(net.args))]
+
+            def compute():
+                result = 0
+                for arg, shift in zip(get_args(), shifts):
+                    result = result | (arg << shift)
+                return result
+        elif net.op == 's':
+            # group contiguous runs of selected bits, as in FastSimulation
+            runs = []
+            for i, b in enumerate(net.op_param):
+                if runs and b == runs[-1][0] + runs[-1][1]:
+                    runs[-1][1] += 1
+                else:
+                    runs.append([b, 1, i])
+            runs = [(start, (1 << length) - 1, res_start) for start, length, res_start in runs]
+
+            def compute():
+                source = get_args()[0]
+                result = 0
+                for start, run_mask, res_start in runs:
+                    result = result | (((source >> start) & run_mask) << res_start)
+                return result
+        elif net.op == 'm':
+            memid, mem = net.op_param
+            memvalue = self.memvalue
+            lane_index = self._lane_index
+            if isinstance(mem, RomBlock):
+                def compute():
+                    return memvalue[memid][get_args()[0].astype(np.intp)]
+            else:
+                def compute():
+                    return memvalue[memid][lane_index, get_args()[0].astype(np.intp)]
+        else:
+            raise PyrtlError('VectorSimulation cannot handle primitive "%s"' % net.op)
+
+        def evaluate():
+            result = compute()
+            if mask is not None:
+                result = result & mask
+            if getattr(result, 'dtype', None) != dtype:
+                result = np.asarray(result).astype(dtype)
+            values[dest] = result
+        return evaluate
+
+    def step(self, provided_inputs):
+        """ Run the simulation for a cycle in every lane.
+
+        :param provided_inputs: a dictionary mapping input names (or WireVectors) to
+          either a single value for all lanes or a sequence with a value for each lane
+        """
+        values = self.value
+        given = set()
+        for wire, value in provided_inputs.items():
+            name = wire.name if isinstance(wire, WireVector) else wire
+            if name not in self._inputs:
+                raise PyrtlError('step provided a value for input for "%s" which is '
+                                 'not a known input ' % name)
+            wire = self._inputs[name]
+            values[self._slot[wire]] = self._vector(value, wire)
+            given.add(name)
+        for name in self._inputs:
+            if name not in given:
+                raise PyrtlError('Input "%s" has no input value specified' % name)
+
+        for slot, val in zip(self._reg_slots, self.regvalue):
+            values[slot] = val
+        for func in self._net_funcs:
+            func()
+
+        # memory writes only take effect after all of the reads of this cycle
+        writes = [(memid, values[addr], values[data], values[enable] != 0)
+                  for memid, addr, data, enable in self._mem_writes]
+        for memid, addr, data, enable in writes:
+            if enable.any():
+                self.memvalue[memid][self._lane_index[enable],
+                                     addr[enable].astype(self.np.intp)] = data[enable]
+        self.regvalue = [values[src] for src in self._reg_srcs]
+
+        for w, exp in self.block.rtl_assert_dict.items():
+            if w in self._slot and not values[self._slot[w]].all():
+                raise exp
+
+    def step_multiple(self, provided_inputs, expected_outputs=None, nsteps=None,
+                      file=sys.stdout, stop_after_first_error=False):
+        """ Take the simulation forward N cycles in every lane.
+
+        :param provided_inputs: a dictionary mapping input names to a sequence, with one
+          entry per step, of the values for that step (each a single value for all lanes,
+          or a value for each lane)
+        :param expected_outputs: a dictionary mapping wire names to a sequence, with one
+          entry per step, of the values expected for that step
+        :param nsteps: number of steps to take (defaults to the number of values supplied)
+        :param file: where to write the output (if there are unexpected outputs detected)
+        :param stop_after_first_error: a boolean flag indicating whether to stop the simulation
+            after the step where the first errors are encountered (defaults to False)
+        :return: the list of failures, each a tuple (step, lane, name, expected, actual)
+        """
+        np = self.np
+        if nsteps is None:
+            if not provided_inputs:
+                raise PyrtlError('need to supply either input values or a number '
+                                 'of steps to simulate')
+            nsteps = max(len(v) for v in provided_inputs.values())
+        if nsteps < 1:
+            raise PyrtlError("must simulate at least one step")
+        if any(len(v) < nsteps for v in provided_inputs.values()):
+            raise PyrtlError("must supply a value for each provided wire "
+                             "for each step of simulation")
+        if expected_outputs and any(len(v) < nsteps for v in expected_outputs.values()):
+            raise PyrtlError("any expected outputs must have a supplied value "
+                             "each step of simulation")
+
+        failed = []
+        for i in range(nsteps):
+            self.step({w: v[i] for w, v in provided_inputs.items()})
+            for name in (expected_outputs or {}):
+                actual = self.inspect(name)
+                expected = np.broadcast_to(np.array(expected_outputs[name][i], dtype=object),
+                                           (self.lanes,))
+                for lane in np.flatnonzero(expected != actual):
+                    failed.append((i, int(lane), name, int(expected[lane]), int(actual[lane])))
+            if failed and stop_after_first_error:
+                break
+
+        if failed:
+            file.write("Unexpected output " + ("(stopped after step with first error):"
+                       if stop_after_first_error else "on one or more steps:") + "\n")
+            file.write("{0:>5} {1:>5} {2:>10} {3:>8} {4:>8}\n"
+                       .format("step", "lane", "name", "expected", "actual"))
+            for step, lane, name, exp, act in sorted(
+                    failed, key=lambda t: (t[0], t[1], _trace_sort_key(t[2]))):
+                file.write("{0:>5} {1:>5} {2:>10} {3:>8} {4:>8}\n"
+                           .format(step, lane, name, exp, act))
+            file.flush()
+        return failed
+
+    def inspect(self, w):
+        """ Get the values of a wirevector in every lane in the last simulation cycle.
+
+        :param w: the name of the WireVector to inspect
+        :return: a vector with the value of w in each lane
+        """
+        wire = self.block.wirevector_by_name.get(w.name if isinstance(w, WireVector) else w)
+        if wire is None:
+            raise PyrtlError('unknown wire "%s"' % w)
+        value = self.value[self._slot[wire]]
+        if value is None:
+            raise PyrtlError("No context available. Please run a simulation step in "
+                             "order to populate values for wires")
+        return value
+
+    def inspect_mem(self, mem):
+        """ Get the contents of a memory in each lane.
+
+        :param mem: the memory to inspect
+        :return: a 2D array, indexed by [lane, address]
+
+        Note that this returns the current memory state. Modifying the array
+        will also modify the state in the simulator
+        """
+        if isinstance(mem, RomBlock):
+            raise PyrtlError("ROM blocks are not stored in the simulation object")
+        return self.memvalue[mem.id]
@@ -0,0 +1,134 @@
+import random
+import unittest
+import six
+
+import pyrtl
+
+
+class TestBitParallelSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def run_reference(self, stimulus, nsteps, outputs, register_value_map=None,
+                      memory_value_map=None):
+        """ Run each lane on its own through the normal Simulation of the working block """
+        lanes = len(list(stimulus.values())[0][0])
+        results = {name: [[None] * lanes for i in range(nsteps)] for name in outputs}
+        for lane in range(lanes):
+            # Simulation writes to the given memory maps, so each lane needs its own copy
+            mems = {m: dict(v) for m, v in (memory_value_map or {}).items()}
+            sim = pyrtl.Simulation(register_value_map=register_value_map,
+                                   memory_value_map=mems)
+            for i in range(nsteps):
+                sim.step({name: vals[i][lane] for name, vals in stimulus.items()})
+                for name in outputs:
+                    results[name][i][lane] = sim.inspect(name)
+        return results
+
+    def check_against_reference(self, inputs, outputs, nsteps=6, lanes=11, **kwargs):
+        random.seed(0)
+        stimulus = {w.name: [[random.randrange(2 ** w.bitwidth) for j in range(lanes)]
+                             for i in range(nsteps)] for w in inputs}
+        names = [w.name for w in outputs]
+        expected = self.run_reference(stimulus, nsteps, names, **kwargs)
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=lanes, **kwargs)
+        for i in range(nsteps):
+            sim.step({name: vals[i] for name, vals in stimulus.items()})
+            for name in names:
+                self.assertEqual(sim.inspect(name), expected[name][i])
+        return sim
+
+    def test_combinational(self):
+        a, b = pyrtl.Input(5, 'a'), pyrtl.Input(5, 'b')
+        s = pyrtl.Input(1, 's')
+        o1, o2, o3 = pyrtl.Output(6, 'o1'), pyrtl.Output(10, 'o2'), pyrtl.Output(1, 'o3')
+        o1 <<= a + b
+        o2 <<= pyrtl.select(s, a * b, pyrtl.concat(a, b))
+        o3 <<= (a < b) ^ (a == b)
+        self.check_against_reference([a, b, s], [o1, o2, o3])
+
+    def test_registers(self):
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(8, 'r')
+        o = pyrtl.Output(8, 'o')
+        r.next <<= r + a
+        o <<= r
+        self.check_against_reference([a], [o], register_value_map={r: 3})
+
+    def test_memory(self):
+        mem = pyrtl.MemBlock(8, 3, 'mem')
+        waddr, raddr = pyrtl.Input(3, 'waddr'), pyrtl.Input(3, 'raddr')
+        data, we = pyrtl.Input(8, 'data'), pyrtl.Input(1, 'we')
+        o = pyrtl.Output(8, 'o')
+        mem[waddr] <<= pyrtl.MemBlock.EnabledWrite(data, we)
+        o <<= mem[raddr]
+        sim = self.check_against_reference([waddr, raddr, data, we], [o], nsteps=12,
+                                           memory_value_map={mem: {0: 7, 5: 9}})
+        lanes = sim.inspect_mem(mem)
+        self.assertEqual(len(lanes), 11)
+        self.assertTrue(all(isinstance(m, dict) for m in lanes))
+
+    def test_rom(self):
+        rom = pyrtl.RomBlock(4, 3, [3, 1, 4, 1, 5, 9, 2, 6])
+        a = pyrtl.Input(3, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= rom[a]
+        self.check_against_reference([a], [o])
+
+    def test_many_lanes(self):
+        a, b = pyrtl.Input(40, 'a'), pyrtl.Input(40, 'b')
+        o = pyrtl.Output(41, 'o')
+        o <<= a + b
+        self.check_against_reference([a, b], [o], nsteps=2, lanes=150)
+
+    def test_rtl_assert_checked_per_lane(self):
+        a = pyrtl.Input(3, 'a')
+        o = pyrtl.Output(3, 'o')
+        o <<= a
+        pyrtl.rtl_assert(a != 5, ValueError('a is 5'))
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=4)
+        sim.step({'a': [1, 2, 3, 4]})
+        self.assertEqual(sim.failed_lanes, [])
+        with self.assertRaises(ValueError):
+            sim.step({'a': [5, 0, 5, 1]})
+        self.assertEqual(sim.failed_lanes, [0, 2])
+
+    def test_step_multiple_reports_failing_lane(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(3, 'o')
+        o <<= a + 1
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=3)
+        output = six.StringIO()
+        failed = sim.step_multiple({'a': [[0, 1, 2], [3, 3, 3]]},
+                                   {'o': [[1, 2, 3], [4, 0, 4]]}, file=output)
+        self.assertEqual(failed, [(1, 1, 'o', 0, 4)])
+        self.assertIn('Unexpected output', output.getvalue())
+
+    def test_requires_synthesized_block(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(2, 'o')
+        o <<= a
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.BitParallelSimulation()
+
+    def test_bad_inputs(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(2, 'o')
+        o <<= a
+        pyrtl.synthesize()
+        sim = pyrtl.BitParallelSimulation(lanes=2)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': [1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': [1, 4]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.inspect('o')
+
+
+if __name__ == "__main__":
+    unittest.main()
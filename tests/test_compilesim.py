@@ -1,3 +1,7 @@
+import os
+import random
+import shutil
+import tempfile
 import unittest
 import six
 
@@ -13,8 +17,23 @@ try:
     version = subprocess.check_output(['gcc', '--version'])
 except OSError:
     raise unittest.SkipTest('CompiledSimulation testing requires gcc')
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
     
 
+def chunked(chunk_size):
+    """ Make a CompiledSimulation subclass that splits the C code into tiny chunks, so
+    that the unittests below also cover linking the code of several files together. """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('chunk_size', chunk_size)
+        pyrtl.CompiledSimulation.__init__(self, *args, **kwargs)
+    return type(str('CompiledSimulationChunked'), (pyrtl.CompiledSimulation,),
+                {'__init__': __init__})
+
+
 class TraceWithBasicOpsBase(unittest.TestCase):
     def setUp(self):
         pyrtl.reset_working_block()
@@ -950,6 +969,79 @@ class TraceErrorBase(unittest.TestCase):
         with self.assertRaises(pyrtl.PyrtlError):
             self.sim_trace.print_trace(base=4)
 
+class CheckpointBase(unittest.TestCase):
+    def setUp(self):
+        self.build()
+        self.steps = [{'a': (5 * i + 1) % 8, 'b': (3 * i) % 8} for i in range(12)]
+
+    def build(self, mem_name='mem'):
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(3, 'a'), pyrtl.Input(3, 'b')
+        r = pyrtl.Register(8, 'r')
+        mem = pyrtl.MemBlock(8, 3, mem_name)
+        o = pyrtl.Output(8, 'o')
+        r.next <<= r + a + 1
+        mem[a] <<= r
+        o <<= r + mem[b]
+
+    def run_steps(self, sim, steps):
+        outs = []
+        for step in steps:
+            sim.step(step)
+            outs.append(sim.inspect('o'))
+        return outs
+
+    def test_checkpoint_and_restore(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        checkpoint = sim.checkpoint()
+        expected = self.run_steps(sim, self.steps[6:])
+        sim.restore(checkpoint)
+        self.assertEqual(self.run_steps(sim, self.steps[6:]), expected)
+
+    def test_fork(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        fork = sim.fork()
+        self.assertEqual(self.run_steps(fork, self.steps[6:]),
+                         self.run_steps(sim, self.steps[6:]))
+        # the fork and the original do not share state
+        checkpoint = sim.checkpoint()
+        self.run_steps(fork, self.steps[:3])
+        self.assertEqual(sim.checkpoint(), checkpoint)
+
+    def test_restore_from_other_simulation(self):
+        ref = pyrtl.Simulation()
+        self.run_steps(ref, self.steps[:6])
+        sim = self.sim()
+        sim.restore(ref.checkpoint())
+        self.assertEqual(self.run_steps(sim, self.steps[6:]),
+                         self.run_steps(ref, self.steps[6:]))
+
+    def test_bad_checkpoint(self):
+        sim = self.sim()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.restore(b'not a checkpoint')
+
+    def test_restore_into_rebuilt_design(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        checkpoint = sim.checkpoint()
+        expected = self.run_steps(sim, self.steps[6:])
+        self.build()  # new memory and wire objects, with the same names
+        sim = self.sim()
+        sim.restore(checkpoint)
+        self.assertEqual(self.run_steps(sim, self.steps[6:]), expected)
+
+    def test_restore_unknown_memory(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        checkpoint = sim.checkpoint()
+        self.build(mem_name='other')
+        sim = self.sim()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.restore(checkpoint)
+
 
 def make_unittests():
     """
@@ -973,9 +1065,568 @@ def make_unittests():
             unittests[unit_name] = type(unit_name, (v,), {'sim': sim})
     g.update(unittests)
 
-sims = (pyrtl.CompiledSimulation,)
+sims = (pyrtl.CompiledSimulation, chunked(3))
 make_unittests()
 
 
+class TestCompiledSimulationCache(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.cache_dir = tempfile.mkdtemp()
+        a = pyrtl.Input(8, 'a')
+        r = pyrtl.Register(16, 'r')
+        o = pyrtl.Output(16, 'o')
+        r.next <<= r + a * a
+        o <<= r
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def run_sim(self, sim):
+        sim.step_multiple({'a': [1, 2, 3, 4, 5]})
+        return sim.tracer.trace['o']
+
+    def cached_libraries(self):
+        return [f for f in os.listdir(os.path.join(self.cache_dir, 'compiledsim'))
+                if f.endswith('.so')]
+
+    def test_library_loaded_from_cache(self):
+        first = pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        self.assertEqual(len(self.cached_libraries()), 1)
+
+        def fail(flags, sources):
+            raise AssertionError('compiled again')
+        original = pyrtl.CompiledSimulation._compile
+        pyrtl.CompiledSimulation._compile = fail
+        try:
+            second = pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        finally:
+            pyrtl.CompiledSimulation._compile = original
+        # each simulation has its own state, even though the library is shared
+        self.assertEqual(self.run_sim(first), [0, 1, 5, 14, 30])
+        self.assertEqual(self.run_sim(second), [0, 1, 5, 14, 30])
+
+    def test_rebuilt_design_loaded_from_cache(self):
+        def build():
+            pyrtl.reset_working_block()
+            a = pyrtl.Input(8, 'a')
+            r = pyrtl.Register(16, 'r')
+            o = pyrtl.Output(16, 'o')
+            r.next <<= r + a * a + (a & 0x0f) + (a & 0x0f)
+            o <<= r
+            pyrtl.synthesize()
+            pyrtl.optimize()
+        build()
+        first = pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        for i in range(1000):  # the made up names of the next build are longer
+            pyrtl.wire.next_tempvar_name()
+        build()
+
+        def fail(flags, sources):
+            raise AssertionError('compiled again')
+        original = pyrtl.CompiledSimulation._compile
+        pyrtl.CompiledSimulation._compile = fail
+        try:
+            second = pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        finally:
+            pyrtl.CompiledSimulation._compile = original
+        self.assertEqual(self.run_sim(second), self.run_sim(first))
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'compiledsim')),
+                         self.cached_libraries())  # no lock files left behind
+        mode = os.stat(os.path.join(self.cache_dir, 'compiledsim',
+                                    self.cached_libraries()[0])).st_mode
+        self.assertEqual(mode & 0o644, 0o644)
+
+    def test_optimization_levels(self):
+        expected = self.run_sim(pyrtl.CompiledSimulation(cache_dir=self.cache_dir))
+        for level in (2, 3):
+            sim = pyrtl.CompiledSimulation(optimization_level=level, cache_dir=self.cache_dir)
+            self.assertEqual(self.run_sim(sim), expected)
+        self.assertEqual(len(self.cached_libraries()), 3)  # one for each set of flags
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.CompiledSimulation(optimization_level=5)
+
+    def test_different_initial_values_share_library(self):
+        # the initial state is not part of the compiled code
+        r = pyrtl.working_block().wirevector_by_name['r']
+        first = pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        sim = pyrtl.CompiledSimulation(cache_dir=self.cache_dir, register_value_map={r: 10})
+        self.assertEqual(self.run_sim(sim), [10, 11, 15, 24, 40])
+        self.assertEqual(self.run_sim(first), [0, 1, 5, 14, 30])
+        self.assertEqual(len(self.cached_libraries()), 1)
+
+    def test_other_cpu_not_shared(self):
+        # the library is compiled with -march=native, so it is only good for this cpu
+        from pyrtl import compilesim
+        pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        self.assertTrue(compilesim._cpu_target())
+        original = compilesim._cpu_targets[:]
+        compilesim._cpu_targets[:] = ['some other cpu']
+        try:
+            sim = pyrtl.CompiledSimulation(cache_dir=self.cache_dir)
+        finally:
+            compilesim._cpu_targets[:] = original
+        self.assertEqual(self.run_sim(sim), [0, 1, 5, 14, 30])
+        self.assertEqual(len(self.cached_libraries()), 2)
+
+    def test_no_cache(self):
+        sim = pyrtl.CompiledSimulation(cache_dir=False)
+        self.assertEqual(self.run_sim(sim), [0, 1, 5, 14, 30])
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'compiledsim')))
+
+
+class TestCompiledSimulationChunks(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        b = pyrtl.Input(8, 'b')
+        r = pyrtl.Register(16, 'r')
+        o = pyrtl.Output(16, 'o')
+        t = (a + b) * (a - b)
+        r.next <<= r + (t ^ a)
+        o <<= r
+
+    def run_sim(self, sim):
+        sim.step_multiple({'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]})
+        return sim.tracer.trace['o']
+
+    def c_files(self, sim):
+        return sorted(f for f in os.listdir(sim._lib.dir) if f.endswith('.c'))
+
+    def test_chunks_in_separate_files(self):
+        whole = pyrtl.CompiledSimulation(chunk_size=None, cache_dir=False)
+        self.assertEqual(self.c_files(whole), ['pyrtlsim.c'])
+        expected = self.run_sim(whole)
+        for chunk_size in (1, 2, 5):
+            sim = pyrtl.CompiledSimulation(chunk_size=chunk_size, cache_dir=False)
+            self.assertGreater(len(self.c_files(sim)), 2)
+            self.assertEqual(self.run_sim(sim), expected)
+
+    def test_large_chunk_size_is_one_file(self):
+        sim = pyrtl.CompiledSimulation(chunk_size=10000, cache_dir=False)
+        self.assertEqual(self.c_files(sim), ['pyrtlsim.c'])
+
+    def test_bad_chunk_size(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.CompiledSimulation(chunk_size=0)
+
+
+class TestCompiledSimulationInstances(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        r = pyrtl.Register(32, 'r')
+        mem = pyrtl.MemBlock(32, 4, 'mem')
+        o = pyrtl.Output(32, 'o')
+        mem[a[:4]] <<= r
+        r.next <<= r + a + mem[a[:4]]
+        o <<= r
+
+    def expected(self, inputs):
+        sim = pyrtl.Simulation()
+        sim.step_multiple({'a': inputs})
+        return sim.tracer.trace['o']
+
+    def test_fork_shares_library(self):
+        sim = pyrtl.CompiledSimulation()
+        sim.step_multiple({'a': [1, 2, 3]})
+        forked = sim.fork()
+        self.assertIs(forked._lib, sim._lib)
+        forked.step_multiple({'a': [4, 5]})
+        sim.step_multiple({'a': [6]})
+        self.assertEqual(sim.tracer.trace['o'], self.expected([1, 2, 3, 6]))
+        self.assertEqual(forked.tracer.trace['o'], self.expected([1, 2, 3, 4, 5])[3:])
+
+    @unittest.skipIf(six.PY2, 'run_many needs python 3')
+    def test_run_many(self):
+        runs = [[{'a': (i * k) % 256} for i in range(200)] for k in range(1, 9)]
+        sim = pyrtl.CompiledSimulation()
+        sims = sim.run_many(runs, max_workers=4)
+        self.assertEqual(len(sims), len(runs))
+        for run, forked in zip(runs, sims):
+            self.assertIs(forked._lib, sim._lib)
+            self.assertEqual(forked.tracer.trace['o'], self.expected([i['a'] for i in run]))
+        self.assertEqual(sim.tracer.trace['o'], [])  # left as it was
+
+
+class TestCompiledSimulationInternalWires(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        r = pyrtl.Register(8, 'r')
+        total = pyrtl.WireVector(9, 'total')
+        wide = pyrtl.WireVector(100, 'wide')
+        o = pyrtl.Output(8, 'o')
+        total <<= r + a
+        wide <<= pyrtl.concat(total, pyrtl.Const(0, 91))
+        r.next <<= total
+        o <<= wide[91:99] ^ a
+        self.inputs = {'a': [1, 2, 3, 4, 250]}
+        sim = pyrtl.Simulation()
+        sim.step_multiple(self.inputs)
+        self.expected = sim.tracer.trace
+
+    def test_internal_wires_traced(self):
+        sim = pyrtl.CompiledSimulation(internal_wires=['total', 'wide', 'r'])
+        sim.step_multiple(self.inputs)
+        for name in ('a', 'o', 'r', 'total', 'wide'):
+            self.assertEqual(sim.tracer.trace[name], self.expected[name])
+        self.assertEqual(sim.inspect('total'), self.expected['total'][-1])
+
+    def test_all_tracked_wires(self):
+        sim = pyrtl.CompiledSimulation(internal_wires=True)
+        sim.step_multiple(self.inputs)
+        self.assertEqual(set(sim.tracer.trace), {'a', 'o', 'r', 'total', 'wide'})
+        for name in sim.tracer.trace:
+            self.assertEqual(sim.tracer.trace[name], self.expected[name])
+
+    def test_only_requested_wires(self):
+        total = pyrtl.working_block().wirevector_by_name['total']
+        sim = pyrtl.CompiledSimulation(internal_wires=[total])
+        sim.step_multiple(self.inputs)
+        self.assertEqual(set(sim.tracer.trace), {'a', 'o', 'total'})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.inspect('r')
+        forked = sim.fork()
+        forked.step_multiple({'a': [7]})
+        self.assertEqual(forked.tracer.trace['total'], [(self.expected['total'][-1] + 7) % 256])
+
+    def test_unknown_wire(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.CompiledSimulation(internal_wires=['nope'])
+
+    @unittest.skipIf(numpy is None, 'columnar runs require numpy')
+    def test_columns(self):
+        sim = pyrtl.CompiledSimulation(internal_wires=['total', 'wide'])
+        sim.run({'a': numpy.array(self.inputs['a'], dtype=numpy.uint64)})
+        self.assertEqual(sim.tracer.trace['total'], self.expected['total'])
+        self.assertEqual(sim.tracer.trace['wide'], self.expected['wide'])
+
+
+class TestCompiledSimulationWidths(unittest.TestCase):
+    """ Nets of up to 128 bits are built on native integers, the others on limbs. """
+
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def check_ops(self, width0, width1):
+        a = pyrtl.Input(width0, 'a')
+        b = pyrtl.Input(width1, 'b')
+        mem = pyrtl.MemBlock(max(width0, width1), 2, 'mem', asynchronous=True)
+        mem[b[:2] if width1 > 1 else b.zero_extended(2)] <<= a.zero_extended(mem.bitwidth)
+        results = [a & b, a | b, a ^ b, a.nand(b), ~a, a == b, a < b, a > b, a + b, a - b,
+                   a * b, pyrtl.concat(a, b), pyrtl.concat(b, a, b), a[width0 // 2:],
+                   pyrtl.concat(a[0], a[-1], a[width0 // 3]), pyrtl.select(b[0], a, b),
+                   mem[a[:2] if width0 > 1 else a.zero_extended(2)], (a + b)[:width0]]
+        for n, result in enumerate(results):
+            o = pyrtl.Output(len(result), 'o%d' % n)
+            o <<= result
+        rnd = random.Random(width0 * 1000 + width1)
+        inputs = {'a': [0, (1 << width0) - 1] + [rnd.getrandbits(width0) for i in range(6)],
+                  'b': [(1 << width1) - 1, 0] + [rnd.getrandbits(width1) for i in range(6)]}
+        sim = pyrtl.Simulation()
+        sim.step_multiple(inputs)
+        for chunk_size in (None, 4):
+            csim = pyrtl.CompiledSimulation(chunk_size=chunk_size)
+            csim.step_multiple(inputs)
+            for name in sim.tracer.trace:
+                self.assertEqual(csim.tracer.trace[name], sim.tracer.trace[name],
+                                 '%s with widths %d, %d' % (name, width0, width1))
+
+    def test_narrow(self):
+        self.check_ops(1, 8)
+
+    def test_64_bits(self):
+        self.check_ops(64, 37)
+
+    def test_128_bits(self):
+        self.check_ops(100, 65)
+
+    def test_wide(self):
+        self.check_ops(130, 70)
+
+    def test_very_wide(self):
+        self.check_ops(200, 300)
+
+    def test_native_types(self):
+        a = pyrtl.Input(8, 'a')
+        b = pyrtl.Input(100, 'b')
+        o = pyrtl.Output(8, 'o')
+        w = pyrtl.Output(101, 'w')
+        o <<= (a & 0xf) + a[4:]
+        w <<= b + a
+        sim = pyrtl.CompiledSimulation(chunk_size=None)
+        with open(os.path.join(sim._lib.dir, 'pyrtlsim.c')) as f:
+            code = f.read()
+        self.assertIn('uint8_t ', code)
+        self.assertIn('unsigned __int128 ', code)
+        self.assertNotIn('uint64_t tmp', code)  # no temporaries
+        sim.step({'a': 0x9c, 'b': (1 << 100) - 1})
+        self.assertEqual(sim.inspect('o'), 0x15)
+        self.assertEqual(sim.inspect('w'), (1 << 100) + 0x9b)
+
+
+def has_openmp():
+    directory = tempfile.mkdtemp()
+    try:
+        source = os.path.join(directory, 'omp.c')
+        with open(source, 'w') as f:
+            f.write('#include <omp.h>\nint main(void) { return omp_get_max_threads() < 1; }\n')
+        return subprocess.call(['gcc', '-fopenmp', source, '-o', os.path.join(directory, 'omp')],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE) == 0
+    finally:
+        shutil.rmtree(directory)
+
+
+@unittest.skipIf(not has_openmp(), 'parallel CompiledSimulation requires OpenMP')
+class TestCompiledSimulationParallel(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        for lane in range(4):
+            r = pyrtl.Register(16, 'r%d' % lane)
+            x = r
+            for i in range(10):
+                x = (x * (a + lane) + i)[:16] ^ x[:8].zero_extended(16)
+            r.next <<= x
+            o = pyrtl.Output(16, 'o%d' % lane)
+            o <<= r
+        self.inputs = {'a': [5, 2, 200, 7, 1, 0, 99, 3]}
+        sim = pyrtl.CompiledSimulation()
+        sim.step_multiple(self.inputs)
+        self.expected = sim.tracer.trace
+
+    def code(self, sim):
+        with open(os.path.join(sim._lib.dir, 'pyrtlsim.c')) as f:
+            return f.read()
+
+    def test_parallel_same_as_serial(self):
+        for chunk_size in (None, 7):
+            sim = pyrtl.CompiledSimulation(parallel=True, parallel_threshold=10,
+                                           chunk_size=chunk_size)
+            self.assertIn('#pragma omp parallel for', self.code(sim))
+            self.assertEqual(self.code(sim).count('static void pyrtlsim_part'), 4)
+            sim.step_multiple(self.inputs)
+            for name in self.expected:
+                self.assertEqual(sim.tracer.trace[name], self.expected[name])
+
+    def test_cones_grouped_up_to_threshold(self):
+        nets = len([net for net in pyrtl.working_block() if net.op not in 'r@'])
+        sim = pyrtl.CompiledSimulation(parallel=True, parallel_threshold=nets // 2)
+        self.assertEqual(self.code(sim).count('static void pyrtlsim_part'), 2)
+        sim.step_multiple(self.inputs)
+        self.assertEqual(sim.tracer.trace['o3'], self.expected['o3'])
+
+    def test_serial_below_threshold(self):
+        sim = pyrtl.CompiledSimulation(parallel=True)
+        self.assertNotIn('#pragma omp', self.code(sim))
+        sim.step_multiple(self.inputs)
+        self.assertEqual(sim.tracer.trace['o0'], self.expected['o0'])
+
+
+class TestCompiledSimulationAssertions(unittest.TestCase):
+    class BadValue(Exception):
+        pass
+
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        r = pyrtl.Register(8, 'r')
+        o = pyrtl.Output(8, 'o')
+        r.next <<= r + a
+        o <<= r
+        pyrtl.rtl_assert(r != 10, self.BadValue('r is 10'))
+        self.odd = pyrtl.rtl_assert(a != 99, self.BadValue('a is 99'))
+
+    def test_stops_at_failing_step(self):
+        sim = pyrtl.CompiledSimulation()
+        with self.assertRaises(self.BadValue) as cm:
+            sim.run([{'a': a} for a in [1, 2, 3, 4, 5, 6]])
+        self.assertEqual(str(cm.exception), 'r is 10')
+        self.assertEqual(sim.failed_assertion[0], 4)
+        self.assertEqual(sim.tracer.trace['o'], [0, 1, 3, 6, 10])  # up to the failing step
+        self.assertEqual(sim.inspect('o'), 10)
+
+    def test_second_assertion(self):
+        sim = pyrtl.CompiledSimulation()
+        sim.run([{'a': 1}, {'a': 2}])
+        with self.assertRaises(self.BadValue) as cm:
+            sim.run([{'a': 0}, {'a': 99}, {'a': 0}])
+        self.assertEqual(str(cm.exception), 'a is 99')
+        self.assertEqual(sim.failed_assertion, (3, self.odd.name))
+        self.assertEqual(sim.tracer.trace['a'], [1, 2, 0, 99])
+
+    def test_step(self):
+        sim = pyrtl.CompiledSimulation()
+        sim.step({'a': 4})
+        sim.step({'a': 6})
+        with self.assertRaises(self.BadValue):
+            sim.step({'a': 0})
+
+    def test_stream(self):
+        blocks = []
+        sim = pyrtl.CompiledSimulation()
+        with self.assertRaises(self.BadValue):
+            sim.run_stream(({'a': 1} for i in range(100)), block_size=4,
+                           callback=blocks.append)
+        self.assertEqual(sim.failed_assertion[0], 10)
+        self.assertEqual([len(block['o']) for block in blocks], [4, 4, 3])
+
+    @unittest.skipIf(numpy is None, 'columnar runs require numpy')
+    def test_columns(self):
+        sim = pyrtl.CompiledSimulation()
+        with self.assertRaises(self.BadValue):
+            sim.run({'a': numpy.full(50, 5, dtype=numpy.uint64)})
+        self.assertEqual(sim.tracer.trace['o'], [0, 5, 10])
+
+
+class TestCompiledSimulationStream(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        r = pyrtl.Register(16, 'r')
+        o = pyrtl.Output(16, 'o')
+        r.next <<= r + a
+        o <<= r
+
+    def inputs(self, n):
+        return ({'a': i % 251} for i in range(n))
+
+    def expected(self, n):
+        sim = pyrtl.CompiledSimulation()
+        sim.run(list(self.inputs(n)))
+        return sim.tracer.trace
+
+    def test_callback(self):
+        blocks = []
+        sim = pyrtl.CompiledSimulation()
+        steps = sim.run_stream(self.inputs(1000), block_size=64, callback=blocks.append)
+        self.assertEqual(steps, 1000)
+        self.assertEqual(len(blocks), 16)
+        self.assertTrue(all(len(block['o']) == 64 for block in blocks[:-1]))
+        expected = self.expected(1000)
+        self.assertEqual([v for block in blocks for v in block['o']], expected['o'])
+        self.assertEqual([v for block in blocks for v in block['a']], expected['a'])
+        self.assertEqual(sim.tracer.trace['o'], [])  # not traced by default
+
+    def test_trace_and_file(self):
+        sim = pyrtl.CompiledSimulation()
+        output = six.StringIO()
+        sim.run_stream(self.inputs(100), block_size=7, file=output, trace=True)
+        expected = self.expected(100)
+        self.assertEqual(sim.tracer.trace['o'], expected['o'])
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'a o r')  # r is traced through the output probing it
+        self.assertEqual(len(lines), 101)
+        self.assertEqual(lines[-1], '%d %d %d' % (expected['a'][-1], expected['o'][-1],
+                                                  expected['r'][-1]))
+
+    def test_nsteps(self):
+        import itertools
+        blocks = []
+        sim = pyrtl.CompiledSimulation()
+        endless = ({'a': 1} for i in itertools.count())
+        self.assertEqual(sim.run_stream(endless, nsteps=50, block_size=16,
+                                        callback=blocks.append), 50)
+        self.assertEqual([len(block['o']) for block in blocks], [16, 16, 16, 2])
+        self.assertEqual(blocks[-1]['o'][-1], 49)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run_stream(self.inputs(10), nsteps=20)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run_stream(self.inputs(10), block_size=0)
+
+
+@unittest.skipIf(numpy is None, 'columnar runs require numpy')
+class TestCompiledSimulationColumns(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(8, 'a')
+        b = pyrtl.Input(100, 'b')
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + a
+        o = pyrtl.Output(8, 'o')
+        o <<= r
+        w = pyrtl.Output(101, 'w')
+        w <<= a + b
+        self.a = [3, 1, 4, 1, 5, 9, 2, 6]
+        self.b = [1 << 99, 0, 5, (1 << 100) - 1, 7, 1 << 64, 2, 3]
+
+    def expected(self):
+        sim = pyrtl.CompiledSimulation()
+        sim.run([{'a': a, 'b': b} for a, b in zip(self.a, self.b)])
+        return sim.tracer.trace
+
+    def test_columns_same_as_step_inputs(self):
+        expected = self.expected()
+        sim = pyrtl.CompiledSimulation()
+        res = sim.run({'a': numpy.array(self.a, dtype=numpy.uint8), 'b': self.b})
+        self.assertEqual(res['o'].tolist(), expected['o'])
+        self.assertEqual(res['w'].shape, (8, 2))
+        self.assertEqual([int(lo) | int(hi) << 64 for lo, hi in res['w']], expected['w'])
+        for name in 'abow':
+            self.assertEqual(sim.tracer.trace[name], expected[name])
+
+    def test_limb_columns(self):
+        expected = self.expected()
+        limbs = numpy.array([[b & ((1 << 64) - 1), b >> 64] for b in self.b], dtype=numpy.uint64)
+        sim = pyrtl.CompiledSimulation()
+        sim.run({'a': self.a, 'b': limbs})
+        self.assertEqual(sim.tracer.trace['w'], expected['w'])
+
+    def test_packed_inputs_and_out_buffer(self):
+        expected = self.expected()
+        sim = pyrtl.CompiledSimulation()
+        self.assertEqual(sim.input_width, 3)
+        self.assertEqual(sim.output_width, 3)
+        ibuf = numpy.zeros((8, sim.input_width), dtype=numpy.uint64)
+        start, count = sim.input_layout['a']
+        ibuf[:, start] = self.a
+        start, count = sim.input_layout['b']
+        for n in range(count):
+            ibuf[:, start + n] = [(b >> 64 * n) & ((1 << 64) - 1) for b in self.b]
+        out = numpy.zeros((8, sim.output_width), dtype=numpy.uint64)
+        res = sim.run(ibuf, out=out)
+        self.assertEqual(out[:, sim.output_layout['o'][0]].tolist(), expected['o'])
+        self.assertTrue(numpy.shares_memory(res['o'], out))
+        self.assertEqual(sim.tracer.trace['w'], expected['w'])
+
+    def test_nsteps(self):
+        sim = pyrtl.CompiledSimulation()
+        res = sim.run({'a': self.a, 'b': self.b}, nsteps=3)
+        self.assertEqual(res['o'].tolist(), [0, 3, 4])
+
+    def test_bad_columns(self):
+        sim = pyrtl.CompiledSimulation()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': self.a})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': numpy.array([256] * 8), 'b': self.b})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': numpy.array([-1] * 8), 'b': self.b})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': self.a, 'b': [1 << 100] * 8})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': self.a, 'b': self.b, 'c': self.a})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': self.a, 'b': self.b}, out=numpy.zeros((8, 2), dtype=numpy.uint64))
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run(numpy.zeros((8, 2), dtype=numpy.uint64))
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'a': self.a[:5], 'b': self.b})
+
+    def test_64_bit_list(self):
+        pyrtl.reset_working_block()
+        x = pyrtl.Input(64, 'x')
+        y = pyrtl.Output(64, 'y')
+        y <<= x
+        values = [1 << 63, 1, (1 << 64) - 1, 0]
+        sim = pyrtl.CompiledSimulation()
+        self.assertEqual(sim.run({'x': values})['y'].tolist(), values)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'x': [1 << 64, 1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.run({'x': [1 << 63, -1]})
+
+
 if __name__ == '__main__':
     unittest.main()
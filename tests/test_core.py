@@ -85,6 +85,92 @@ class TestBlock(unittest.TestCase):
         for net in block.logic:
             print(net)
 
+    def check_topological(self, block, order):
+        self.assertEqual(set(order), block.logic)
+        self.assertEqual(len(order), len(block.logic))
+        produced = block.wirevector_subset((pyrtl.Input, pyrtl.Const, pyrtl.Register))
+        for net in order:
+            self.assertTrue(all(arg in produced for arg in net.args))
+            produced.update(net.dests)
+
+    def test_block_iterator_cached_and_patched(self):
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        r = pyrtl.Register(4, 'r')
+        r.next <<= a ^ r
+        t = a & b
+        block = pyrtl.working_block()
+        first = list(block)
+        self.assertEqual(list(block), first)
+        self.check_topological(block, first)
+
+        # a net whose inputs are already available is appended to the cached order
+        o = pyrtl.Output(4, 'o')
+        o <<= t | r
+        second = list(block)
+        self.assertEqual(second[:len(first)], first)
+        self.check_topological(block, second)
+
+        # a net driving a wire that is already used forces a recompute
+        w = pyrtl.WireVector(4, 'w')
+        o2 = pyrtl.Output(4, 'o2')
+        o2 <<= w
+        w <<= ~a
+        self.check_topological(block, list(block))
+        src, dst = block.net_connections()
+        self.assertEqual(src[w].op, 'w')
+
+    def test_block_iterator_sees_transforms(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        t = pyrtl.WireVector(4, 't')
+        t <<= ~a
+        o <<= t
+        block = pyrtl.working_block()
+        self.check_topological(block, list(block))
+        new_t = pyrtl.WireVector(4, 'new_t')
+        pyrtl.transform.replace_wires({t: new_t})
+        self.check_topological(block, list(block))
+        self.assertTrue(all(w is not t for net in block for w in net.args + net.dests))
+        pyrtl.optimize()
+        self.check_topological(block, list(block))
+
+    def test_block_iterator_deterministic(self):
+        def build():
+            pyrtl.reset_working_block()
+            ins = [pyrtl.Input(3, 'i%d' % n) for n in range(4)]
+            out = pyrtl.Output(name='out')
+            out <<= (ins[0] + ins[1]) * (ins[2] - ins[3])
+            return [(net.op, tuple(w.bitwidth for w in net.args)) for net in pyrtl.working_block()]
+        self.assertEqual(build(), build())
+
+    def test_net_connections_copies(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= ~a
+        block = pyrtl.working_block()
+        src, dst = block.net_connections()
+        del src[o]
+        dst[a].append('junk')
+        src, dst = block.net_connections()
+        self.assertIn(o, src)
+        self.assertEqual(len(dst[a]), 1)
+
+    def test_logic_copies_independent(self):
+        a = pyrtl.Input(4, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= a + 1
+        block = pyrtl.working_block()
+        order = list(block)
+        nets = block.logic.copy()
+        nets -= set(order[:1])
+        nets.discard(order[-1])
+        for other in (block.logic | set(), block.logic - set(order[:1]), block.logic & nets,
+                      block.logic ^ nets):
+            other.clear()
+        self.assertEqual(len(nets), len(order) - 2)
+        self.assertEqual(list(block), order)
+        self.assertIsNone(pyrtl.find_loop())
+
     def test_no_memblocks(self):
         block = pyrtl.working_block()
         self.assertFalse(block.memblock_by_name)
@@ -308,6 +308,34 @@ class TestInputFromBlif(unittest.TestCase):
             pyrtl.input_from_blif(counter4bit_blif_bad_latch_inits)
 
 
+class TestInputFromMemoryImage(unittest.TestCase):
+    def test_hex(self):
+        image = six.StringIO("// a comment\n0a 1_f\n@10 /* skip */ ff\n 3\n")
+        self.assertEqual(pyrtl.input_from_memory_image(image),
+                         {0: 10, 1: 31, 16: 255, 17: 3})
+
+    def test_bin(self):
+        self.assertEqual(pyrtl.input_from_memory_image('101 1_1', fmt='bin', start=4),
+                         {4: 5, 5: 3})
+
+    def test_raw(self):
+        image = io.BytesIO(b'\x01\x02\x03\x04\xff\x00')
+        self.assertEqual(pyrtl.input_from_memory_image(image, fmt='raw', bitwidth=12),
+                         {0: 0x201, 1: 0x403, 2: 0xff})
+
+    def test_errors(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_memory_image('0 1', fmt='oct')
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_memory_image('0 1g')
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_memory_image('0 100', bitwidth=8)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_memory_image(b'\x01\x02\x03', fmt='raw', bitwidth=16)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_memory_image(b'\x01', fmt='raw')
+
+
 class TestOutputGraphs(unittest.TestCase):
     def setUp(self):
         pyrtl.reset_working_block()
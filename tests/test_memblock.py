@@ -380,5 +380,57 @@ class RTLRomGetReadData(unittest.TestCase):
         self.assertEquals(len(roms), 3)
 
 
+class RTLRomGetTable(unittest.TestCase):
+
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def test_table(self):
+        rom, romf = RTLRomGetReadData.sample_roms()
+        self.assertIsNone(rom._get_table())  # addresses 4 to 7 cannot be read
+        self.assertEqual([romf._get_table()[a] for a in range(8)], [1, 3, 5, 7, 1, 3, 5, 7])
+        padded = pyrtl.RomBlock(3, 2, [2, 4], pad_with_zeros=True)
+        self.assertEqual(padded._get_table(), (2, 4, 0, 0))
+        dict_rom = pyrtl.RomBlock(3, 1, {0: 6, 1: 5})
+        self.assertEqual([dict_rom._get_table()[a] for a in range(2)], [6, 5])
+
+    def test_invalid_values_have_no_table(self):
+        for data in ([15, 8, 7, 1], ['test', ()], [-1, 0, 0, 0]):
+            self.assertIsNone(pyrtl.RomBlock(3, 2, data)._get_table())
+
+    def test_function_read_once_per_address(self):
+        calls = []
+
+        def rom_func(address):
+            calls.append(address)
+            return address ^ 1
+        romf = pyrtl.RomBlock(2, 2, rom_func)
+        self.assertEqual(romf._get_table()[2], 3)
+        self.assertEqual(romf._get_table()[2], 3)
+        self.assertEqual(romf._get_table()[0], 1)
+        self.assertEqual(calls, [2, 0])
+        with self.assertRaises(pyrtl.PyrtlError):
+            romf._get_table()[4]
+
+    def test_too_big_for_table(self):
+        rom = pyrtl.RomBlock(4, pyrtl.RomBlock._max_table_addrwidth + 1, [1, 2])
+        self.assertIsNone(rom._get_table())
+
+    def test_big_function_rom_reads_only_used_addresses(self):
+        calls = []
+
+        def rom_func(address):
+            calls.append(address)
+            return address & 0xff
+        addr = pyrtl.Input(24, 'addr')
+        out = pyrtl.Output(8, 'out')
+        rom = pyrtl.RomBlock(8, 24, rom_func, asynchronous=True)
+        out <<= rom[addr]
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = sim_class()
+            sim.step_multiple({'addr': [0x123456, 0xabcdef, 0x123456]})
+            self.assertEqual(sim.tracer.trace['out'], [0x56, 0xef, 0x56])
+        self.assertEqual(calls, [0x123456, 0xabcdef])
+
 if __name__ == "__main__":
     unittest.main()
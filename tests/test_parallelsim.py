@@ -0,0 +1,104 @@
+import random
+import subprocess
+import sys
+import unittest
+
+import pyrtl
+
+if sys.version_info < (3, 7):
+    raise unittest.SkipTest('parallel_step_multiple testing requires python 3.7')
+
+
+class SubclassedSimulation(pyrtl.Simulation):
+    pass
+
+
+class TestParallelStepMultiple(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        self.r = pyrtl.Register(8, 'r')
+        self.mem = pyrtl.MemBlock(8, 2, 'mem')
+        o = pyrtl.Output(8, 'o')
+        self.r.next <<= self.r + a
+        self.mem[a[:2]] <<= self.r
+        o <<= self.r + self.mem[a[2:]]
+        random.seed(0)
+        self.stimulus = [[random.randrange(16) for i in range(6)] for j in range(7)]
+
+    def expected(self, vals, **kwargs):
+        sim = pyrtl.Simulation(**kwargs)
+        sim.step_multiple({'a': vals})
+        return sim.tracer.trace['o']
+
+    def check_simulation(self, simulation):
+        init = {'register_value_map': {self.r: 5}}
+        jobs = []
+        for i, vals in enumerate(self.stimulus):
+            outs = self.expected(vals, memory_value_map={self.mem: {3: 1}}, **init)
+            if i == 4:
+                outs[2] += 1  # make one job fail
+            jobs.append({'provided_inputs': {'a': vals}, 'expected_outputs': {'o': outs}})
+        results = list(pyrtl.parallel_step_multiple(
+            jobs, simulation=simulation, max_workers=2, trace=True,
+            memory_value_map={self.mem: {3: 1}}, **init))
+        self.assertEqual(sorted(r.index for r in results), list(range(len(jobs))))
+        for result in results:
+            self.assertEqual(result.passed, result.index != 4)
+            self.assertEqual(list(result.trace.trace['a']), self.stimulus[result.index])
+        failed = next(r for r in results if r.index == 4)
+        self.assertIn('Unexpected output', failed.report)
+
+    def test_simulation(self):
+        self.check_simulation(pyrtl.Simulation)
+
+    def test_fastsim(self):
+        self.check_simulation(pyrtl.FastSimulation)
+
+    def test_compiledsim(self):
+        try:
+            subprocess.check_output(['gcc', '--version'])
+        except OSError:
+            raise unittest.SkipTest('CompiledSimulation testing requires gcc')
+        self.check_simulation(pyrtl.CompiledSimulation)
+
+    def test_without_traces(self):
+        jobs = [{'provided_inputs': {'a': vals}} for vals in self.stimulus]
+        results = list(pyrtl.parallel_step_multiple(jobs, max_workers=2))
+        self.assertTrue(all(r.passed and r.trace is None for r in results))
+
+    def test_exception_fails_only_its_job(self):
+        pyrtl.rtl_assert(self.r != 0xff, Exception('r is 0xff'))
+        jobs = [{'provided_inputs': {'a': vals}} for vals in self.stimulus]
+        jobs[1] = {'provided_inputs': {'a': [16]}}  # too big for a
+        jobs[3] = {'provided_inputs': {'a': [15] * 40}}  # r gets to 0xff
+        for simulation in (pyrtl.Simulation, pyrtl.FastSimulation):
+            results = sorted(pyrtl.parallel_step_multiple(
+                jobs, simulation=simulation, max_workers=2, trace=True),
+                key=lambda r: r.index)
+            self.assertEqual([r.passed for r in results], [i not in (1, 3) for i in range(7)])
+            self.assertIn('PyrtlError', results[1].report)
+            self.assertIn('r is 0xff', results[3].report)
+            self.assertEqual(list(results[2].trace.trace['a']), self.stimulus[2])
+
+    def test_subclass_and_options(self):
+        jobs = [{'provided_inputs': {'a': vals},
+                 'expected_outputs': {'o': self.expected(vals, default_value=3)}}
+                for vals in self.stimulus]
+        results = list(pyrtl.parallel_step_multiple(
+            jobs, simulation=SubclassedSimulation, max_workers=2, default_value=3))
+        self.assertTrue(all(r.passed for r in results))
+        results = list(pyrtl.parallel_step_multiple(
+            jobs, simulation=pyrtl.FastSimulation, max_workers=2, dense_memories=True,
+            default_value=3))
+        self.assertTrue(all(r.passed for r in results))
+
+    def test_bad_simulation(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            list(pyrtl.parallel_step_multiple([], simulation=object))
+        with self.assertRaises(pyrtl.PyrtlError):
+            list(pyrtl.parallel_step_multiple([], tracer=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
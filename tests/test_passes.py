@@ -67,6 +67,25 @@ class TestSynthesis(unittest.TestCase):
         self.r.next <<= pyrtl.mux(self.r, 4, 3, 1, 7, 2, 6, 0, 5)
         self.check_trace('r 04213756\n')
 
+    def test_rtl_assert_kept(self):
+        self.r.next <<= self.r + 1
+        pyrtl.rtl_assert(self.r != 5, Exception('r is 5'))
+        pre_asserts = dict(pyrtl.working_block().rtl_assert_dict)
+        block = pyrtl.synthesize()
+        self.assertEqual(pyrtl.working_block(), block)
+        (pre_wire, exp), = pre_asserts.items()
+        (wire, post_exp), = block.rtl_assert_dict.items()
+        self.assertIs(post_exp, exp)
+        self.assertIs(block.get_wirevector_by_name(pre_wire.name), wire)
+        self.assertIsInstance(wire, Output)
+        for simulation in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = simulation()
+            for i in range(5):
+                sim.step({})
+            with self.assertRaises(Exception) as context:
+                sim.step({})
+            self.assertIs(context.exception, exp)
+
 
 class TestMultiplierSynthesis(unittest.TestCase):
     def setUp(self):
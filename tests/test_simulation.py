@@ -1,3 +1,8 @@
+import os
+import json
+import random
+import shutil
+import tempfile
 import unittest
 import six
 
@@ -14,6 +19,23 @@ def fastsim_only(sim):
     return sim is pyrtl.FastSimulation
 
 
+def simulation_mode(mode):
+    """ Make a Simulation subclass that defaults to the given evaluation mode, so that
+    the unittests below can be run against each of the Simulation modes. """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('mode', mode)
+        pyrtl.Simulation.__init__(self, *args, **kwargs)
+    return type(str('Simulation' + mode.capitalize()), (pyrtl.Simulation,), {'__init__': __init__})
+
+
+def dense_memories(sim):
+    """ Make a subclass of the simulation that defaults to dense_memories=True. """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('dense_memories', True)
+        sim.__init__(self, *args, **kwargs)
+    return type(str(sim.__name__ + 'Dense'), (sim,), {'__init__': __init__})
+
+
 class TraceWithBasicOpsBase(unittest.TestCase):
     def setUp(self):
         pyrtl.reset_working_block()
@@ -952,6 +974,23 @@ class RomBlockSimBase(unittest.TestCase):
         with self.assertRaises(pyrtl.PyrtlError):
             sim.step({rom_add_1: 7})
 
+    def test_rom_function_called_once_per_address(self):
+        calls = []
+
+        def rom_data_function(addr):
+            calls.append(addr)
+            return 7 - addr
+        rom = pyrtl.RomBlock(bitwidth=3, addrwidth=3, romdata=rom_data_function)
+        rom_add = pyrtl.Input(3, "rom_in")
+        rom_out = pyrtl.Output(3, "rom_out")
+        rom_out <<= rom[rom_add]
+
+        for i in range(2):
+            sim = self.sim()
+            sim.step_multiple({rom_add: [1, 2, 1, 6]})
+            self.assertEqual(sim.tracer.trace['rom_out'], [6, 5, 6, 1])
+        self.assertEqual(calls, [1, 2, 6])  # only the addresses read, each once
+
     def test_rom_val_map(self):
         def rom_data_function(add):
             return int((add + 5) / 2)
@@ -992,7 +1031,7 @@ class InspectBase(unittest.TestCase):
         b <<= a
         sim_trace = pyrtl.SimulationTrace()
         sim = self.sim(tracer=sim_trace)
-        if self.sim is pyrtl.Simulation:
+        if issubclass(self.sim, pyrtl.Simulation):
             self.assertEqual(sim.inspect(a), 0)
             self.assertEqual(sim.inspect(b), 0)
         else:
@@ -1035,6 +1074,79 @@ class TraceErrorBase(unittest.TestCase):
         with self.assertRaises(pyrtl.PyrtlError):
             self.sim_trace.print_trace(base=4)
 
+class CheckpointBase(unittest.TestCase):
+    def setUp(self):
+        self.build()
+        self.steps = [{'a': (5 * i + 1) % 8, 'b': (3 * i) % 8} for i in range(12)]
+
+    def build(self, mem_name='mem'):
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(3, 'a'), pyrtl.Input(3, 'b')
+        r = pyrtl.Register(8, 'r')
+        mem = pyrtl.MemBlock(8, 3, mem_name)
+        o = pyrtl.Output(8, 'o')
+        r.next <<= r + a + 1
+        mem[a] <<= r
+        o <<= r + mem[b]
+
+    def run_steps(self, sim, steps):
+        outs = []
+        for step in steps:
+            sim.step(step)
+            outs.append(sim.inspect('o'))
+        return outs
+
+    def test_checkpoint_and_restore(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        checkpoint = sim.checkpoint()
+        expected = self.run_steps(sim, self.steps[6:])
+        sim.restore(checkpoint)
+        self.assertEqual(self.run_steps(sim, self.steps[6:]), expected)
+
+    def test_fork(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        fork = sim.fork()
+        self.assertEqual(self.run_steps(fork, self.steps[6:]),
+                         self.run_steps(sim, self.steps[6:]))
+        # the fork and the original do not share state
+        checkpoint = sim.checkpoint()
+        self.run_steps(fork, self.steps[:3])
+        self.assertEqual(sim.checkpoint(), checkpoint)
+
+    def test_restore_from_other_simulation(self):
+        ref = pyrtl.Simulation()
+        self.run_steps(ref, self.steps[:6])
+        sim = self.sim()
+        sim.restore(ref.checkpoint())
+        self.assertEqual(self.run_steps(sim, self.steps[6:]),
+                         self.run_steps(ref, self.steps[6:]))
+
+    def test_bad_checkpoint(self):
+        sim = self.sim()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.restore(b'not a checkpoint')
+
+    def test_restore_into_rebuilt_design(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        checkpoint = sim.checkpoint()
+        expected = self.run_steps(sim, self.steps[6:])
+        self.build()  # new memory and wire objects, with the same names
+        sim = self.sim()
+        sim.restore(checkpoint)
+        self.assertEqual(self.run_steps(sim, self.steps[6:]), expected)
+
+    def test_restore_unknown_memory(self):
+        sim = self.sim()
+        self.run_steps(sim, self.steps[:6])
+        checkpoint = sim.checkpoint()
+        self.build(mem_name='other')
+        sim = self.sim()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.restore(checkpoint)
+
 
 def make_unittests():
     """
@@ -1059,9 +1171,547 @@ def make_unittests():
     g.update(unittests)
 
 # add compiledsim here if you want to unittest that as well
-sims = (pyrtl.Simulation, pyrtl.FastSimulation)
+sims = (pyrtl.Simulation, pyrtl.FastSimulation,
+        simulation_mode('slots'), simulation_mode('event'),
+        dense_memories(pyrtl.Simulation), dense_memories(simulation_mode('event')),
+        dense_memories(pyrtl.FastSimulation))
 make_unittests()
 
 
+class TestSimulationModes(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(4, 'a')
+        self.r = pyrtl.Register(4, 'r')
+        self.o = pyrtl.Output(5, 'o')
+        self.r.next <<= self.a
+        self.o <<= self.r + self.a
+
+    def test_invalid_mode(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.Simulation(mode='bogus')
+
+    def test_slots_value_views(self):
+        sim = pyrtl.Simulation(mode='slots', register_value_map={self.r: 3})
+        self.assertEqual(sim.value[self.r], 3)
+        sim.step({'a': 5})
+        self.assertEqual(sim.value[self.o], 8)
+        self.assertEqual(sim.regvalue[self.r], 5)
+        self.assertEqual(sim.inspect('o'), 8)
+        self.assertEqual(set(sim.value), pyrtl.working_block().wirevector_set)
+        sim.step({'a': 1})
+        self.assertEqual(sim.inspect('o'), 6)
+
+    def test_slots_matches_interpret(self):
+        traces = []
+        for mode in pyrtl.Simulation.modes:
+            sim = pyrtl.Simulation(mode=mode)
+            sim.step_multiple({'a': [1, 2, 15, 0, 7]})
+            traces.append(sim.tracer.trace)
+        for trace in traces[1:]:
+            self.assertEqual(trace, traces[0])
+
+    def test_event_memory_wakes_readers(self):
+        pyrtl.reset_working_block()
+        we = pyrtl.Input(1, 'we')
+        data = pyrtl.Input(4, 'data')
+        mem = pyrtl.MemBlock(4, 2, 'mem')
+        addr = pyrtl.Register(2, 'addr')  # read address never changes
+        addr.next <<= addr
+        mem[pyrtl.Const(1, 2)] <<= pyrtl.MemBlock.EnabledWrite(data, we)
+        out = pyrtl.Output(4, 'out')
+        out <<= mem[addr]
+        sim = pyrtl.Simulation(mode='event', register_value_map={addr: 1})
+        sim.step_multiple({'we': '01000', 'data': '07300'}, {'out': '00777'})
+        self.assertEqual(sim.inspect_mem(mem), {1: 7})
+
+    def test_event_only_evaluates_changed_cones(self):
+        sim = pyrtl.Simulation(mode='event')
+        evaluated = []
+        sim._net_funcs = tuple(
+            (lambda f, i: lambda v: (evaluated.append(i), f(v)))(f, i)
+            for i, f in enumerate(sim._net_funcs))
+        sim.step({'a': 3})
+        self.assertEqual(len(evaluated), len(sim._net_funcs))
+        del evaluated[:]
+        sim.step({'a': 3})  # only the register changed, so only the adder and output
+        self.assertEqual(len(evaluated), 2)
+        del evaluated[:]
+        sim.step({'a': 3})  # nothing changed
+        self.assertEqual(evaluated, [])
+        self.assertEqual(sim.inspect('o'), 6)
+
+
+class TestFastSimulationCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        pyrtl.FastSimulation._code_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def build(self, extra_wires=0, width=8):
+        for i in range(extra_wires):
+            pyrtl.WireVector(1)  # move the counter used to name temporary wires
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(width, 'a'), pyrtl.Input(width, 'b')
+        r = pyrtl.Register(width)
+        mem = pyrtl.MemBlock(width, 2)
+        o = pyrtl.Output(width, 'o')
+        r.next <<= r + a
+        mem[b[:2]] <<= a ^ r
+        o <<= pyrtl.select(a[0], mem[a[:2]], r * b)
+        return pyrtl.FastSimulation(cache_dir=self.cache_dir)
+
+    def run_sim(self, sim):
+        sim.step_multiple({'a': [1, 5, 6, 7, 2], 'b': [3, 2, 1, 0, 3]})
+        return sim.tracer.trace['o']
+
+    def cached_sources(self):
+        return [f for f in os.listdir(os.path.join(self.cache_dir, 'fastsim'))
+                if f.endswith('.py')]
+
+    def test_code_independent_of_temporary_names(self):
+        first = self.build()
+
+        def no_codegen(sim):
+            raise AssertionError('code should have come from the cache')
+        original = pyrtl.FastSimulation._compiled
+        pyrtl.FastSimulation._compiled = no_codegen
+        try:
+            second = self.build(extra_wires=1234)
+        finally:
+            pyrtl.FastSimulation._compiled = original
+        self.assertEqual(self.run_sim(first), self.run_sim(second))
+        self.assertEqual(len(self.cached_sources()), 1)
+
+    def test_synthesized_code_independent_of_temporary_names(self):
+        # synthesis names wires after others, as in 'tmp99_synth_1', whose order must
+        # not change when the numbers of the made up names get another digit
+        def build(first_index):
+            indexer.internal_index = first_index
+            pyrtl.reset_working_block()
+            a = pyrtl.Input(4, 'a')
+            r1, r2 = pyrtl.Register(4), pyrtl.Register(4)
+            o = pyrtl.Output(4, 'o')
+            r1.next <<= a ^ r2
+            r2.next <<= r1 + 1
+            o <<= r2
+            pyrtl.synthesize()
+            sim = pyrtl.FastSimulation(cache_dir=self.cache_dir)
+            sim.step_multiple({'a': [1, 5, 6, 7, 2]})
+            return sim.tracer.trace['o']
+
+        def no_codegen(sim):
+            raise AssertionError('code should have come from the cache')
+        indexer = pyrtl.wire._wvIndexer
+        index = indexer.internal_index
+        original = pyrtl.FastSimulation._compiled
+        try:
+            expected = build(95)
+            pyrtl.FastSimulation._compiled = no_codegen
+            self.assertEqual(build(98), expected)
+        finally:
+            pyrtl.FastSimulation._compiled = original
+            indexer.internal_index = index
+
+    def test_code_file_has_wire_names(self):
+        self.build()
+        code_file = os.path.join(self.cache_dir, 'sim.py')
+        sim = pyrtl.FastSimulation(code_file=code_file)
+        with open(code_file) as f:
+            code = f.read()
+        self.assertIn('_o ', code)
+        self.assertEqual(self.run_sim(sim), self.run_sim(self.build()))
+
+    def test_cached_code_bound_to_new_block(self):
+        # the cached code reads the wires and memories of the block it is used for
+        expected = self.run_sim(self.build())
+        for i in range(2):
+            sim = self.build(extra_wires=3)
+            sim.sim_run({'a': [1, 5, 6, 7, 2], 'b': [3, 2, 1, 0, 3]})
+            self.assertEqual(sim.tracer.trace['o'], expected)
+
+    def test_code_loaded_from_disk(self):
+        expected = self.run_sim(self.build())
+        pyrtl.FastSimulation._code_cache.clear()
+
+        def no_compile(*args, **kwargs):
+            raise AssertionError('code should have come from the cache')
+        pyrtl.simulation.compile = no_compile
+        try:
+            sim = self.build(extra_wires=7)
+        finally:
+            del pyrtl.simulation.compile
+        self.assertEqual(self.run_sim(sim), expected)
+
+    def test_different_designs_not_shared(self):
+        self.build(width=8)
+        self.build(width=9)
+        self.assertEqual(len(self.cached_sources()), 2)
+
+    def test_no_disk_cache(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(2, 'o')
+        o <<= ~a
+        sim = pyrtl.FastSimulation(cache_dir=False)
+        sim.step({'a': 1})
+        self.assertEqual(sim.inspect('o'), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'fastsim')))
+
+
+class TestFastSimulationRun(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a, b = pyrtl.Input(4, 'a'), pyrtl.Input(4, 'b')
+        r = pyrtl.Register(8, 'r')
+        unread = pyrtl.Register(4, 'unread')
+        mem = pyrtl.MemBlock(8, 2, 'mem')
+        rom = pyrtl.RomBlock(4, 2, [3, 1, 4, 1])
+        t = pyrtl.WireVector(8, 't')
+        o = pyrtl.Output(8, 'o')
+        t <<= r ^ mem[b[:2]]
+        r.next <<= r + a
+        unread.next <<= b
+        mem[a[:2]] <<= pyrtl.MemBlock.EnabledWrite(t, b[3])
+        o <<= t + rom[a[2:]]
+        self.mem = mem
+        random.seed(0)
+        self.stimulus = {'a': [random.randrange(16) for i in range(30)],
+                         'b': [random.randrange(16) for i in range(30)]}
+
+    def check_same_as_step(self, run):
+        init = {'memory_value_map': {self.mem: {1: 9}}}
+        stepped = pyrtl.FastSimulation(memory_value_map={self.mem: {1: 9}})
+        for i in range(30):
+            stepped.step({name: vals[i] for name, vals in self.stimulus.items()})
+        sim = pyrtl.FastSimulation(**init)
+        run(sim)
+        self.assertEqual(sim.tracer.trace, stepped.tracer.trace)
+        self.assertIn('t', sim.tracer.trace)
+        for name in ('a', 'r', 'unread', 't', 'o'):
+            self.assertEqual(sim.inspect(name), stepped.inspect(name))
+        self.assertEqual(sim.inspect_mem(self.mem), stepped.inspect_mem(self.mem))
+        self.assertEqual(sim.regs, stepped.regs)
+
+    def test_sim_run(self):
+        def run(sim):
+            results = sim.sim_run(self.stimulus)
+            self.assertEqual(results['t'], sim.tracer.trace['t'])
+        self.check_same_as_step(run)
+
+    def test_sim_run_in_parts(self):
+        def run(sim):
+            sim.sim_run(self.stimulus, 10)
+            sim.sim_run({name: vals[10:] for name, vals in self.stimulus.items()})
+        self.check_same_as_step(run)
+
+    def test_run(self):
+        def run(sim):
+            sim.run([{name: vals[i] for name, vals in self.stimulus.items()}
+                     for i in range(30)])
+        self.check_same_as_step(run)
+
+    def test_rtl_assert_stops_the_run(self):
+        class BadValue(Exception):
+            pass
+        pyrtl.reset_working_block()
+        r = pyrtl.Register(4, 'r')
+        r.next <<= r + 1
+        pyrtl.rtl_assert(r != 3, BadValue('r is 3'))
+        sim = pyrtl.FastSimulation()
+        with self.assertRaises(BadValue):
+            sim.sim_run({}, 10)
+        self.assertEqual(sim.tracer.trace['r'], [0, 1, 2, 3])
+        self.assertEqual(sim.inspect('r'), 3)
+        self.assertEqual(sim.regs['r'], 4)
+
+    def test_bad_inputs(self):
+        sim = pyrtl.FastSimulation()
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.sim_run({'a': [1, 2]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.sim_run({'a': [1, 16], 'b': [1, 2]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.sim_run({'a': [1, 2], 'b': [1]}, 2)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.sim_run({'a': [1, 2, 3], 'b': [1, 2]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.sim_run({})
+        self.assertEqual(sim.tracer.trace['a'], [])
+
+
+class TestDenseMemory(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        waddr, raddr = pyrtl.Input(3, 'waddr'), pyrtl.Input(3, 'raddr')
+        data, we = pyrtl.Input(8, 'data'), pyrtl.Input(1, 'we')
+        self.mem = pyrtl.MemBlock(8, 3, 'mem')
+        self.big = pyrtl.MemBlock(8, 21, 'big')
+        o, o2 = pyrtl.Output(8, 'o'), pyrtl.Output(8, 'o2')
+        self.mem[waddr] <<= pyrtl.MemBlock.EnabledWrite(data, we)
+        self.big[pyrtl.concat(raddr, pyrtl.Const(0, 18))] <<= data
+        o <<= self.mem[raddr]
+        o2 <<= self.big[pyrtl.concat(waddr, pyrtl.Const(0, 18))]
+
+    def test_mapping(self):
+        mem = pyrtl.simulation.DenseMemory(2, default_value=0, contents={1: 5})
+        self.assertEqual(mem.data, [0, 5, 0, 0])
+        self.assertEqual(mem, {0: 0, 1: 5})
+        self.assertNotEqual(mem, {1: 5, 7: 0})
+        self.assertEqual(dict(mem), {1: 5})
+        self.assertEqual(len(mem), 1)
+        self.assertEqual(mem[2], 0)
+        del mem[1]
+        self.assertEqual(len(mem), 0)
+        with self.assertRaises(KeyError):
+            mem[4]
+        with self.assertRaises(pyrtl.PyrtlError):
+            mem[4] = 1
+
+    def test_only_small_memories_are_dense(self):
+        for sim in (pyrtl.Simulation, pyrtl.FastSimulation):
+            s = sim(dense_memories=True, memory_value_map={self.mem: {2: 3}})
+            self.assertIsInstance(s.inspect_mem(self.mem), pyrtl.simulation.DenseMemory)
+            self.assertIsInstance(s.inspect_mem(self.big), dict)
+            self.assertEqual(s.inspect_mem(self.mem).data[2], 3)
+
+    def test_checkpoint_between_dense_and_sparse(self):
+        dense = pyrtl.FastSimulation(dense_memories=True)
+        dense.step_multiple({'waddr': [1, 2], 'raddr': [1, 2], 'data': [7, 8], 'we': [1, 1]})
+        for sim in (pyrtl.Simulation(), pyrtl.Simulation(dense_memories=True, mode='slots'),
+                    pyrtl.FastSimulation()):
+            sim.restore(dense.checkpoint())
+            sim.step({'waddr': 0, 'raddr': 2, 'data': 0, 'we': 0})
+            self.assertEqual(sim.inspect('o'), 8)
+            self.assertEqual(sim.inspect_mem(self.mem), {1: 7, 2: 8})
+        forked = dense.fork()
+        forked.step({'waddr': 3, 'raddr': 3, 'data': 9, 'we': 1})
+        self.assertEqual(dense.inspect_mem(self.mem), {1: 7, 2: 8})
+        self.assertEqual(forked.inspect_mem(self.mem), {1: 7, 2: 8, 3: 9})
+
+    def test_memory_image(self):
+        image = pyrtl.input_from_memory_image('@2 0a 0b', bitwidth=8)
+        sim = pyrtl.Simulation(dense_memories=True, memory_value_map={self.mem: image})
+        sim.step_multiple({'waddr': [0] * 3, 'raddr': [1, 2, 3], 'data': [0] * 3,
+                           'we': [0] * 3})
+        self.assertEqual(sim.tracer.trace['o'], [0, 10, 11])
+
+
+class TestTraceColumn(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(8, 'a')
+        self.w = pyrtl.Input(100, 'w')
+        self.o = pyrtl.Output(8, 'o')
+        self.o <<= self.a + 1
+
+    def test_storage(self):
+        from array import array
+        trace = pyrtl.SimulationTrace()
+        self.assertIsInstance(trace.trace['a']._data, array)
+        self.assertIsInstance(trace.trace['w']._data, list)
+
+    def test_list_like(self):
+        column = pyrtl.simulation.TraceColumn(8, [3, 1, 4])
+        column.append(1)
+        column.extend([5, 9])
+        self.assertEqual(column, [3, 1, 4, 1, 5, 9])
+        self.assertEqual([3, 1, 4, 1, 5, 9], column)
+        self.assertNotEqual(column, [3, 1, 4])
+        self.assertEqual(len(column), 6)
+        self.assertEqual(column[-1], 9)
+        self.assertEqual(column[1:3], [1, 4])
+        self.assertIs(type(column[1:3]), list)
+        self.assertEqual(json.dumps(column[:]), '[3, 1, 4, 1, 5, 9]')
+        self.assertEqual(max(column), 9)
+        self.assertEqual(repr(column), '[3, 1, 4, 1, 5, 9]')
+        column[0] = 2
+        self.assertEqual(column.pop(), 9)
+        self.assertEqual(column.tolist(), [2, 1, 4, 1, 5])
+        wide = pyrtl.simulation.TraceColumn(100, [1 << 99])
+        self.assertEqual(wide, [1 << 99])
+
+    def test_list_operations(self):
+        column = pyrtl.simulation.TraceColumn(8, [3, 1, 4])
+        self.assertEqual(column + [0], [3, 1, 4, 0])
+        self.assertIs(type(column + [0]), list)
+        self.assertEqual([0] + column, [0, 3, 1, 4])
+        self.assertEqual(column + column, [3, 1, 4, 3, 1, 4])
+        self.assertEqual(column * 2, [3, 1, 4, 3, 1, 4])
+        self.assertEqual(2 * column, [3, 1, 4, 3, 1, 4])
+        self.assertTrue(column < [3, 2])
+        self.assertTrue(column >= [3, 1, 4])
+        self.assertEqual(sorted(column), [1, 3, 4])
+        column += [1]
+        self.assertEqual(column.tolist(), [3, 1, 4, 1])
+        self.assertIs(type(column.tolist()), list)
+
+    def test_no_uint64_array(self):
+        # as on python 2.7, which has no array('Q')
+        saved = pyrtl.simulation._UINT64
+        pyrtl.simulation._UINT64 = None
+        try:
+            column = pyrtl.simulation.TraceColumn(8, [3, 1, 4])
+            self.assertIsInstance(column._data, list)
+            column.extend([1, 5])
+            self.assertEqual(column, [3, 1, 4, 1, 5])
+            ring = pyrtl.simulation.RingTraceColumn(8, 2, [3, 1, 4])
+            self.assertEqual(ring, [1, 4])
+            sim = pyrtl.Simulation()
+            sim.step_multiple({'a': [1, 2, 255], 'w': [0, 1 << 99, 5]})
+            self.assertEqual(sim.tracer.trace['o'], [2, 3, 0])
+        finally:
+            pyrtl.simulation._UINT64 = saved
+
+    def test_simulation_trace_extend(self):
+        trace = pyrtl.SimulationTrace()
+        trace.extend({'a': [1, 2], 'w': [1 << 90, 0], 'o': [2, 3]})
+        self.assertEqual(len(trace), 2)
+        self.assertEqual(trace.trace['w'], [1 << 90, 0])
+        with self.assertRaises(pyrtl.PyrtlError):
+            trace.extend({'a': [1], 'w': [1, 2], 'o': [2, 3]})
+
+    def test_extend_from_buffer(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('requires numpy')
+        column = pyrtl.simulation.TraceColumn(64, [7])
+        values = numpy.array([[1, 2], [3, 4], [(1 << 64) - 1, 6]], dtype=numpy.uint64)
+        column.extend(values[:, 0])
+        self.assertEqual(column, [7, 1, 3, (1 << 64) - 1])
+        self.assertIs(type(column[1]), int)
+        wide = pyrtl.simulation.TraceColumn(100)
+        wide.extend(numpy.array([5], dtype=numpy.uint64))
+        self.assertIs(type(wide[0]), int)
+
+    def test_simulations_fill_columns(self):
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation):
+            sim = sim_class()
+            sim.step_multiple({'a': [1, 2, 255], 'w': [0, 1 << 99, 5]})
+            self.assertEqual(sim.tracer.trace['o'], [2, 3, 0])
+            self.assertEqual(sim.tracer.trace['w'], [0, 1 << 99, 5])
+
+
+class TestBoundedSimulationTrace(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        self.a = pyrtl.Input(4, 'a')
+        self.r = pyrtl.Register(8, 'r')
+        o = pyrtl.Output(8, 'o')
+        self.r.next <<= self.r + self.a
+        o <<= self.r
+        self.inputs = [3, 1, 4, 1, 5, 9, 2, 6]
+
+    def run_both(self, sim_class=pyrtl.Simulation):
+        full = sim_class()
+        full.step_multiple({'a': self.inputs})
+        tracer = pyrtl.BoundedSimulationTrace(max_cycles=3)
+        return full.tracer, sim_class(tracer=tracer), tracer
+
+    def test_ring_column(self):
+        column = pyrtl.simulation.RingTraceColumn(8, 4)
+        column.extend([1, 2, 3])
+        self.assertEqual(column, [1, 2, 3])
+        column.append(4)
+        column.append(5)
+        self.assertEqual(column, [2, 3, 4, 5])
+        self.assertEqual(column[0], 2)
+        self.assertEqual(column[-1], 5)
+        self.assertEqual(column[1:3], [3, 4])
+        self.assertIs(type(column[1:3]), list)
+        column.extend(range(6, 16))
+        self.assertEqual(column, [12, 13, 14, 15])
+        column.extend([16, 17])
+        self.assertEqual(column.tolist(), [14, 15, 16, 17])
+        with self.assertRaises(IndexError):
+            column[4]
+        with self.assertRaises(pyrtl.PyrtlError):
+            del column[0]
+        wide = pyrtl.simulation.RingTraceColumn(100, 2, [1 << 99, 2, 3])
+        self.assertEqual(wide, [2, 3])
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.simulation.RingTraceColumn(8, 0)
+
+    def test_ring_column_from_buffer(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest('requires numpy')
+        column = pyrtl.simulation.RingTraceColumn(64, 3, [1, 2])
+        column.extend(numpy.arange(10, 14, dtype=numpy.uint64))
+        self.assertEqual(column, [11, 12, 13])
+
+    def test_keeps_last_cycles(self):
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation, pyrtl.CompiledSimulation):
+            full, sim, tracer = self.run_both(sim_class)
+            for a in self.inputs[:2]:
+                sim.step({'a': a})
+            sim.step_multiple({'a': self.inputs[2:]})
+            self.assertEqual(len(tracer), 3)
+            self.assertEqual(tracer.first_cycle, 5)
+            for name in ('a', 'o'):
+                self.assertEqual(tracer.trace[name], full.trace[name][5:])
+            self.assertEqual(sim.inspect('o'), full.trace['o'][-1])
+
+    def test_presentation(self):
+        full, sim, tracer = self.run_both()
+        sim.step_multiple({'a': self.inputs})
+        window = pyrtl.SimulationTrace()
+        window.extend({name: full.trace[name][5:] for name in full.trace})
+
+        bounded_output, window_output = six.StringIO(), six.StringIO()
+        tracer.print_trace(bounded_output)
+        window.print_trace(window_output)
+        self.assertEqual(bounded_output.getvalue(), window_output.getvalue())
+        self.assertEqual(pyrtl.trace_to_html(tracer), pyrtl.trace_to_html(window))
+
+        output = six.StringIO()
+        tracer.render_trace(file=output, render_cls=pyrtl.simulation.AsciiWaveRenderer)
+        self.assertTrue(output.getvalue().startswith('  -5 '))
+
+        output = six.StringIO()
+        tracer.print_vcd(output)
+        vcd = output.getvalue()
+        self.assertIn('#50\nb1001 a\nb1110 o\n', vcd)
+        self.assertNotIn('#40', vcd)
+        self.assertTrue(vcd.endswith('#80\n'))
+
+    def test_dump_on_assert(self):
+        pyrtl.rtl_assert(self.r < 20, Exception('overflow'))
+        for sim_class in (pyrtl.Simulation, pyrtl.FastSimulation, pyrtl.CompiledSimulation):
+            dump = six.StringIO()
+            tracer = pyrtl.BoundedSimulationTrace(max_cycles=3, dump_file=dump)
+            sim = sim_class(tracer=tracer)
+            with self.assertRaises(Exception):
+                sim.step_multiple({'a': self.inputs})
+            self.assertEqual(tracer.first_cycle, 4)
+            self.assertEqual(tracer.trace['o'], [9, 14, 23])
+            output = six.StringIO()
+            tracer.print_vcd(output)
+            self.assertEqual(dump.getvalue(), output.getvalue())
+
+    def test_dump_to_file_name(self):
+        pyrtl.rtl_assert(self.r < 20, Exception('overflow'))
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'failure.vcd')
+            tracer = pyrtl.BoundedSimulationTrace(max_cycles=3, dump_file=path,
+                                                  include_clock=True)
+            sim = pyrtl.Simulation(tracer=tracer)
+            with self.assertRaises(Exception):
+                sim.step_multiple({'a': self.inputs})
+            with open(path) as f:
+                self.assertIn('b0 clk', f.read())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_invalid_size(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.BoundedSimulationTrace(max_cycles=0)
+
+
 if __name__ == '__main__':
     unittest.main()
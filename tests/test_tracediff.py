@@ -0,0 +1,103 @@
+import unittest
+import six
+
+import pyrtl
+
+
+class TestTraceDiff(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(8, 'r')
+        w = pyrtl.Register(100, 'w')
+        o = pyrtl.Output(8, 'o')
+        r.next <<= r + a
+        w.next <<= pyrtl.concat(r, w[8:])
+        o <<= r
+        self.inputs = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]
+
+    def run_sim(self, sim_class=pyrtl.Simulation, inputs=None, **kwargs):
+        sim = sim_class(**kwargs)
+        sim.step_multiple({'a': self.inputs if inputs is None else inputs})
+        return sim.tracer
+
+    def test_matching_simulations(self):
+        expected = self.run_sim()
+        for sim_class in (pyrtl.FastSimulation, pyrtl.CompiledSimulation):
+            kwargs = {'internal_wires': ['w']} if sim_class is pyrtl.CompiledSimulation else {}
+            diff = pyrtl.trace_diff(expected, self.run_sim(sim_class, **kwargs))
+            self.assertFalse(diff)
+            self.assertIsNone(diff.first_divergence)
+            self.assertEqual(diff.mismatches, 0)
+            self.assertEqual(diff.cycles, (0, 10))
+            self.assertEqual(sorted(diff.wires), ['a', 'o', 'r', 'w'])
+            output = six.StringIO()
+            diff.print_summary(output)
+            self.assertEqual(output.getvalue(), 'traces match (4 wires, 10 cycles)\n')
+
+    def test_divergence(self):
+        expected = self.run_sim()
+        inputs = list(self.inputs)
+        inputs[4] = 6
+        actual = self.run_sim(inputs=inputs)
+        diff = pyrtl.trace_diff(expected, actual)
+        self.assertTrue(diff)
+        self.assertEqual(diff.first_divergence, 4)
+        self.assertEqual(diff.wires['a'], pyrtl.tracediff.WireDiff('a', 4, 1, 5, 6))
+        self.assertEqual(diff.wires['o'].first_divergence, 5)
+        self.assertEqual(diff.wires['o'].mismatches, 5)
+        self.assertEqual(diff.wires['o'].expected + 1, diff.wires['o'].actual)
+        self.assertEqual(diff.wires['w'].first_divergence, 6)
+        self.assertEqual([d.name for d in diff.diverged], ['a', 'o', 'r', 'w'])
+        self.assertEqual(diff.mismatches, 1 + 5 + 5 + 4)
+        output = six.StringIO()
+        diff.print_summary(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], '4 of 4 wires differ in 15 values over 10 cycles')
+        self.assertEqual(lines[1], '  a: first differs in cycle 4 (expected 5, actual 6), '
+                                   '1 cycles differ')
+
+        diff = pyrtl.trace_diff(expected, actual, names=['w'])
+        self.assertEqual(list(diff.wires), ['w'])
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.trace_diff(expected, actual, names=['nope'])
+
+    def test_different_wires_and_lengths(self):
+        expected = self.run_sim()
+        actual = self.run_sim(inputs=self.inputs[:7], tracer=pyrtl.SimulationTrace(
+            wires_to_track=[pyrtl.working_block().get_wirevector_by_name(n)
+                            for n in ('a', 'o')]))
+        diff = pyrtl.trace_diff(expected, actual)
+        self.assertTrue(diff)
+        self.assertIsNone(diff.first_divergence)
+        self.assertEqual(diff.cycles, (0, 7))
+        self.assertEqual(diff.only_expected, ['r', 'w'])
+        self.assertEqual(diff.only_actual, [])
+        output = six.StringIO()
+        diff.print_summary(output)
+        self.assertIn('cycles differ: expected 0 to 9, actual 0 to 6', output.getvalue())
+        self.assertIn('only in expected: r, w', output.getvalue())
+
+    def test_windows(self):
+        expected = self.run_sim()
+        actual = self.run_sim(tracer=pyrtl.BoundedSimulationTrace(max_cycles=4))
+        diff = pyrtl.trace_diff(expected, actual)
+        self.assertEqual(diff.cycles, (6, 10))
+        self.assertEqual(diff.mismatches, 0)
+
+        actual.trace['o'][1] += 1
+        diff = pyrtl.trace_diff(expected, actual)
+        self.assertEqual(diff.first_divergence, 7)
+        self.assertEqual(diff.wires['o'].actual, expected.trace['o'][7] + 1)
+
+    def test_against_vcd(self):
+        expected = self.run_sim()
+        output = six.StringIO()
+        expected.print_vcd(output)
+        diff = pyrtl.trace_diff(expected, pyrtl.input_from_vcd(output.getvalue()))
+        self.assertEqual(diff.mismatches, 0)
+        self.assertEqual(diff.cycles, (0, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyrtl
+
+
+class TestTraceFile(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(8, 'r')
+        w = pyrtl.Register(100, 'w')
+        o = pyrtl.Output(8, 'o')
+        r.next <<= r + a
+        w.next <<= pyrtl.concat(r, w[8:])
+        o <<= r
+        self.inputs = [0, 0, 0, 1, 0, 0, 15, 15, 3, 0, 0, 0, 0, 2, 2, 9, 0]
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'run.trace')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def expected(self):
+        sim = pyrtl.Simulation()
+        sim.step_multiple({'a': self.inputs})
+        return sim.tracer
+
+    def check_file(self, expected, first_cycle=0):
+        with pyrtl.TraceFileReader(self.path) as reader:
+            self.assertEqual(reader.names, ['a', 'o', 'r', 'w'])
+            self.assertEqual(reader.bitwidths, {'a': 4, 'o': 8, 'r': 8, 'w': 100})
+            self.assertEqual(reader.first_cycle, first_cycle)
+            self.assertEqual(len(reader), len(self.inputs) - first_cycle)
+            window = reader.window()
+            for name in reader.names:
+                self.assertEqual(window[name], expected.trace[name][first_cycle:])
+                for cycle in range(first_cycle, len(self.inputs)):
+                    self.assertEqual(reader.value(name, cycle), expected.trace[name][cycle])
+
+    def test_step(self):
+        sim = pyrtl.Simulation()
+        with pyrtl.TraceFileWriter(self.path, sim, block_cycles=4):
+            for a in self.inputs:
+                sim.step({'a': a})
+        self.check_file(self.expected())
+
+    def test_many_steps_at_once(self):
+        sim = pyrtl.FastSimulation(tracer=pyrtl.BoundedSimulationTrace(max_cycles=1))
+        with pyrtl.TraceFileWriter(self.path, sim, block_cycles=3):
+            sim.sim_run({'a': self.inputs[:5]})
+            sim.sim_run({'a': self.inputs[5:]})
+        self.check_file(self.expected())
+
+    def test_compiled_simulation(self):
+        sim = pyrtl.CompiledSimulation(internal_wires=['r', 'w'])
+        with pyrtl.TraceFileWriter(self.path, sim, block_cycles=5):
+            sim.run([{'a': a} for a in self.inputs])
+        self.check_file(self.expected())
+
+    def test_attached_during_run(self):
+        sim = pyrtl.Simulation()
+        sim.step_multiple({'a': self.inputs[:6]})
+        with open(self.path, 'wb') as f:
+            writer = pyrtl.TraceFileWriter(f, sim, block_cycles=4)
+            sim.step_multiple({'a': self.inputs[6:]})
+            writer.close()
+            self.assertFalse(f.closed)
+        self.check_file(self.expected(), first_cycle=6)
+
+    def test_windows(self):
+        sim = pyrtl.Simulation()
+        with pyrtl.TraceFileWriter(self.path, sim, block_cycles=4):
+            sim.step_multiple({'a': self.inputs})
+        expected = self.expected()
+        with pyrtl.TraceFileReader(self.path) as reader:
+            window = reader.window(3, 10, names=['r'])
+            self.assertEqual(window, {'r': expected.trace['r'][3:10]})
+            self.assertEqual(reader.window(10, 100)['a'], self.inputs[10:])
+            self.assertEqual(reader.window(5, 5)['a'], [])
+
+            trace = reader.trace(6, 9)
+            self.assertEqual(trace.first_cycle, 6)
+            self.assertEqual(len(trace), 3)
+            self.assertEqual(trace.trace['w'], expected.trace['w'][6:9])
+            output = io.StringIO()
+            trace.print_vcd(output)
+            self.assertTrue(output.getvalue().endswith('#90\n'))
+
+            trace = reader.trace(names=['o'], block=pyrtl.working_block())
+            self.assertIs(trace._wires['o'], pyrtl.working_block().get_wirevector_by_name('o'))
+            self.assertEqual(trace.trace['o'], expected.trace['o'])
+
+            with self.assertRaises(pyrtl.PyrtlError):
+                reader.value('a', len(self.inputs))
+            with self.assertRaises(pyrtl.PyrtlError):
+                reader.value('nope', 0)
+
+    def test_compact(self):
+        sim = pyrtl.Simulation()
+        with pyrtl.TraceFileWriter(self.path, sim, block_cycles=1000):
+            sim.step_multiple({'a': [0] * 1000})
+        # a single run for each wire in the one block
+        self.assertLess(os.path.getsize(self.path), 200)
+
+    def test_invalid_files(self):
+        sim = pyrtl.Simulation()
+        writer = pyrtl.TraceFileWriter(self.path, sim)
+        sim.step({'a': 1})
+        writer.file.flush()
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.TraceFileReader(self.path)  # not closed, so no index yet
+        writer.close()
+        pyrtl.TraceFileReader(self.path).close()
+
+        with open(self.path, 'wb') as f:
+            f.write(b'not a trace file at all, not even close to one')
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.TraceFileReader(self.path)
+        open(self.path, 'wb').close()
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.TraceFileReader(self.path)
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.TraceFileWriter(self.path, sim, block_cycles=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
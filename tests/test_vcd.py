@@ -0,0 +1,290 @@
+import os
+import shutil
+import tempfile
+import unittest
+import six
+
+import pyrtl
+from pyrtl.vcd import _identifier
+
+
+VCD_HEADER = """$timescale 1ns $end
+$scope module logic $end
+{}$var wire 1 ! a $end
+$var wire 3 " o $end
+$var wire 3 # r $end
+$upscope $end
+$enddefinitions $end
+"""
+
+VCD_OUTPUT = VCD_HEADER.format('') + """#0
+$dumpvars
+1!
+b0 "
+b0 #
+$end
+#10
+b1 "
+b1 #
+#20
+0!
+b10 "
+b10 #
+#40
+1!
+#50
+"""
+
+VCD_OUTPUT_WITH_CLOCK = VCD_HEADER.format('$var wire 1 $ clk $end\n') + """#0
+$dumpvars
+1$
+1!
+b0 "
+b0 #
+$end
+#5
+0$
+#10
+1$
+b1 "
+b1 #
+#15
+0$
+#20
+1$
+0!
+b10 "
+b10 #
+#25
+0$
+#30
+1$
+#35
+0$
+#40
+1$
+1!
+#45
+0$
+#50
+"""
+
+
+class TestVcdWriter(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(1, 'a')
+        r = pyrtl.Register(3, 'r')
+        o = pyrtl.Output(3, 'o')
+        r.next <<= r + a
+        o <<= r
+        self.inputs = [1, 1, 0, 0, 1]
+
+    def write_vcd(self, run, sim_class=pyrtl.Simulation, **kwargs):
+        sim = sim_class()
+        output = six.StringIO()
+        with pyrtl.VcdWriter(output, sim, **kwargs):
+            run(sim)
+        return output.getvalue()
+
+    def test_step(self):
+        def run(sim):
+            for a in self.inputs:
+                sim.step({'a': a})
+        self.assertEqual(self.write_vcd(run), VCD_OUTPUT)
+        self.assertEqual(self.write_vcd(run, include_clock=True), VCD_OUTPUT_WITH_CLOCK)
+        self.assertEqual(self.write_vcd(run, pyrtl.FastSimulation), VCD_OUTPUT)
+
+    def test_many_steps_at_once(self):
+        def run(sim):
+            sim.step_multiple({'a': self.inputs})
+
+        def sim_run(sim):
+            sim.sim_run({'a': self.inputs[:2]})
+            sim.sim_run({'a': self.inputs[2:]})
+        for clock, expected in ((False, VCD_OUTPUT), (True, VCD_OUTPUT_WITH_CLOCK)):
+            self.assertEqual(self.write_vcd(run, include_clock=clock), expected)
+            self.assertEqual(self.write_vcd(sim_run, pyrtl.FastSimulation,
+                                            include_clock=clock), expected)
+
+    def test_compiled_simulation(self):
+        def run(sim):
+            sim.run([{'a': a} for a in self.inputs[:3]])
+            sim.step({'a': self.inputs[3]})
+            sim.run([{'a': self.inputs[4]}])
+        self.assertEqual(self.write_vcd(run, pyrtl.CompiledSimulation), VCD_OUTPUT)
+
+    def test_run_stream_callback(self):
+        sim = pyrtl.CompiledSimulation()
+        output = six.StringIO()
+        with pyrtl.VcdWriter(output, sim, include_clock=True) as writer:
+            sim.run_stream(({'a': a} for a in self.inputs), block_size=2,
+                           callback=writer.extend)
+        self.assertEqual(output.getvalue(), VCD_OUTPUT_WITH_CLOCK)
+        self.assertEqual(len(sim.tracer), 0)
+
+    def test_buffering(self):
+        sim = pyrtl.Simulation()
+        output = six.StringIO()
+        writer = pyrtl.VcdWriter(output, sim, buffer_size=1 << 20)
+        sim.step({'a': 1})
+        self.assertEqual(output.getvalue(), '')
+        writer.flush()
+        self.assertTrue(output.getvalue().endswith('$end\n'))
+        writer.close()
+        self.assertEqual(sim.tracer.sinks, [])
+        sim.step({'a': 1})  # no longer written
+        self.assertTrue(output.getvalue().endswith('#10\n'))
+
+        def run(sim):
+            for a in self.inputs:
+                sim.step({'a': a})
+        self.assertEqual(self.write_vcd(run, buffer_size=1), VCD_OUTPUT)
+
+    def test_file_name(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'waves.vcd')
+            sim = pyrtl.Simulation()
+            with pyrtl.VcdWriter(path, sim):
+                sim.step_multiple({'a': self.inputs})
+            with open(path) as f:
+                self.assertEqual(f.read(), VCD_OUTPUT)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_no_tracer(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.VcdWriter(six.StringIO(), pyrtl.Simulation(tracer=None))
+
+    def test_identifiers(self):
+        codes = [_identifier(i) for i in range(94 * 95)]
+        self.assertEqual(codes[:3], ['!', '"', '#'])
+        self.assertEqual(codes[93:96], ['~', '!!', '!"'])
+        self.assertEqual(len(set(codes)), len(codes))
+
+
+TESTBENCH_VCD = """$date today $end
+$version some simulator $end
+$timescale 1s $end
+$scope module tb $end
+$var wire 2 ! o [1:0] $end
+$var reg 2 " a [1:0] $end
+$var reg 1 # clk $end
+$scope module block $end
+$var wire 2 $ a [1:0] $end
+$var wire 2 ! o [1:0] $end
+$var reg 2 % r [1:0] $end
+$var wire 1 # clk $end
+$upscope $end
+$upscope $end
+$enddefinitions $end
+#0
+$dumpvars
+bx %
+b1 "
+b1 $
+bx !
+0#
+$end
+b0 %
+b0 !
+#5
+1#
+b1 %
+b1 !
+#10
+0#
+b10 "
+b10 $
+#15
+1#
+b11 %
+b11 !
+#20
+0#
+b0 "
+b0 $
+#25
+1#
+#30
+0#
+"""
+
+
+class TestInputFromVcd(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(8, 'r')
+        w = pyrtl.Register(100, 'w')
+        b = pyrtl.Output(1, 'b')
+        r.next <<= r + a
+        w.next <<= pyrtl.concat(r, w[8:])
+        b <<= r[0]
+        self.inputs = [0, 0, 3, 1, 0, 0, 15, 15, 2, 0, 0]
+
+    def check_trace(self, trace, expected):
+        self.assertEqual(sorted(trace.trace), sorted(expected.trace))
+        for name in expected.trace:
+            self.assertEqual(trace._wires[name].bitwidth, expected._wires[name].bitwidth)
+            self.assertEqual(trace.trace[name], expected.trace[name])
+
+    def test_round_trip(self):
+        for clock in (False, True):
+            sim = pyrtl.Simulation()
+            output = six.StringIO()
+            with pyrtl.VcdWriter(output, sim, include_clock=clock):
+                sim.step_multiple({'a': self.inputs})
+            self.check_trace(pyrtl.input_from_vcd(output.getvalue()), sim.tracer)
+
+            output = six.StringIO()
+            sim.tracer.print_vcd(output, include_clock=clock)
+            output.seek(0)
+            self.check_trace(pyrtl.input_from_vcd(output), sim.tracer)
+
+    def test_into_block(self):
+        sim = pyrtl.Simulation()
+        sim.step_multiple({'a': self.inputs})
+        output = six.StringIO()
+        sim.tracer.print_vcd(output)
+        trace = pyrtl.input_from_vcd(output.getvalue(), names=['a', 'r'],
+                                     block=pyrtl.working_block())
+        self.assertEqual(sorted(trace.trace), ['a', 'r'])
+        self.assertIs(trace._wires['r'], pyrtl.working_block().get_wirevector_by_name('r'))
+        self.assertEqual(trace.trace['r'], sim.tracer.trace['r'])
+
+    def test_testbench(self):
+        trace = pyrtl.input_from_vcd(TESTBENCH_VCD)
+        self.assertEqual(sorted(trace.trace), ['a', 'o', 'r'])
+        self.assertEqual(trace.trace['a'], [1, 2, 0])
+        self.assertEqual(trace.trace['o'], [0, 1, 3])
+        self.assertEqual(trace.trace['r'], [0, 1, 3])
+
+        trace = pyrtl.input_from_vcd(TESTBENCH_VCD, scope='tb')
+        self.assertEqual(sorted(trace.trace), ['a', 'o'])
+        trace = pyrtl.input_from_vcd(TESTBENCH_VCD, scope='tb.block', names=['r'])
+        self.assertEqual(list(trace.trace), ['r'])
+
+        trace = pyrtl.input_from_vcd(TESTBENCH_VCD, period=5)
+        self.assertEqual(trace.trace['r'], [0, 1, 1, 3, 3, 3])
+
+    def test_last_time(self):
+        vcd = TESTBENCH_VCD.replace('#25\n1#\n#30\n0#\n', '#30\nb1 "\n')
+        self.assertEqual(pyrtl.input_from_vcd(vcd).trace['a'], [1, 2, 0, 1])
+
+    def test_errors(self):
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_vcd(TESTBENCH_VCD, names=['nope'])
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_vcd(TESTBENCH_VCD, scope='nope')
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_vcd(TESTBENCH_VCD.replace('b10 "', 'r1.5 "'))
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_vcd(TESTBENCH_VCD.replace('b10 "', 'b12 "'))
+        with self.assertRaises(pyrtl.PyrtlError):
+            pyrtl.input_from_vcd(TESTBENCH_VCD[:100])
+
+
+if __name__ == '__main__':
+    unittest.main()
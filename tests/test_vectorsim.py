@@ -0,0 +1,136 @@
+import random
+import unittest
+import six
+
+import pyrtl
+
+try:
+    import numpy
+except ImportError:
+    raise unittest.SkipTest('VectorSimulation testing requires numpy')
+
+
+class TestVectorSimulation(unittest.TestCase):
+    def setUp(self):
+        pyrtl.reset_working_block()
+
+    def check_against_reference(self, inputs, wires, nsteps=8, lanes=13,
+                                register_value_map=None, memory_value_map=None):
+        """ Check each lane of a VectorSimulation against its own Simulation """
+        random.seed(0)
+        stimulus = {w.name: [[random.randrange(2 ** w.bitwidth) for j in range(lanes)]
+                             for i in range(nsteps)] for w in inputs}
+        vsim = pyrtl.VectorSimulation(lanes, register_value_map=register_value_map,
+                                      memory_value_map=memory_value_map)
+        sims = [pyrtl.Simulation(
+            tracer=None, register_value_map=register_value_map,
+            memory_value_map={m: dict(v) for m, v in (memory_value_map or {}).items()})
+            for lane in range(lanes)]
+        for i in range(nsteps):
+            vsim.step({name: vals[i] for name, vals in stimulus.items()})
+            for lane, sim in enumerate(sims):
+                sim.step({name: vals[i][lane] for name, vals in stimulus.items()})
+            for w in wires:
+                self.assertEqual(list(vsim.inspect(w.name)),
+                                 [sim.inspect(w.name) for sim in sims])
+        return vsim
+
+    def test_all_ops(self):
+        a, b = pyrtl.Input(6, 'a'), pyrtl.Input(6, 'b')
+        s = pyrtl.Input(1, 's')
+        outs = [pyrtl.Output(name='o%d' % i) for i in range(13)]
+        outs[0] <<= a + b
+        outs[1] <<= a - b
+        outs[2] <<= a * b
+        outs[3] <<= a & b
+        outs[4] <<= a | b
+        outs[5] <<= a ^ b
+        outs[6] <<= a.nand(b)
+        outs[7] <<= ~a
+        outs[8] <<= a < b
+        outs[9] <<= (a > b) | (a == b)
+        outs[10] <<= pyrtl.select(s, a, b)
+        outs[11] <<= pyrtl.concat(a[1:3], b, a[5])
+        outs[12] <<= pyrtl.concat(a[0], a[2], a[3], b[4:])
+        self.check_against_reference([a, b, s], outs)
+
+    def test_wide_wires(self):
+        a, b = pyrtl.Input(60, 'a'), pyrtl.Input(70, 'b')
+        o1, o2, o3 = pyrtl.Output(name='o1'), pyrtl.Output(name='o2'), pyrtl.Output(name='o3')
+        o1 <<= a * b
+        o2 <<= (b - a)[3:40]
+        o3 <<= pyrtl.concat(a, b) + 1
+        self.check_against_reference([a, b], [o1, o2, o3])
+
+    def test_registers(self):
+        a = pyrtl.Input(4, 'a')
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + a
+        self.check_against_reference([a], [r], register_value_map={r: 3})
+
+    def test_per_lane_register_values(self):
+        r = pyrtl.Register(8, 'r')
+        r.next <<= r + 1
+        sim = pyrtl.VectorSimulation(3, register_value_map={r: [0, 10, 255]})
+        sim.step({})
+        sim.step({})
+        self.assertEqual(list(sim.inspect('r')), [1, 11, 0])
+
+    def test_memory(self):
+        mem = pyrtl.MemBlock(8, 3, 'mem')
+        waddr, raddr = pyrtl.Input(3, 'waddr'), pyrtl.Input(3, 'raddr')
+        data, we = pyrtl.Input(8, 'data'), pyrtl.Input(1, 'we')
+        o = pyrtl.Output(8, 'o')
+        mem[waddr] <<= pyrtl.MemBlock.EnabledWrite(data, we)
+        o <<= mem[raddr]
+        sim = self.check_against_reference([waddr, raddr, data, we], [o], nsteps=20,
+                                           memory_value_map={mem: {0: 7, 5: 9}})
+        self.assertEqual(sim.inspect_mem(mem).shape, (13, 8))
+
+    def test_rom(self):
+        rom = pyrtl.RomBlock(4, 3, [3, 1, 4, 1, 5, 9, 2, 6])
+        a = pyrtl.Input(3, 'a')
+        o = pyrtl.Output(4, 'o')
+        o <<= rom[a]
+        self.check_against_reference([a], [o])
+
+    def test_step_multiple_reports_failing_lane(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(3, 'o')
+        o <<= a + 1
+        sim = pyrtl.VectorSimulation(3)
+        output = six.StringIO()
+        failed = sim.step_multiple({'a': [[0, 1, 2], 3]}, {'o': [[1, 2, 3], [4, 0, 4]]},
+                                   file=output)
+        self.assertEqual(failed, [(1, 1, 'o', 0, 4)])
+        self.assertIn('Unexpected output', output.getvalue())
+
+    def test_rtl_assert(self):
+        class BadValue(Exception):
+            pass
+        a = pyrtl.Input(2, 'a')
+        pyrtl.rtl_assert(a != 3, BadValue('a is 3'))
+        sim = pyrtl.VectorSimulation(2)
+        sim.step({'a': [1, 2]})
+        with self.assertRaises(BadValue):
+            sim.step({'a': [1, 3]})
+
+    def test_bad_inputs(self):
+        a = pyrtl.Input(2, 'a')
+        o = pyrtl.Output(2, 'o')
+        o <<= a
+        sim = pyrtl.VectorSimulation(2)
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.inspect('o')
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': [1]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': [1, 4]})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({'a': -1})
+        with self.assertRaises(pyrtl.PyrtlError):
+            sim.step({})
+
+
+if __name__ == "__main__":
+    unittest.main()